@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+from database import get_connection
+from cache import obtener_version_datos
+from metricas import ADMISION_ESPERA_SEGUNDOS, ADMISION_RECHAZOS
+
+# Consultas simultáneas contra el DWH por carril y espera máxima por un turno
+ADMISION_CONCURRENCIA = int(os.getenv("ADMISION_CONCURRENCIA", "6"))
+ADMISION_CONCURRENCIA_PESADA = int(os.getenv("ADMISION_CONCURRENCIA_PESADA", "2"))
+# Exportaciones masivas simultáneas (cada una retiene una conexión mientras dura)
+ADMISION_CONCURRENCIA_EXPORTACION = int(os.getenv("ADMISION_CONCURRENCIA_EXPORTACION", "2"))
+ADMISION_ESPERA_MAX_SEGUNDOS = float(os.getenv("ADMISION_ESPERA_MAX_SEGUNDOS", "10"))
+# Costo (días × hoteles) a partir del cual una consulta va al carril pesado
+ADMISION_COSTO_PESADO = int(os.getenv("ADMISION_COSTO_PESADO", "20000"))
+# Peticiones analíticas simultáneas por cliente (cabecera X-Cliente-Id o IP)
+ADMISION_POR_CLIENTE = int(os.getenv("ADMISION_POR_CLIENTE", "4"))
+# Plazo por defecto y máximo de cada petición; el cliente puede acortarlo con X-Plazo-Segundos
+ADMISION_PLAZO_SEGUNDOS = float(os.getenv("ADMISION_PLAZO_SEGUNDOS", "30"))
+
+# Cada cuánto se mira si el cliente cortó la conexión mientras se calcula
+INTERVALO_DESCONEXION_SEGUNDOS = 0.5
+
+
+class ConsultaRechazada(Exception):
+    """La consulta no se admitió o se abandonó; el mensaje llega al cliente como error GraphQL"""
+
+    def __init__(self, mensaje: str, motivo: str):
+        super().__init__(mensaje)
+        self.motivo = motivo
+
+
+class Carril:
+    """Cola acotada de consultas contra el DWH con su propio límite de concurrencia"""
+
+    def __init__(self, nombre: str, concurrencia: int):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self.en_curso = 0
+        self.en_espera = 0
+
+    @asynccontextmanager
+    async def turno(self):
+        inicio = time.perf_counter()
+        self.en_espera += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), ADMISION_ESPERA_MAX_SEGUNDOS)
+        except asyncio.TimeoutError:
+            ADMISION_RECHAZOS.inc("espera")
+            raise ConsultaRechazada(
+                f"Servicio saturado: sin turno en el carril {self.nombre} tras "
+                f"{ADMISION_ESPERA_MAX_SEGUNDOS:g}s, reintente más tarde", "espera") from None
+        finally:
+            self.en_espera -= 1
+            ADMISION_ESPERA_SEGUNDOS.observar(time.perf_counter() - inicio, self.nombre)
+
+        self.en_curso += 1
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+            self._semaforo.release()
+
+
+CARRILES = {
+    "normal": Carril("normal", ADMISION_CONCURRENCIA),
+    "pesado": Carril("pesado", ADMISION_CONCURRENCIA_PESADA),
+    "exportacion": Carril("exportacion", ADMISION_CONCURRENCIA_EXPORTACION),
+}
+
+_hoteles: Dict[str, Optional[int]] = {"version": None, "valor": 0}
+_por_cliente: Dict[str, int] = {}
+
+
+async def contar_hoteles() -> int:
+    """Hoteles del DWH (releído cuando el ETL publica una nueva versión de datos)"""
+    version = await obtener_version_datos()
+    if _hoteles["version"] != version:
+        async with get_connection(lectura=True) as conn:
+            _hoteles["valor"] = await conn.fetchval("SELECT COUNT(DISTINCT hotel_id_erp) FROM Dim_Hotel")
+        _hoteles["version"] = version
+    return _hoteles["valor"]
+
+
+async def estimar_costo(dias: int, hotel_ids_erp: Optional[Sequence[int]] = None) -> int:
+    """Costo de una consulta: días del periodo × hoteles que abarca (todos si no se filtra)"""
+    hoteles = len(hotel_ids_erp) if hotel_ids_erp else await contar_hoteles()
+    return max(dias, 0) * max(hoteles, 1)
+
+
+async def ejecutar(costo: int, calcular: Callable[[], Awaitable[Any]]) -> Any:
+    """Ejecuta el cálculo cuando hay turno en el carril que corresponde a su costo"""
+    carril = CARRILES["pesado" if costo >= ADMISION_COSTO_PESADO else "normal"]
+    async with carril.turno():
+        return await calcular()
+
+
+def identificar_cliente(request) -> str:
+    return request.headers.get("x-cliente-id") or (request.client.host if request.client else "desconocido")
+
+
+def plazo_peticion(request) -> float:
+    """Plazo pedido por el cliente, acotado al máximo configurado"""
+    try:
+        pedido = float(request.headers.get("x-plazo-segundos", ADMISION_PLAZO_SEGUNDOS))
+    except ValueError:
+        pedido = ADMISION_PLAZO_SEGUNDOS
+    return min(max(pedido, 0.0), ADMISION_PLAZO_SEGUNDOS)
+
+
+@asynccontextmanager
+async def limitar_cliente(cliente: str):
+    if _por_cliente.get(cliente, 0) >= ADMISION_POR_CLIENTE:
+        ADMISION_RECHAZOS.inc("cliente")
+        raise ConsultaRechazada(
+            f"Demasiadas consultas simultáneas para el cliente {cliente} "
+            f"(máximo {ADMISION_POR_CLIENTE})", "cliente")
+    _por_cliente[cliente] = _por_cliente.get(cliente, 0) + 1
+    try:
+        yield
+    finally:
+        _por_cliente[cliente] -= 1
+        if not _por_cliente[cliente]:
+            del _por_cliente[cliente]
+
+
+async def con_plazo(request, calcular: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Ejecuta una petición analítica con el límite de su cliente y su plazo.
+    Si vence el plazo o el cliente se desconecta se cancela el cálculo; la
+    cancelación llega hasta asyncpg, que cancela la consulta en Postgres
+    (salvo que otra petición siga esperando el mismo resultado del cache).
+    """
+    async with limitar_cliente(identificar_cliente(request)):
+        vence = time.monotonic() + plazo_peticion(request)
+        tarea = asyncio.ensure_future(calcular())
+        try:
+            while True:
+                restante = vence - time.monotonic()
+                if restante <= 0:
+                    ADMISION_RECHAZOS.inc("plazo")
+                    raise ConsultaRechazada("Plazo de la petición vencido, consulta cancelada", "plazo")
+                hechas, _ = await asyncio.wait({tarea}, timeout=min(restante, INTERVALO_DESCONEXION_SEGUNDOS))
+                if hechas:
+                    return tarea.result()
+                if await request.is_disconnected():
+                    ADMISION_RECHAZOS.inc("desconexion")
+                    raise ConsultaRechazada("Cliente desconectado, consulta cancelada", "desconexion")
+        finally:
+            if not tarea.done():
+                tarea.cancel()
+                await asyncio.gather(tarea, return_exceptions=True)
+
+
+def estadisticas_admision() -> Dict[str, Dict[str, int]]:
+    """Consultas en curso y en espera por carril, y clientes con peticiones abiertas"""
+    carriles = {
+        c.nombre: {"concurrencia": c.concurrencia, "en_curso": c.en_curso, "en_espera": c.en_espera}
+        for c in CARRILES.values()
+    }
+    return {"carriles": carriles, "clientes": dict(_por_cliente)}
@@ -0,0 +1,429 @@
+"""
+Prueba de carga de /graphql.
+
+Dispara una mezcla configurable de consultas hotelAnalytics (rangos cortos
+y largos, un hotel o todos) contra la API levantada en el mismo proceso o
+con uvicorn, con una cantidad fija de peticiones concurrentes o a una tasa
+fija, y escribe un JSON con throughput, percentiles de latencia, errores y
+la espera por conexiones del pool (leída de /metrics) para comparar antes y
+después de un cambio.
+
+Usa la base configurada en DWH_*. Con --sembrar además genera el ERP
+sintético de benchmark_etl.py a la escala pedida y reconstruye el DWH con
+el ETL completo, lo que BORRA el esquema public de ERP_DB y DWH_DB. Ejemplo:
+
+    ERP_DB=bench_erp DWH_DB=bench_dwh python benchmark_api.py --sembrar --escala 1 \\
+        --reiniciar-bases --concurrencia 32 --duracion 60 --salida carga.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+import benchmark_etl
+import etl
+
+CONSULTA_KPIS = """
+query Carga($fechaInicio: Date!, $fechaFin: Date!, $hotelIdErp: Int) {
+  hotelAnalytics(fechaInicio: $fechaInicio, fechaFin: $fechaFin, hotelIdErp: $hotelIdErp) {
+    hotelNombre
+    totalReservas
+    tasaOcupacion
+    adr
+    revpar
+    reservasPorCanal { canalNombre cantidadReservas ingresosTotales }
+    reservasPorEstado { estado cantidad }
+  }
+}
+"""
+
+# Tipo de consulta: (rango amplio, un solo hotel)
+TIPOS_CONSULTA = {
+    'estrecho_hotel': (False, True),
+    'estrecho_todos': (False, False),
+    'amplio_hotel': (True, True),
+    'amplio_todos': (True, False),
+}
+MEZCLA_POR_DEFECTO = "estrecho_hotel=4,estrecho_todos=2,amplio_hotel=1,amplio_todos=1"
+
+PERCENTILES = (50, 95, 99)
+
+# Histogramas de /metrics que se informan como diferencia entre el inicio y el fin de la medición
+HISTOGRAMAS_ESPERA = {
+    'pool_espera': 'bi_pool_espera_conexion_segundos',
+    'admision_espera': 'bi_admision_espera_segundos',
+}
+
+
+def parsear_mezcla(texto: str) -> Dict[str, float]:
+    """Convierte 'tipo=peso,tipo=peso' en {tipo: peso}"""
+    mezcla = {}
+    for par in (p for p in texto.split(",") if p.strip()):
+        tipo, _, peso = par.partition("=")
+        tipo = tipo.strip()
+        if tipo not in TIPOS_CONSULTA:
+            raise ValueError(f"Tipo de consulta desconocido '{tipo}' (tipos: {', '.join(TIPOS_CONSULTA)})")
+        mezcla[tipo] = float(peso or 1)
+    if not mezcla or sum(mezcla.values()) <= 0:
+        raise ValueError("La mezcla de consultas no tiene ningún peso positivo")
+    return mezcla
+
+
+class GeneradorConsultas:
+    """
+    Elige tipo de consulta, periodo y hotel con una semilla fija, así dos
+    corridas con la misma configuración envían la misma secuencia.
+    """
+
+    def __init__(self, mezcla: Dict[str, float], hoteles: List[int], desde: date, hasta: date,
+                 dias_estrecho: int, dias_amplio: int, semilla: int):
+        self.tipos = list(mezcla)
+        self.pesos = [mezcla[t] for t in self.tipos]
+        self.hoteles = hoteles
+        self.desde = desde
+        self.hasta = hasta
+        self.dias = {False: dias_estrecho, True: dias_amplio}
+        self.azar = random.Random(semilla)
+
+    def siguiente(self) -> Tuple[str, Dict[str, Any]]:
+        tipo = self.azar.choices(self.tipos, self.pesos)[0]
+        amplio, un_hotel = TIPOS_CONSULTA[tipo]
+        dias = min(self.dias[amplio], (self.hasta - self.desde).days + 1)
+        inicio = self.desde + timedelta(days=self.azar.randint(0, (self.hasta - self.desde).days + 1 - dias))
+        variables = {
+            "fechaInicio": inicio.isoformat(),
+            "fechaFin": (inicio + timedelta(days=dias - 1)).isoformat(),
+            "hotelIdErp": self.azar.choice(self.hoteles) if un_hotel else None,
+        }
+        return tipo, variables
+
+
+async def sembrar_dwh(escala: float, semilla: float, modo_carga: str, paralelismo: int) -> Dict[str, Any]:
+    """Genera el ERP sintético y reconstruye el DWH con el ETL completo"""
+    erp_conn = await etl.get_erp_connection()
+    dwh_conn = await etl.get_dwh_connection()
+    try:
+        print(f"Generando ERP sintético (escala {escala})...", file=sys.stderr)
+        await benchmark_etl.reiniciar_esquema(erp_conn, benchmark_etl.ESQUEMA_ERP)
+        erp = await benchmark_etl.generar_erp(erp_conn, escala, semilla)
+        print(f"✓ ERP generado en {erp['segundos_generacion']}s", file=sys.stderr)
+        await benchmark_etl.reiniciar_esquema(dwh_conn, benchmark_etl.ESQUEMA_DWH)
+    finally:
+        await erp_conn.close()
+        await dwh_conn.close()
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        await etl.run_etl(full=True, modo_carga=modo_carga, paralelismo=paralelismo)
+    return {"escala": escala, "semilla": semilla, "filas_erp": erp["filas"],
+            "segundos_etl": round(time.perf_counter() - inicio, 3)}
+
+
+async def datos_disponibles() -> Tuple[List[int], date, date]:
+    """Hoteles del DWH y primer y último día con ocupación, para armar los periodos"""
+    dwh_conn = await etl.get_dwh_connection()
+    try:
+        hoteles = [f['hotel_id_erp'] for f in
+                   await dwh_conn.fetch("SELECT DISTINCT hotel_id_erp FROM Dim_Hotel ORDER BY hotel_id_erp")]
+        rango = await dwh_conn.fetchrow("""
+            SELECT MIN(dt.fecha) AS desde, MAX(dt.fecha) AS hasta
+            FROM Fact_OcupacionDiaria o
+            JOIN Dim_Tiempo dt ON o.tiempo_id = dt.tiempo_id
+        """)
+    finally:
+        await dwh_conn.close()
+    if not hoteles or rango['desde'] is None:
+        raise RuntimeError("El DWH no tiene datos: cargarlo con el ETL o usar --sembrar")
+    return hoteles, rango['desde'], rango['hasta']
+
+
+@contextlib.asynccontextmanager
+async def cliente_en_proceso() -> AsyncIterator[httpx.AsyncClient]:
+    """La app de main.py en este mismo proceso, con su lifespan, sin pasar por la red"""
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as cliente:
+            yield cliente
+
+
+@contextlib.asynccontextmanager
+async def cliente_uvicorn(puerto: int, workers: int, timeout: float) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Levanta main:app con uvicorn en otro proceso y espera a /health. Con más
+    de un worker, /metrics y /cache son los del worker que atiende cada
+    lectura, no del total.
+    """
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=benchmark_etl.DIRECTORIO, stdout=sys.stderr
+    )
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", limits=limites,
+                                     timeout=timeout) as cliente:
+            limite = time.monotonic() + 60
+            while True:
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {proceso.returncode} al arrancar")
+                with contextlib.suppress(httpx.TransportError):
+                    if (await cliente.get("/health")).status_code == 200:
+                        break
+                if time.monotonic() > limite:
+                    raise RuntimeError("uvicorn no respondió /health en 60s")
+                await asyncio.sleep(0.2)
+            yield cliente
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def leer_histogramas(texto: str, nombre: str) -> Dict[str, Dict[str, float]]:
+    """Suma y cuenta de cada serie de un histograma de /metrics, por su conjunto de etiquetas"""
+    patron = re.compile(rf'^{nombre}_(sum|count)(?:\{{(.*)\}})? (\S+)$')
+    series: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for linea in texto.splitlines():
+        coincidencia = patron.match(linea)
+        if coincidencia:
+            campo, etiquetas, valor = coincidencia.groups()
+            etiqueta = ",".join(re.findall(r'="([^"]*)"', etiquetas or "")) or "total"
+            series[etiqueta][campo] = float(valor)
+    return series
+
+
+async def leer_metricas(cliente: httpx.AsyncClient) -> Dict[str, Any]:
+    texto = (await cliente.get("/metrics")).text
+    return {
+        "histogramas": {clave: leer_histogramas(texto, nombre) for clave, nombre in HISTOGRAMAS_ESPERA.items()},
+        "cache": (await cliente.get("/cache")).json(),
+    }
+
+
+def diferencia_esperas(antes: Dict[str, Dict[str, float]], despues: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    resultado = {}
+    for etiqueta, serie in despues.items():
+        previa = antes.get(etiqueta, {})
+        cuenta = serie.get("count", 0) - previa.get("count", 0)
+        suma = serie.get("sum", 0) - previa.get("sum", 0)
+        resultado[etiqueta] = {
+            "esperas": int(cuenta),
+            "segundos_total": round(suma, 4),
+            "media_ms": round(suma / cuenta * 1000, 3) if cuenta else 0.0,
+        }
+    return resultado
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not ordenados:
+        return 0.0
+    indice = max(0, min(len(ordenados) - 1, -(-len(ordenados) * p // 100) - 1))
+    return ordenados[int(indice)]
+
+
+def resumir(muestras: List[Tuple[str, float, Optional[str]]], segundos: float) -> Dict[str, Any]:
+    """Throughput, latencias (ms) y errores de un conjunto de muestras (tipo, latencia, error)"""
+    latencias = sorted(latencia for _, latencia, _ in muestras)
+    errores = Counter(error for *_, error in muestras if error)
+    fallidas = sum(errores.values())
+    return {
+        "peticiones": len(muestras),
+        "peticiones_por_segundo": round(len(muestras) / segundos, 2) if segundos > 0 else 0.0,
+        "exitosas_por_segundo": round((len(muestras) - fallidas) / segundos, 2) if segundos > 0 else 0.0,
+        "tasa_error": round(fallidas / len(muestras), 4) if muestras else 0.0,
+        "latencia_ms": {
+            **{f"p{p}": round(percentil(latencias, p) * 1000, 2) for p in PERCENTILES},
+            "media": round(sum(latencias) / len(latencias) * 1000, 2) if latencias else 0.0,
+            "max": round(latencias[-1] * 1000, 2) if latencias else 0.0,
+        },
+        "errores": dict(errores.most_common(10)),
+    }
+
+
+async def por_concurrencia(enviar: Callable[[int, float], Awaitable[None]], concurrencia: int, segundos: float):
+    """Lazo cerrado: cada trabajador envía la siguiente petición cuando recibe la respuesta"""
+    fin = time.perf_counter() + segundos
+
+    async def trabajador(i: int):
+        while time.perf_counter() < fin:
+            await enviar(i, time.perf_counter())
+
+    await asyncio.gather(*(trabajador(i) for i in range(concurrencia)))
+
+
+async def por_tasa(enviar: Callable[[int, float], Awaitable[None]], tasa: float, segundos: float):
+    """
+    Lazo abierto: una petición cada 1/tasa segundos, sin esperar a las
+    anteriores. La latencia se mide desde el momento programado, así una
+    API saturada no baja la carga ofrecida ni esconde la cola.
+    """
+    inicio = time.perf_counter()
+    tareas = set()
+    n = 0
+    while True:
+        programada = inicio + n / tasa
+        if programada >= inicio + segundos:
+            break
+        espera = programada - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        tarea = asyncio.ensure_future(enviar(n, programada))
+        tareas.add(tarea)
+        tarea.add_done_callback(tareas.discard)
+        n += 1
+    await asyncio.gather(*tareas)
+
+
+async def ejecutar_carga(args) -> Dict[str, Any]:
+    siembra = None
+    if args.sembrar:
+        siembra = await sembrar_dwh(args.escala, args.semilla, args.modo_carga, args.paralelismo)
+    hoteles, desde, hasta = await datos_disponibles()
+    generador = GeneradorConsultas(parsear_mezcla(args.mezcla), hoteles, desde, hasta,
+                                   args.dias_estrecho, args.dias_amplio, args.semilla_consultas)
+    clientes = args.clientes or (max(1, round(args.tasa)) if args.tasa else args.concurrencia)
+
+    if args.servidor == "uvicorn":
+        contexto = cliente_uvicorn(args.puerto, args.workers, args.timeout)
+    else:
+        contexto = cliente_en_proceso()
+
+    async with contexto as cliente:
+        muestras: List[Tuple[str, float, Optional[str]]] = []
+
+        async def enviar(i: int, inicio: float):
+            tipo, variables = generador.siguiente()
+            error = None
+            try:
+                respuesta = await cliente.post(
+                    "/graphql", json={"query": CONSULTA_KPIS, "variables": variables},
+                    # Un id por trabajador: el límite por cliente de la admisión no frena a toda la prueba
+                    headers={"X-Cliente-Id": f"carga-{i % clientes}"}, timeout=args.timeout)
+                if respuesta.status_code != 200:
+                    error = f"HTTP {respuesta.status_code}"
+                elif respuesta.json().get("errors"):
+                    error = respuesta.json()["errors"][0].get("message", "error GraphQL")
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            muestras.append((tipo, time.perf_counter() - inicio, error))
+
+        async def fase(segundos: float):
+            if args.tasa:
+                await por_tasa(enviar, args.tasa, segundos)
+            else:
+                await por_concurrencia(enviar, args.concurrencia, segundos)
+
+        if args.calentamiento > 0:
+            print(f"Calentando {args.calentamiento}s...", file=sys.stderr)
+            await fase(args.calentamiento)
+            muestras.clear()
+
+        print(f"Midiendo {args.duracion}s "
+              f"({f'{args.tasa} peticiones/s' if args.tasa else f'concurrencia {args.concurrencia}'})...",
+              file=sys.stderr)
+        metricas_antes = await leer_metricas(cliente)
+        inicio = time.perf_counter()
+        await fase(args.duracion)
+        segundos = time.perf_counter() - inicio
+        metricas_despues = await leer_metricas(cliente)
+
+    por_tipo = defaultdict(list)
+    for muestra in muestras:
+        por_tipo[muestra[0]].append(muestra)
+    cache_antes, cache_despues = metricas_antes["cache"], metricas_despues["cache"]
+
+    return {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": benchmark_etl.commit_actual(),
+        "configuracion": {
+            "servidor": args.servidor,
+            "workers": args.workers if args.servidor == "uvicorn" else 1,
+            "concurrencia": None if args.tasa else args.concurrencia,
+            "tasa": args.tasa or None,
+            "clientes": clientes,
+            "duracion": args.duracion,
+            "calentamiento": args.calentamiento,
+            "mezcla": parsear_mezcla(args.mezcla),
+            "dias_estrecho": args.dias_estrecho,
+            "dias_amplio": args.dias_amplio,
+            "semilla_consultas": args.semilla_consultas,
+        },
+        "datos": {"siembra": siembra, "hoteles": len(hoteles),
+                  "desde": desde.isoformat(), "hasta": hasta.isoformat()},
+        "resultados": {
+            "total": resumir(muestras, segundos),
+            "por_tipo": {tipo: resumir(m, segundos) for tipo, m in sorted(por_tipo.items())},
+        },
+        **{clave: diferencia_esperas(metricas_antes["histogramas"][clave], metricas_despues["histogramas"][clave])
+           for clave in HISTOGRAMAS_ESPERA},
+        "cache": {clave: cache_despues[clave] - cache_antes[clave]
+                  for clave in ("aciertos", "fallos", "coalescidas", "desalojos")},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de hotelAnalytics sobre /graphql")
+    carga = parser.add_mutually_exclusive_group()
+    carga.add_argument("--concurrencia", type=int, default=16,
+                       help="Peticiones en vuelo a la vez, en lazo cerrado (por defecto 16)")
+    carga.add_argument("--tasa", type=float,
+                       help="Peticiones por segundo en lazo abierto, en lugar de --concurrencia")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos de medición (por defecto 30)")
+    parser.add_argument("--calentamiento", type=float, default=5.0,
+                        help="Segundos de carga previa que no se miden (por defecto 5)")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO,
+                        help=f"Pesos por tipo de consulta (por defecto {MEZCLA_POR_DEFECTO})")
+    parser.add_argument("--dias-estrecho", type=int, default=7, help="Días de los rangos estrechos (por defecto 7)")
+    parser.add_argument("--dias-amplio", type=int, default=365, help="Días de los rangos amplios (por defecto 365)")
+    parser.add_argument("--semilla-consultas", type=int, default=42,
+                        help="Semilla de la secuencia de consultas (por defecto 42)")
+    parser.add_argument("--clientes", type=int,
+                        help="Valores distintos de X-Cliente-Id (por defecto uno por petición concurrente)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout de cada petición en segundos")
+    parser.add_argument("--servidor", choices=("proceso", "uvicorn"), default="proceso",
+                        help="App en este proceso (ASGI, sin red) o uvicorn en otro proceso")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn")
+    parser.add_argument("--sembrar", action="store_true",
+                        help="Genera el ERP sintético y reconstruye el DWH antes de medir")
+    parser.add_argument("--escala", type=float, default=1.0, help="Escala del ERP sintético con --sembrar")
+    parser.add_argument("--semilla", type=float, default=0.42, help="Semilla de setseed() del ERP sintético")
+    parser.add_argument("--modo-carga", choices=etl.MODOS_CARGA, default=etl.MODO_CARGA)
+    parser.add_argument("--paralelismo", type=int, default=etl.PARALELISMO)
+    parser.add_argument("--reiniciar-bases", action="store_true",
+                        help="Confirma que --sembrar puede borrar los esquemas de ERP_DB y DWH_DB")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto stdout)")
+    args = parser.parse_args()
+
+    if args.sembrar and not args.reiniciar_bases:
+        parser.error(f"--sembrar borra el esquema public de ERP_DB={etl.ERP_DB} y DWH_DB={etl.DWH_DB}; "
+                     "usar bases de prueba y pasar --reiniciar-bases para confirmar")
+    if args.tasa is not None and args.tasa <= 0:
+        parser.error("--tasa debe ser positiva")
+    try:
+        parsear_mezcla(args.mezcla)
+    except ValueError as e:
+        parser.error(str(e))
+
+    resultado = asyncio.run(ejecutar_carga(args))
+    salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(salida + "\n", encoding="utf-8")
+        print(f"✓ Resultados en {args.salida}", file=sys.stderr)
+    else:
+        print(salida)
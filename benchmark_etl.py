@@ -0,0 +1,349 @@
+"""
+Benchmark reproducible del ETL.
+
+Genera un ERP sintético siguiendo database-tables.sql a una escala dada,
+reconstruye el DWH desde dwh_schema.sql, ejecuta run_etl completo y escribe
+un JSON con la duración y filas/segundo de cada etapa, el pico de memoria
+del proceso y el tamaño de tablas e índices del DWH, para comparar
+ejecuciones entre commits.
+
+Usa las bases configuradas en ERP_* y DWH_* y BORRA su esquema public:
+apuntarlas a bases de prueba. Ejemplo:
+
+    ERP_DB=bench_erp DWH_DB=bench_dwh python benchmark_etl.py --escala 2 \\
+        --reiniciar-bases --salida bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict
+
+import etl
+
+DIRECTORIO = Path(__file__).resolve().parent
+ESQUEMA_ERP = DIRECTORIO / "database-tables.sql"
+ESQUEMA_DWH = DIRECTORIO / "dwh_schema.sql"
+
+# Tamaño del ERP con escala 1; todo crece linealmente con la escala
+HOTELES_POR_ESCALA = 10
+HUESPEDES_POR_ESCALA = 20000
+RESERVAS_POR_ESCALA = 100000
+
+# Tabla del DWH que llena cada etapa, para calcular filas/segundo
+TABLA_POR_ETAPA = {
+    'dim_tiempo': 'dim_tiempo',
+    'dim_hotel': 'dim_hotel',
+    'dim_tipo_habitacion': 'dim_tipohabitacion',
+    'dim_huesped': 'dim_huesped',
+    'dim_servicio': 'dim_servicio',
+    'fact_reservas': 'fact_reservas',
+}
+
+TABLAS_ERP = [
+    'hoteles', 'tiposhabitacion', 'serviciosadicionales', 'habitaciones', 'huespedes',
+    'reservas', 'pagos', 'consumosservicios', 'reviews', 'cambiosetl'
+]
+
+# (sentencia, parámetros que recibe). Los valores aleatorios salen de
+# random() con semilla fija (setseed) y las asignaciones por fila de hashes
+# del id, así dos corridas con la misma escala y semilla generan los mismos
+# datos.
+GENERADOR_ERP = [
+    ("""
+    INSERT INTO Hoteles (nombre, direccion, ciudad, pais, categoria_estrellas, numero_habitaciones_total)
+    SELECT
+        'Hotel ' || i,
+        'Calle ' || (1 + floor(random() * 900))::int || ' #' || i,
+        (ARRAY['La Paz', 'Santa Cruz', 'Cochabamba', 'Sucre', 'Tarija', 'Potosí'])[1 + floor(random() * 6)::int],
+        'Bolivia',
+        1 + floor(random() * 5)::int,
+        0
+    FROM generate_series(1, $1::int) i
+    """, ('hoteles',)),
+    ("""
+    INSERT INTO TiposHabitacion (hotel_id, nombre_tipo, descripcion, capacidad_maxima, precio_base_noche)
+    SELECT h.hotel_id, t.nombre, 'Habitación ' || lower(t.nombre), t.capacidad,
+           round((t.precio * (0.7 + random() * 0.8))::numeric, 2)
+    FROM Hoteles h
+    CROSS JOIN (VALUES ('Simple', 1, 60), ('Doble', 2, 90), ('Familiar', 4, 140), ('Suite', 2, 250))
+        AS t(nombre, capacidad, precio)
+    ORDER BY h.hotel_id, t.precio
+    """, ()),
+    ("""
+    INSERT INTO ServiciosAdicionales (hotel_id, nombre_servicio, precio)
+    SELECT h.hotel_id, s.nombre, round((s.precio * (0.8 + random() * 0.4))::numeric, 2)
+    FROM Hoteles h
+    CROSS JOIN (VALUES ('Desayuno', 12), ('Spa', 45), ('Lavandería', 10), ('Bar', 20), ('Traslado', 30))
+        AS s(nombre, precio)
+    ORDER BY h.hotel_id, s.nombre
+    """, ()),
+    ("""
+    INSERT INTO Habitaciones (hotel_id, tipo_habitacion_id, numero_habitacion)
+    SELECT t.hotel_id, t.tipo_habitacion_id, t.tipo_habitacion_id || '-' || n
+    FROM TiposHabitacion t
+    CROSS JOIN LATERAL generate_series(1, 10 + (t.tipo_habitacion_id * 7919) % 50) n
+    ORDER BY t.tipo_habitacion_id, n
+    """, ()),
+    ("""
+    UPDATE Hoteles h
+    SET numero_habitaciones_total = c.total
+    FROM (SELECT hotel_id, COUNT(*) AS total FROM Habitaciones GROUP BY hotel_id) c
+    WHERE h.hotel_id = c.hotel_id
+    """, ()),
+    ("""
+    INSERT INTO Huespedes (nombre, apellido, email, telefono, fecha_nacimiento, pais_origen)
+    SELECT
+        'Nombre' || i,
+        'Apellido' || (1 + floor(random() * 5000))::int,
+        'huesped' || i || '@example.com',
+        '+591 7' || lpad((floor(random() * 10000000))::int::text, 7, '0'),
+        DATE '1950-01-01' + floor(random() * 20000)::int,
+        (ARRAY['Bolivia', 'Argentina', 'Perú', 'Chile', 'Brasil', 'España', 'Estados Unidos'])[1 + floor(random() * 7)::int]
+    FROM generate_series(1, $1::int) i
+    """, ('huespedes',)),
+    ("""
+    INSERT INTO Reservas (
+        huesped_id, hotel_id, tipo_habitacion_id, fecha_checkin, fecha_checkout,
+        numero_adultos, numero_ninos, estado_reserva, fecha_creacion_reserva,
+        canal_reserva, precio_total_noche, monto_total_reserva
+    )
+    SELECT
+        r.huesped_id, t.hotel_id, t.tipo_habitacion_id, r.checkin, r.checkin + r.noches,
+        1 + (r.i % t.capacidad_maxima), r.i % 3 % 2,
+        CASE
+            WHEN r.u < 0.55 THEN 'checkout'
+            WHEN r.u < 0.70 THEN 'confirmada'
+            WHEN r.u < 0.78 THEN 'checkin'
+            WHEN r.u < 0.88 THEN 'cancelada'
+            WHEN r.u < 0.95 THEN 'pendiente'
+            ELSE 'no-show'
+        END::estado_reserva_enum,
+        r.checkin - (r.anticipacion) * INTERVAL '1 day',
+        (ARRAY['web_directa', 'booking_com', 'expedia', 'telefono', 'agencia'])[1 + r.i % 5]::canal_reserva_enum,
+        round(t.precio_base_noche * r.factor, 2),
+        round(t.precio_base_noche * r.factor, 2) * r.noches
+    FROM (
+        SELECT
+            i,
+            1 + floor(random() * $1::int)::bigint AS huesped_id,
+            1 + floor(random() * (SELECT COUNT(*) FROM TiposHabitacion))::bigint AS tipo_habitacion_id,
+            DATE '2022-01-01' + floor(random() * 1461)::int AS checkin,
+            1 + floor(random() * random() * 10)::int AS noches,
+            floor(random() * 120)::int AS anticipacion,
+            (0.8 + random() * 0.4)::numeric AS factor,
+            random() AS u
+        FROM generate_series(1, $2::int) i
+    ) r
+    JOIN TiposHabitacion t ON t.tipo_habitacion_id = r.tipo_habitacion_id
+    ORDER BY r.i
+    """, ('huespedes', 'reservas')),
+    ("""
+    INSERT INTO Pagos (reserva_id, monto, fecha_pago, metodo_pago, estado_pago)
+    SELECT
+        r.reserva_id,
+        round(r.monto_total_reserva / (1 + r.reserva_id % 3), 2),
+        r.fecha_creacion_reserva + (k) * INTERVAL '1 day',
+        (ARRAY['tarjeta_credito', 'transferencia', 'efectivo'])[1 + (r.reserva_id + k) % 3]::metodo_pago_enum,
+        CASE WHEN random() < 0.9 THEN 'completado' WHEN random() < 0.5 THEN 'pendiente' ELSE 'fallido' END::estado_pago_enum
+    FROM Reservas r
+    CROSS JOIN LATERAL generate_series(1, 1 + r.reserva_id % 3) k
+    WHERE r.estado_reserva NOT IN ('cancelada', 'no-show')
+    ORDER BY r.reserva_id, k
+    """, ()),
+    ("""
+    INSERT INTO ConsumosServicios (reserva_id, servicio_id, cantidad, precio_total_consumo, fecha_consumo)
+    SELECT
+        r.reserva_id,
+        s.servicio_id,
+        1 + k % 2,
+        s.precio * (1 + k % 2),
+        r.fecha_checkin + (k % (r.fecha_checkout - r.fecha_checkin)) * INTERVAL '1 day'
+    FROM Reservas r
+    CROSS JOIN LATERAL generate_series(1, 1 + r.reserva_id % 3) k
+    JOIN ServiciosAdicionales s ON s.servicio_id = (r.hotel_id - 1) * 5 + 1 + (r.reserva_id + k) % 5
+    WHERE r.estado_reserva IN ('checkin', 'checkout') AND r.reserva_id % 5 < 2
+    ORDER BY r.reserva_id, k
+    """, ()),
+    ("""
+    INSERT INTO reviews (reserva_id, huesped_id, hotel_id, rating, title, review_text, language, fecha_review, label_text)
+    SELECT
+        r.reserva_id, r.huesped_id, r.hotel_id, r.rating,
+        'Estadía en hotel ' || r.hotel_id,
+        'Reseña generada para la reserva ' || r.reserva_id,
+        (ARRAY['es', 'en', 'pt'])[1 + r.reserva_id % 3],
+        r.fecha_checkout + ((r.reserva_id % 14)::int) * INTERVAL '1 day',
+        CASE WHEN r.rating >= 4 THEN 'positivo' WHEN r.rating = 3 THEN 'neutral' ELSE 'negativo' END
+    FROM (
+        SELECT *, 1 + floor(random() * 5)::int AS rating
+        FROM Reservas
+        WHERE estado_reserva = 'checkout' AND reserva_id % 10 < 3
+        ORDER BY reserva_id
+    ) r
+    ORDER BY r.reserva_id
+    """, ()),
+]
+
+
+async def reiniciar_esquema(conn, archivo: Path):
+    """Borra el esquema public y lo recrea desde un archivo SQL"""
+    await conn.execute("DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public")
+    await conn.execute(archivo.read_text(encoding="utf-8"))
+
+
+async def contar_filas(conn, tablas) -> Dict[str, int]:
+    return {tabla: await conn.fetchval(f"SELECT COUNT(*) FROM {tabla}") for tabla in tablas}
+
+
+async def generar_erp(erp_conn, escala: float, semilla: float) -> Dict[str, Any]:
+    """Llena el ERP sintético; devuelve filas por tabla y segundos de generación"""
+    parametros = {
+        'hoteles': max(1, round(HOTELES_POR_ESCALA * escala)),
+        'huespedes': max(1, round(HUESPEDES_POR_ESCALA * escala)),
+        'reservas': max(1, round(RESERVAS_POR_ESCALA * escala)),
+    }
+    inicio = time.perf_counter()
+    # Sin workers paralelos el orden de evaluación de random() es siempre el mismo
+    await erp_conn.execute("SET max_parallel_workers_per_gather = 0")
+    await erp_conn.execute("SELECT setseed($1)", semilla)
+    for sentencia, nombres in GENERADOR_ERP:
+        await erp_conn.execute(sentencia, *(parametros[n] for n in nombres))
+    await erp_conn.execute("ANALYZE")
+    return {
+        "segundos_generacion": round(time.perf_counter() - inicio, 3),
+        "filas": await contar_filas(erp_conn, TABLAS_ERP),
+    }
+
+
+async def tamanos_dwh(dwh_conn) -> Dict[str, Dict[str, int]]:
+    """Filas y bytes de datos e índices por tabla del DWH, sumando sus particiones"""
+    filas = await dwh_conn.fetch("""
+        SELECT
+            c.relname AS tabla,
+            SUM(pg_table_size(COALESCE(p.relid, c.oid))) AS tabla_bytes,
+            SUM(pg_indexes_size(COALESCE(p.relid, c.oid))) AS indices_bytes,
+            COUNT(*) FILTER (WHERE p.isleaf) AS particiones
+        FROM pg_class c
+        LEFT JOIN LATERAL pg_partition_tree(c.oid) p ON c.relkind = 'p'
+        WHERE c.relnamespace = 'public'::regnamespace
+          AND c.relkind IN ('r', 'p')
+          AND NOT c.relispartition
+        GROUP BY c.relname
+        ORDER BY c.relname
+    """)
+    tamanos = {}
+    for fila in filas:
+        tamanos[fila['tabla']] = {
+            "filas": await dwh_conn.fetchval(f'SELECT COUNT(*) FROM "{fila["tabla"]}"'),
+            "tabla_bytes": int(fila['tabla_bytes']),
+            "indices_bytes": int(fila['indices_bytes']),
+            "total_bytes": int(fila['tabla_bytes'] + fila['indices_bytes']),
+            "particiones": fila['particiones'],
+        }
+    return tamanos
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=DIRECTORIO,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rss_maximo_bytes() -> int:
+    """Pico de memoria residente del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+async def ejecutar_benchmark(escala: float, semilla: float, modo_carga: str, paralelismo: int) -> Dict[str, Any]:
+    """Genera el ERP, reconstruye el DWH, corre el ETL completo y mide"""
+    erp_conn = await etl.get_erp_connection()
+    dwh_conn = await etl.get_dwh_connection()
+    try:
+        print(f"Generando ERP sintético (escala {escala})...", file=sys.stderr)
+        await reiniciar_esquema(erp_conn, ESQUEMA_ERP)
+        erp = await generar_erp(erp_conn, escala, semilla)
+        print(f"✓ ERP generado en {erp['segundos_generacion']}s: {erp['filas']}", file=sys.stderr)
+
+        await reiniciar_esquema(dwh_conn, ESQUEMA_DWH)
+        version_postgres = await dwh_conn.fetchval("SHOW server_version")
+
+        # La salida del ETL va a stderr para que stdout quede solo con el JSON
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            duraciones = await etl.run_etl(full=True, modo_carga=modo_carga, paralelismo=paralelismo)
+        segundos_total = time.perf_counter() - inicio
+
+        tablas = await tamanos_dwh(dwh_conn)
+    finally:
+        await erp_conn.close()
+        await dwh_conn.close()
+
+    etapas = {}
+    for nombre, segundos in duraciones.items():
+        filas = tablas.get(TABLA_POR_ETAPA.get(nombre), {}).get("filas")
+        etapas[nombre] = {
+            "segundos": round(segundos, 3),
+            "filas": filas,
+            "filas_por_segundo": round(filas / segundos, 1) if filas is not None and segundos > 0 else None,
+        }
+
+    return {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "postgres": version_postgres,
+        "configuracion": {
+            "escala": escala,
+            "semilla": semilla,
+            "modo_carga": modo_carga,
+            "paralelismo": paralelismo,
+            "tamano_lote": etl.TAMANO_LOTE,
+            "lotes_en_cola": etl.LOTES_EN_COLA,
+        },
+        "erp": erp,
+        "etl": {
+            "segundos_total": round(segundos_total, 3),
+            "etapas": etapas,
+            "rss_maximo_bytes": rss_maximo_bytes(),
+        },
+        "dwh": tablas,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del ETL sobre un ERP sintético")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help=f"Factor de escala: {RESERVAS_POR_ESCALA} reservas, {HUESPEDES_POR_ESCALA} huéspedes "
+                             f"y {HOTELES_POR_ESCALA} hoteles por unidad (por defecto 1)")
+    parser.add_argument("--semilla", type=float, default=0.42,
+                        help="Semilla de setseed() entre -1 y 1 (por defecto 0.42)")
+    parser.add_argument("--modo-carga", choices=etl.MODOS_CARGA, default=etl.MODO_CARGA)
+    parser.add_argument("--paralelismo", type=int, default=etl.PARALELISMO)
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto stdout)")
+    parser.add_argument("--reiniciar-bases", action="store_true",
+                        help="Confirma que se pueden borrar los esquemas de ERP_DB y DWH_DB")
+    args = parser.parse_args()
+
+    if not args.reiniciar_bases:
+        parser.error(f"el benchmark borra el esquema public de ERP_DB={etl.ERP_DB} y DWH_DB={etl.DWH_DB}; "
+                     "usar bases de prueba y pasar --reiniciar-bases para confirmar")
+
+    resultado = asyncio.run(ejecutar_benchmark(args.escala, args.semilla, args.modo_carga, args.paralelismo))
+    salida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(salida + "\n", encoding="utf-8")
+        print(f"✓ Resultados en {args.salida}", file=sys.stderr)
+    else:
+        print(salida)
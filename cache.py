@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from database import exigir_version, get_connection
+from metricas import SQL_CONSULTA_SEGUNDOS, medir
+
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "1000"))
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", "3600"))
+# Cada cuánto se vuelve a leer ETL_Version del DWH
+CACHE_VERSION_TTL_SEGUNDOS = float(os.getenv("CACHE_VERSION_TTL_SEGUNDOS", "5"))
+
+
+class CacheResultados:
+    """
+    Cache LRU con TTL para resultados de consultas analíticas.
+
+    Las claves deben incluir la versión de datos del DWH, así un ETL nuevo
+    invalida todo sin borrar nada explícitamente. Los fallos concurrentes
+    sobre la misma clave comparten un único cálculo en vuelo.
+    """
+
+    def __init__(self, max_entradas: int = CACHE_MAX_ENTRADAS, ttl_segundos: float = CACHE_TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._en_vuelo: Dict[Hashable, asyncio.Future] = {}
+        self._esperando: Dict[Hashable, int] = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.desalojos = 0
+        self.expiradas = 0
+
+    async def obtener(self, clave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """Devuelve el valor cacheado o lo calcula una sola vez para todos los que esperan"""
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            expira, valor = entrada
+            if expira > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return valor
+            del self._entradas[clave]
+            self.expiradas += 1
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.fallos += 1
+            tarea = asyncio.ensure_future(calcular())
+            self._en_vuelo[clave] = tarea
+            self._esperando[clave] = 0
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        else:
+            self.coalescidas += 1
+
+        # shield: si un cliente abandona no se cancela el cálculo compartido,
+        # salvo que fuera el último que lo esperaba (así se cancela la consulta SQL)
+        self._esperando[clave] += 1
+        try:
+            return await asyncio.shield(tarea)
+        except asyncio.CancelledError:
+            if self._en_vuelo.get(clave) is tarea and self._esperando[clave] == 1 and not tarea.done():
+                # Se retira ya para que una petición nueva no espere un cálculo cancelado
+                self._en_vuelo.pop(clave)
+                self._esperando.pop(clave)
+                tarea.cancel()
+            raise
+        finally:
+            if self._en_vuelo.get(clave) is tarea:
+                self._esperando[clave] -= 1
+
+    def _terminar(self, clave: Hashable, tarea: asyncio.Future):
+        if self._en_vuelo.get(clave) is tarea:
+            self._en_vuelo.pop(clave)
+            self._esperando.pop(clave)
+        if tarea.cancelled() or tarea.exception() is not None:
+            return
+        self._entradas[clave] = (time.monotonic() + self.ttl_segundos, tarea.result())
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojos += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos + self.fallos + self.coalescidas
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "en_vuelo": len(self._en_vuelo),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "coalescidas": self.coalescidas,
+            "desalojos": self.desalojos,
+            "expiradas": self.expiradas,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+            "version_datos": _version["valor"],
+        }
+
+
+VERSION_QUERY = "SELECT version FROM ETL_Version WHERE id = 1"
+
+_version: Dict[str, Optional[float]] = {"valor": None, "expira": 0.0}
+_version_lock = asyncio.Lock()
+
+
+async def obtener_version_datos() -> int:
+    """
+    Versión de datos del DWH que el ETL incrementa al terminar con éxito. Se
+    lee del primario: las réplicas que aún no la tienen dejan de recibir
+    lecturas, así no se cachean datos viejos bajo una versión nueva.
+    """
+    if _version["valor"] is not None and _version["expira"] > time.monotonic():
+        return _version["valor"]
+
+    async with _version_lock:
+        if _version["valor"] is None or _version["expira"] <= time.monotonic():
+            async with get_connection() as conn:
+                with medir(SQL_CONSULTA_SEGUNDOS, 'version_datos'):
+                    valor = await conn.fetchval(VERSION_QUERY)
+            _version["valor"] = valor or 0
+            exigir_version(_version["valor"])
+            _version["expira"] = time.monotonic() + CACHE_VERSION_TTL_SEGUNDOS
+    return _version["valor"]
+
+
+def fijar_version_datos(version: int):
+    """
+    Adopta una versión de datos avisada por el ETL sin esperar a que venza
+    CACHE_VERSION_TTL_SEGUNDOS, así el aviso no recalcula con la anterior.
+    """
+    if _version["valor"] is None or version > _version["valor"]:
+        _version["valor"] = version
+        exigir_version(version)
+    _version["expira"] = time.monotonic() + CACHE_VERSION_TTL_SEGUNDOS
+
+
+cache_kpis = CacheResultados()
@@ -0,0 +1,101 @@
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import List, Optional, Tuple
+from database import get_connection
+from cache import obtener_version_datos
+from metricas import SQL_CONSULTA_SEGUNDOS, medir
+
+
+class Calendario:
+    """
+    Copia compacta de Dim_Tiempo (fecha <-> tiempo_id) en memoria.
+
+    Las fechas se guardan como ordinales en un array ordenado y los
+    tiempo_id en un array paralelo. Si los tiempo_id son consecutivos en el
+    mismo orden que las fechas (el caso normal, ver populate_dim_tiempo), un
+    rango de fechas se traduce a un rango de tiempo_id.
+    """
+
+    def __init__(self, fechas: array, ids: array, version: int):
+        self.fechas = fechas
+        self.ids = ids
+        self.version = version
+        self.contiguo = all(
+            self.fechas[i] - self.fechas[0] == i and self.ids[i] - self.ids[0] == i
+            for i in range(len(self.fechas))
+        )
+
+    def tiempo_id(self, fecha: date) -> Optional[int]:
+        i = bisect_left(self.fechas, fecha.toordinal())
+        if i < len(self.fechas) and self.fechas[i] == fecha.toordinal():
+            return self.ids[i]
+        return None
+
+    def fecha(self, tiempo_id: int) -> Optional[date]:
+        if self.contiguo and self.ids:
+            i = tiempo_id - self.ids[0]
+            return date.fromordinal(self.fechas[i]) if 0 <= i < len(self.ids) else None
+        try:
+            return date.fromordinal(self.fechas[self.ids.index(tiempo_id)])
+        except ValueError:
+            return None
+
+    def rango_ids(self, desde: date, hasta: date) -> Optional[Tuple[int, int]]:
+        """
+        Rango [primer, último] de tiempo_id para las fechas entre desde y
+        hasta (inclusive). Devuelve None si el calendario no es contiguo;
+        si no hay fechas en el rango devuelve un rango vacío (1, 0).
+        """
+        if not self.contiguo:
+            return None
+        i = bisect_left(self.fechas, desde.toordinal())
+        j = bisect_right(self.fechas, hasta.toordinal()) - 1
+        if i > j:
+            return (1, 0)
+        return (self.ids[i], self.ids[j])
+
+
+_calendario: Optional[Calendario] = None
+_calendario_lock = asyncio.Lock()
+
+
+async def cargar_calendario(version: int) -> Calendario:
+    """Lee Dim_Tiempo completa del DWH"""
+    async with get_connection(lectura=True) as conn:
+        with medir(SQL_CONSULTA_SEGUNDOS, 'calendario'):
+            rows = await conn.fetch("SELECT tiempo_id, fecha FROM Dim_Tiempo ORDER BY fecha")
+    fechas = array('l', (row['fecha'].toordinal() for row in rows))
+    ids = array('q', (row['tiempo_id'] for row in rows))
+    return Calendario(fechas, ids, version)
+
+
+async def obtener_calendario() -> Calendario:
+    """Calendario vigente; se recarga cuando el ETL publica una nueva versión de datos"""
+    global _calendario
+    version = await obtener_version_datos()
+    if _calendario is not None and _calendario.version == version:
+        return _calendario
+
+    async with _calendario_lock:
+        if _calendario is None or _calendario.version != version:
+            _calendario = await cargar_calendario(version)
+            if not _calendario.contiguo:
+                print("⚠ Dim_Tiempo no tiene tiempo_id consecutivos: se filtrará por fecha")
+    return _calendario
+
+
+async def parametros_periodo(fecha_inicio: date, fecha_fin: date,
+                             hotel_id_erp: Optional[int] = None) -> Tuple[bool, List]:
+    """
+    (por_tiempo_id, params) de las consultas que filtran por periodo y hotel:
+    el rango de tiempo_id si el calendario es contiguo o las fechas si no,
+    seguidos del hotel cuando se pide uno.
+    """
+    calendario = await obtener_calendario()
+    rango_ids = calendario.rango_ids(fecha_inicio, fecha_fin)
+    params = list(rango_ids) if rango_ids else [fecha_inicio, fecha_fin]
+    if hotel_id_erp:
+        params.append(hotel_id_erp)
+    return rango_ids is not None, params
@@ -0,0 +1,220 @@
+import asyncio
+import os
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from database import get_connection
+from cache import obtener_version_datos
+from metricas import SQL_CONSULTA_SEGUNDOS, medir
+
+# Motor de hotelAnalytics: "sql" consulta Fact_OcupacionDiaria en el DWH;
+# "memoria" la responde con la copia columnar de este módulo
+KPIS_MOTOR = os.getenv("KPIS_MOTOR", "sql")
+KPIS_MOTORES = ("sql", "memoria")
+
+# Estados que cuentan como ocupación (los mismos que filtra la consulta de KPIs)
+ESTADOS_OCUPACION = ['confirmada', 'checkin', 'checkout']
+
+COLUMNAS = {
+    "fecha": np.int32,
+    "hotel_key": np.int64,
+    "canal_key": np.int64,
+    "estado": np.int8,
+    "noches": np.int32,
+    "ingresos": np.int64,
+    "llegadas": np.int32,
+}
+
+# Fecha como ordinal de Python (date.toordinal), estado como su posición en
+# ESTADOS_OCUPACION e ingresos en diezmilésimas: Fact_OcupacionDiaria los
+# guarda como DECIMAL(16, 4), así las sumas en enteros dan lo mismo que SUM()
+OCUPACION_QUERY = """
+    SELECT dt.fecha - DATE '0001-01-01' + 1,
+           o.hotel_key,
+           o.canal_key,
+           array_position($1::text[], o.estado_reserva::text) - 1,
+           o.noches_vendidas,
+           (o.ingresos_habitacion * 10000)::bigint,
+           o.reservas_llegadas
+    FROM Fact_OcupacionDiaria o
+    JOIN Dim_Tiempo dt ON o.tiempo_id = dt.tiempo_id
+    WHERE o.estado_reserva = ANY($1::text[])
+"""
+
+
+def _indices(claves: np.ndarray, buscadas: np.ndarray) -> np.ndarray:
+    """Posición en `claves` de cada valor de `buscadas` (todos deben estar)"""
+    orden = np.argsort(claves, kind="stable")
+    return orden[np.searchsorted(claves[orden], buscadas)].astype(np.int32)
+
+
+def _agrupar(codigos: np.ndarray, n: int, noches: np.ndarray, ingresos: np.ndarray,
+             llegadas: np.ndarray) -> Dict[str, np.ndarray]:
+    """Sumas por código con bincount; los ingresos son enteros chicos, exactos en float64"""
+    return {
+        "presentes": np.bincount(codigos, minlength=n) > 0,
+        "cantidad": np.bincount(codigos, weights=llegadas, minlength=n),
+        "noches_vendidas": np.bincount(codigos, weights=noches, minlength=n),
+        "ingresos": np.bincount(codigos, weights=ingresos, minlength=n),
+    }
+
+
+def _ingresos(unidades) -> Decimal:
+    return Decimal(int(round(unidades))).scaleb(-4)
+
+
+class OcupacionColumnar:
+    """
+    Copia en memoria de Fact_OcupacionDiaria (estados que cuentan como
+    ocupación) en arrays de NumPy, uno por columna, ordenados por fecha.
+
+    Un periodo es un tramo contiguo de los arrays (searchsorted sobre las
+    fechas); el filtro de hotel es una máscara y los desgloses por canal y
+    estado son bincount sobre códigos chicos. Hoteles y canales quedan en
+    tablas aparte indexadas por esos códigos; los hoteles van ordenados por
+    nombre según el collation del DWH, así MAX(nombre) es el de mayor código.
+    """
+
+    def __init__(self, columnas: Dict[str, np.ndarray], hoteles: List, canales: List, version: int):
+        orden = np.argsort(columnas["fecha"], kind="stable")
+        self.fecha = columnas["fecha"][orden]
+        self.hotel = _indices(np.array([h["hotel_key"] for h in hoteles], dtype=np.int64),
+                              columnas["hotel_key"][orden])
+        claves_canal = np.array([c["canal_key"] for c in canales], dtype=np.int64)
+        self.canales = list(dict.fromkeys(c["canal_nombre"] for c in canales))
+        codigo_canal = np.array([self.canales.index(c["canal_nombre"]) for c in canales], dtype=np.int16)
+        self.canal = codigo_canal[_indices(claves_canal, columnas["canal_key"][orden])]
+        self.estado = columnas["estado"][orden]
+        self.noches = columnas["noches"][orden]
+        self.ingresos = columnas["ingresos"][orden]
+        self.llegadas = columnas["llegadas"][orden]
+
+        self.hotel_id_erp = np.array([h["hotel_id_erp"] for h in hoteles], dtype=np.int64)
+        self.hotel_nombre = [h["nombre"] for h in hoteles]
+        self.habitaciones_por_hotel: Dict[int, int] = {}
+        for h in hoteles:
+            self.habitaciones_por_hotel[h["hotel_id_erp"]] = (
+                self.habitaciones_por_hotel.get(h["hotel_id_erp"], 0) + (h["numero_habitaciones_total"] or 0))
+        self.total_habitaciones = sum(self.habitaciones_por_hotel.values())
+        self.version = version
+
+    @property
+    def filas(self) -> int:
+        return len(self.fecha)
+
+    @property
+    def bytes(self) -> int:
+        return sum(a.nbytes for a in (self.fecha, self.hotel, self.canal, self.estado,
+                                      self.noches, self.ingresos, self.llegadas))
+
+    def filas_kpis(self, fecha_inicio: date, fecha_fin: date,
+                   hotel_id_erp: Optional[int] = None) -> List[Dict]:
+        """
+        Las mismas filas que KPIS_QUERIES (total, una por canal y una por
+        estado, con las columnas de GROUPING) para pasarlas a
+        construir_analytics. Sin datos en el periodo devuelve [].
+        """
+        i = np.searchsorted(self.fecha, fecha_inicio.toordinal(), side="left")
+        j = np.searchsorted(self.fecha, fecha_fin.toordinal(), side="right")
+        hotel, canal, estado = self.hotel[i:j], self.canal[i:j], self.estado[i:j]
+        noches, ingresos, llegadas = self.noches[i:j], self.ingresos[i:j], self.llegadas[i:j]
+        if hotel_id_erp:
+            mascara = (self.hotel_id_erp == hotel_id_erp)[hotel]
+            hotel, canal, estado = hotel[mascara], canal[mascara], estado[mascara]
+            noches, ingresos, llegadas = noches[mascara], ingresos[mascara], llegadas[mascara]
+        if len(hotel) == 0:
+            return []
+
+        total_habitaciones = (self.habitaciones_por_hotel.get(hotel_id_erp) if hotel_id_erp
+                              else self.total_habitaciones)
+        comunes = {
+            "hotel_id": int(self.hotel_id_erp[hotel].max()),
+            "hotel_nombre": self.hotel_nombre[int(hotel.max())],
+            "total_habitaciones": total_habitaciones,
+        }
+        filas = [{
+            **comunes,
+            "sin_canal": 1, "sin_estado": 1, "canal_nombre": None, "estado_reserva": None,
+            "cantidad": int(llegadas.sum(dtype=np.int64)),
+            "noches_vendidas": int(noches.sum(dtype=np.int64)),
+            "ingresos": _ingresos(ingresos.sum(dtype=np.int64)),
+        }]
+
+        pesos = (noches, ingresos.astype(np.float64), llegadas)
+        por_canal = _agrupar(canal, len(self.canales), *pesos)
+        por_estado = _agrupar(estado, len(ESTADOS_OCUPACION), *pesos)
+        for grupos, nombres, sin_canal in ((por_canal, self.canales, 0), (por_estado, ESTADOS_OCUPACION, 1)):
+            for codigo in np.flatnonzero(grupos["presentes"]):
+                filas.append({
+                    **comunes,
+                    "sin_canal": sin_canal, "sin_estado": 1 - sin_canal,
+                    "canal_nombre": nombres[codigo] if not sin_canal else None,
+                    "estado_reserva": nombres[codigo] if sin_canal else None,
+                    "cantidad": int(grupos["cantidad"][codigo]),
+                    "noches_vendidas": int(grupos["noches_vendidas"][codigo]),
+                    "ingresos": _ingresos(grupos["ingresos"][codigo]),
+                })
+        return filas
+
+
+def _leer_csv(datos: bytes) -> Dict[str, np.ndarray]:
+    """Convierte el CSV de COPY en un array de NumPy por columna"""
+    if not datos:
+        return {nombre: np.empty(0, dtype=tipo) for nombre, tipo in COLUMNAS.items()}
+    tabla = pacsv.read_csv(
+        pa.py_buffer(datos),
+        read_options=pacsv.ReadOptions(column_names=list(COLUMNAS)),
+        convert_options=pacsv.ConvertOptions(
+            column_types={nombre: pa.from_numpy_dtype(tipo) for nombre, tipo in COLUMNAS.items()})
+    )
+    return {nombre: tabla.column(nombre).to_numpy() for nombre in COLUMNAS}
+
+
+_ocupacion: Optional[OcupacionColumnar] = None
+_ocupacion_lock = asyncio.Lock()
+
+
+async def cargar_ocupacion(version: int) -> OcupacionColumnar:
+    """
+    Lee Fact_OcupacionDiaria con COPY y la convierte en columnas en un hilo.
+    Los hoteles se leen después de los hechos: como las dimensiones no
+    pierden filas, todo hotel_key leído tiene su hotel.
+    """
+    trozos: List[bytes] = []
+
+    async def recibir(trozo):
+        trozos.append(bytes(trozo))
+
+    async with get_connection(lectura=True) as conn:
+        with medir(SQL_CONSULTA_SEGUNDOS, 'ocupacion_columnar'):
+            async with conn.transaction(readonly=True):
+                await conn.copy_from_query(OCUPACION_QUERY, ESTADOS_OCUPACION, output=recibir, format="csv")
+                canales = await conn.fetch("SELECT canal_key, canal_nombre FROM Dim_Canal")
+                hoteles = await conn.fetch("""
+                    SELECT hotel_key, hotel_id_erp, nombre, numero_habitaciones_total
+                    FROM Dim_Hotel
+                    ORDER BY nombre, hotel_key
+                """)
+    columnas = await asyncio.to_thread(_leer_csv, b"".join(trozos))
+    return OcupacionColumnar(columnas, hoteles, canales, version)
+
+
+async def obtener_ocupacion() -> OcupacionColumnar:
+    """
+    Copia vigente; cuando el ETL publica una versión nueva se arma otra
+    completa y recién entonces reemplaza a la anterior.
+    """
+    global _ocupacion
+    version = await obtener_version_datos()
+    if _ocupacion is not None and _ocupacion.version == version:
+        return _ocupacion
+
+    async with _ocupacion_lock:
+        if _ocupacion is None or _ocupacion.version != version:
+            _ocupacion = await cargar_ocupacion(version)
+            print(f"✓ Fact_OcupacionDiaria en memoria: {_ocupacion.filas} filas, "
+                  f"{_ocupacion.bytes / 1024 / 1024:.1f} MB (versión de datos {version})")
+    return _ocupacion
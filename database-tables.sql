@@ -134,6 +134,10 @@ CREATE TABLE IF NOT EXISTS ConsumosServicios (
     fecha_consumo TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
 
+-- El ETL lee pagos y consumos por reserva_id, lote a lote
+CREATE INDEX IF NOT EXISTS idx_pagos_reserva ON Pagos(reserva_id);
+CREATE INDEX IF NOT EXISTS idx_consumos_servicios_reserva ON ConsumosServicios(reserva_id);
+
 CREATE TABLE IF NOT EXISTS reviews (
   review_id BIGSERIAL PRIMARY KEY,
   reserva_id BIGINT NOT NULL REFERENCES reservas(reserva_id) ON DELETE RESTRICT,
@@ -146,3 +150,58 @@ CREATE TABLE IF NOT EXISTS reviews (
   fecha_review TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
   label_text VARCHAR(20)
 );
+
+/* ================================================
+ C. REGISTRO DE CAMBIOS PARA EL ETL INCREMENTAL
+================================================
+*/
+
+CREATE TABLE IF NOT EXISTS CambiosETL (
+    cambio_id BIGSERIAL PRIMARY KEY,
+    tabla VARCHAR(50) NOT NULL,
+    registro_id BIGINT NOT NULL,
+    fecha_cambio TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cambios_etl_tabla ON CambiosETL(tabla, cambio_id);
+
+-- TG_ARGV[0]: tabla lógica del ETL, TG_ARGV[1]: columna con el id a registrar
+CREATE OR REPLACE FUNCTION registrar_cambio_etl() RETURNS TRIGGER AS $$
+DECLARE
+    fila JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        fila := to_jsonb(OLD);
+    ELSE
+        fila := to_jsonb(NEW);
+    END IF;
+    INSERT INTO CambiosETL (tabla, registro_id) VALUES (TG_ARGV[0], (fila ->> TG_ARGV[1])::BIGINT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_cambios_hoteles
+    AFTER INSERT OR UPDATE ON Hoteles
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('hoteles', 'hotel_id');
+
+CREATE OR REPLACE TRIGGER trg_cambios_tipos_habitacion
+    AFTER INSERT OR UPDATE ON TiposHabitacion
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('tipos_habitacion', 'tipo_habitacion_id');
+
+CREATE OR REPLACE TRIGGER trg_cambios_huespedes
+    AFTER INSERT OR UPDATE ON Huespedes
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('huespedes', 'huesped_id');
+
+CREATE OR REPLACE TRIGGER trg_cambios_reservas
+    AFTER INSERT OR UPDATE ON Reservas
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('reservas', 'reserva_id');
+
+-- Pagos y consumos modifican los montos agregados de la reserva; al volver
+-- a extraerla el ETL también recarga sus filas de Fact_Pagos y Fact_Consumos
+CREATE OR REPLACE TRIGGER trg_cambios_pagos
+    AFTER INSERT OR UPDATE OR DELETE ON Pagos
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('reservas', 'reserva_id');
+
+CREATE OR REPLACE TRIGGER trg_cambios_consumos
+    AFTER INSERT OR UPDATE OR DELETE ON ConsumosServicios
+    FOR EACH ROW EXECUTE FUNCTION registrar_cambio_etl('reservas', 'reserva_id');
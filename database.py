@@ -1,8 +1,13 @@
+import asyncio
+import itertools
 import os
+import time
 import asyncpg
 from contextlib import asynccontextmanager
-from typing import Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
+from metricas import POOL_ESPERA_SEGUNDOS
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -13,37 +18,202 @@ DWH_DB = os.getenv("DWH_DB")
 DWH_USER = os.getenv("DWH_USER")
 DWH_PASSWORD = os.getenv("DWH_PASSWORD")
 
+# Tamaño de cada pool (el primario y cada réplica tienen el suyo)
+DWH_POOL_MIN = int(os.getenv("DWH_POOL_MIN", "2"))
+DWH_POOL_MAX = int(os.getenv("DWH_POOL_MAX", "10"))
+DWH_COMMAND_TIMEOUT = float(os.getenv("DWH_COMMAND_TIMEOUT", "60"))
+
+# Réplicas de lectura para las consultas analíticas: "host[:puerto],host[:puerto]"
+DWH_REPLICAS = [r.strip() for r in os.getenv("DWH_REPLICAS", "").split(",") if r.strip()]
+# Cada cuánto se comprueba que las réplicas responden y que llegaron a la versión de datos
+DWH_REPLICAS_CHEQUEO_SEGUNDOS = float(os.getenv("DWH_REPLICAS_CHEQUEO_SEGUNDOS", "5"))
+
+# Parámetros de sesión de cada conexión (vacío = valor del servidor)
+DWH_WORK_MEM = os.getenv("DWH_WORK_MEM", "64MB")
+DWH_JIT = os.getenv("DWH_JIT", "off")
+DWH_STATEMENT_TIMEOUT = os.getenv("DWH_STATEMENT_TIMEOUT", "30s")
+
+
+@dataclass
+class Replica:
+    """Réplica de lectura con su pool y el resultado del último chequeo"""
+    host: str
+    port: str
+    pool: Optional[asyncpg.Pool] = None
+    sana: Optional[bool] = None  # None hasta el primer chequeo
+    version: int = 0
+
+    @property
+    def nombre(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
 _pool: Optional[asyncpg.Pool] = None
+_replicas: List[Replica] = []
+_chequeo = {"expira": 0.0}
+_chequeo_lock = asyncio.Lock()
+# Versión de datos que ya se está sirviendo; una réplica por detrás no recibe lecturas
+_version_minima = {"valor": 0}
+_turno = itertools.count()
+
+
+def _parametros_sesion() -> Dict[str, str]:
+    parametros = {
+        "application_name": "bi-service",
+        "work_mem": DWH_WORK_MEM,
+        "jit": DWH_JIT,
+        "statement_timeout": DWH_STATEMENT_TIMEOUT,
+    }
+    return {k: v for k, v in parametros.items() if v}
+
+
+async def _crear_pool(host: str, port: str) -> asyncpg.Pool:
+    return await asyncpg.create_pool(
+        host=host,
+        port=port,
+        database=DWH_DB,
+        user=DWH_USER,
+        password=DWH_PASSWORD,
+        min_size=DWH_POOL_MIN,
+        max_size=DWH_POOL_MAX,
+        command_timeout=DWH_COMMAND_TIMEOUT,
+        # Como server_settings (y no SET en un hook init) sobreviven al
+        # RESET ALL que hace el pool al devolver la conexión
+        server_settings=_parametros_sesion()
+    )
+
+
+async def conectar_primario() -> asyncpg.Connection:
+    """
+    Conexión propia al primario, fuera del pool. Para LISTEN: el pool hace
+    UNLISTEN * al devolver una conexión y la sesión tiene que durar.
+    """
+    return await asyncpg.connect(
+        host=DWH_HOST,
+        port=DWH_PORT,
+        database=DWH_DB,
+        user=DWH_USER,
+        password=DWH_PASSWORD,
+        server_settings=_parametros_sesion()
+    )
 
 
 async def get_pool() -> asyncpg.Pool:
-    """Obtiene el pool de conexiones al DWH"""
+    """Obtiene el pool de conexiones al DWH primario"""
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(
-            host=DWH_HOST,
-            port=DWH_PORT,
-            database=DWH_DB,
-            user=DWH_USER,
-            password=DWH_PASSWORD,
-            min_size=2,
-            max_size=10,
-            command_timeout=60
-        )
+        _pool = await _crear_pool(DWH_HOST, DWH_PORT)
+        for replica in DWH_REPLICAS:
+            host, _, port = replica.partition(":")
+            _replicas.append(Replica(host, port or DWH_PORT))
+        await _chequear_replicas()
     return _pool
 
 
 async def close_pool():
-    """Cierra el pool de conexiones"""
+    """Cierra el pool del primario y los de las réplicas"""
     global _pool
+    for replica in _replicas:
+        if replica.pool is not None:
+            await replica.pool.close()
+    _replicas.clear()
+    _chequeo["expira"] = 0.0
     if _pool:
         await _pool.close()
         _pool = None
 
 
+def exigir_version(version: int):
+    """Las lecturas de réplicas solo van a las que ya tienen esta versión de datos"""
+    _version_minima["valor"] = max(_version_minima["valor"], version or 0)
+
+
+async def _chequear_replica(replica: Replica):
+    try:
+        if replica.pool is None:
+            replica.pool = await _crear_pool(replica.host, replica.port)
+        async with replica.pool.acquire(timeout=DWH_REPLICAS_CHEQUEO_SEGUNDOS) as conn:
+            version = await conn.fetchval(
+                "SELECT version FROM ETL_Version WHERE id = 1", timeout=DWH_REPLICAS_CHEQUEO_SEGUNDOS)
+        replica.version = version or 0
+        if not replica.sana:
+            print(f"✓ Réplica {replica.nombre} disponible (versión de datos {replica.version})")
+        replica.sana = True
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        if replica.sana is not False:
+            print(f"⚠ Réplica {replica.nombre} fuera de servicio: {e}")
+        replica.sana = False
+
+
+async def _chequear_replicas():
+    """Vuelve a comprobar las réplicas si venció el último chequeo"""
+    if not _replicas or _chequeo["expira"] > time.monotonic():
+        return
+    async with _chequeo_lock:
+        if _chequeo["expira"] > time.monotonic():
+            return
+        await asyncio.gather(*(_chequear_replica(r) for r in _replicas))
+        _chequeo["expira"] = time.monotonic() + DWH_REPLICAS_CHEQUEO_SEGUNDOS
+
+
+def _carga(pool: asyncpg.Pool) -> float:
+    return (pool.get_size() - pool.get_idle_size()) / pool.get_max_size()
+
+
+async def _elegir_replica() -> Optional[Replica]:
+    """Réplica sana y al día con menos conexiones en uso (rotando en los empates)"""
+    await _chequear_replicas()
+    candidatas = [r for r in _replicas if r.sana and r.version >= _version_minima["valor"]]
+    if not candidatas:
+        return None
+    inicio = next(_turno) % len(candidatas)
+    candidatas = candidatas[inicio:] + candidatas[:inicio]
+    return min(candidatas, key=lambda r: _carga(r.pool))
+
+
 @asynccontextmanager
-async def get_connection():
-    """Context manager para obtener una conexión del pool"""
+async def get_connection(lectura: bool = False):
+    """
+    Context manager para obtener una conexión del pool. Con lectura=True la
+    conexión sale de una réplica si hay alguna disponible; si no, del primario.
+    """
     pool = await get_pool()
-    async with pool.acquire() as conn:
+    destino = "primario"
+    replica = await _elegir_replica() if lectura else None
+
+    inicio = time.perf_counter()
+    conn = None
+    if replica is not None:
+        try:
+            conn = await replica.pool.acquire()
+            pool, destino = replica.pool, replica.nombre
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            print(f"⚠ Réplica {replica.nombre} fuera de servicio: {e}")
+            replica.sana = False
+    if conn is None:
+        conn = await pool.acquire()
+    POOL_ESPERA_SEGUNDOS.observar(time.perf_counter() - inicio, destino)
+
+    try:
         yield conn
+    finally:
+        await pool.release(conn)
+
+
+def estadisticas_pool() -> Dict[str, Dict[str, int]]:
+    """Conexiones abiertas, libres y máximas por pool (vacío si no está creado)"""
+    pools = {"primario": _pool} if _pool is not None else {}
+    pools.update({r.nombre: r.pool for r in _replicas if r.pool is not None})
+    return {
+        destino: {
+            "abiertas": pool.get_size(),
+            "libres": pool.get_idle_size(),
+            "max": pool.get_max_size(),
+        }
+        for destino, pool in pools.items()
+    }
+
+
+def estado_replicas() -> Dict[str, bool]:
+    """Réplicas configuradas y si reciben lecturas ahora mismo"""
+    return {r.nombre: bool(r.sana) and r.version >= _version_minima["valor"] for r in _replicas}
@@ -0,0 +1,220 @@
+"""
+Demonio del ETL.
+
+En lugar de arrancar etl.py desde cero en cada corrida de cron, mantiene
+abiertos los pools al ERP y al DWH y refresca cada etapa con su propio
+intervalo (Fact_Reservas cada minuto, Dim_Hotel cada hora...). Antes de
+ejecutar una etapa vencida sondea su tabla de origen en el ERP y la salta
+si no cambió desde la última carga exitosa.
+
+Mientras corre tiene el advisory lock del ETL en el DWH: no arranca si hay
+otra instancia (demonio o etl.py) y las ejecuciones de etl.py que se
+superpongan con él terminan sin hacer nada. Ejemplo:
+
+    python demonio_etl.py --intervalo fact_reservas=60 --intervalo dim_hotel=3600
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import signal
+import time
+from typing import Dict, Iterable, Set, Tuple
+
+import etl
+
+# Segundos entre refrescos de cada etapa; ETL_INTERVALOS (etapa=segundos,etapa=segundos)
+# y --intervalo reemplazan los que nombran
+INTERVALOS_POR_DEFECTO = {
+    'dim_tiempo': 86400,
+    'dim_hotel': 3600,
+    'dim_tipo_habitacion': 3600,
+    'dim_servicio': 3600,
+    'dim_huesped': 300,
+    'fact_reservas': 60,
+}
+
+
+def parsear_intervalos(pares: Iterable[str]) -> Dict[str, float]:
+    """Convierte 'etapa=segundos' en {etapa: segundos}, validando los nombres"""
+    intervalos = {}
+    for par in pares:
+        nombre, _, segundos = par.partition('=')
+        nombre = nombre.strip()
+        if nombre not in etl.DEPENDENCIAS_ETAPAS:
+            raise ValueError(f"Etapa desconocida en el intervalo '{par}'")
+        intervalos[nombre] = float(segundos)
+        if intervalos[nombre] <= 0:
+            raise ValueError(f"El intervalo de {nombre} debe ser positivo")
+    return intervalos
+
+
+INTERVALOS = {
+    **INTERVALOS_POR_DEFECTO,
+    **parsear_intervalos(p for p in os.getenv("ETL_INTERVALOS", "").split(",") if p.strip()),
+}
+
+
+def _sonda_checksum(tabla: str, columna_id: str) -> str:
+    """Tablas chicas: cantidad de filas, id máximo y md5 de todo su contenido"""
+    return f"""
+        SELECT count(*), max({columna_id}), md5(string_agg(t::text, ',' ORDER BY {columna_id}))
+        FROM {tabla} t
+    """
+
+
+def _sonda_ids(tabla: str, columna_id: str, tabla_cambios: str, con_cambios: bool) -> str:
+    """
+    Tablas grandes: id máximo y último cambio registrado en CambiosETL, lo
+    mismo que usa la extracción incremental para encontrar filas (ambos se
+    resuelven con índices).
+    """
+    ultimo_cambio = (f"(SELECT max(cambio_id) FROM CambiosETL WHERE tabla = '{tabla_cambios}')"
+                     if con_cambios else "NULL")
+    return f"SELECT (SELECT max({columna_id}) FROM {tabla}), {ultimo_cambio}"
+
+
+async def preparar_sondas(erp_conn) -> Dict[str, str]:
+    """
+    Consulta de sondeo de la fuente de cada etapa. dim_tiempo no tiene
+    fuente en el ERP: se ejecuta siempre que vence su intervalo.
+    """
+    con_cambios = await etl.tiene_registro_cambios(erp_conn)
+    return {
+        'dim_hotel': _sonda_checksum('Hoteles', 'hotel_id'),
+        'dim_tipo_habitacion': _sonda_checksum('TiposHabitacion', 'tipo_habitacion_id'),
+        'dim_servicio': _sonda_checksum('ServiciosAdicionales', 'servicio_id'),
+        'dim_huesped': _sonda_ids('Huespedes', 'huesped_id', 'huespedes', con_cambios),
+        'fact_reservas': _sonda_ids('Reservas', 'reserva_id', 'reservas', con_cambios),
+    }
+
+
+def con_dependencias(nombres: Iterable[str]) -> Set[str]:
+    """Las etapas y todas sus dependencias, directas o indirectas"""
+    resultado = set()
+    pendientes = list(nombres)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre not in resultado:
+            resultado.add(nombre)
+            pendientes.extend(etl.DEPENDENCIAS_ETAPAS[nombre])
+    return resultado
+
+
+async def leer_huellas(erp_pool, sondas: Dict[str, str], nombres: Iterable[str]) -> Dict[str, Tuple]:
+    """Resultado de la sonda de cada etapa (las que no tienen sonda no aparecen)"""
+    async with erp_pool.acquire() as erp_conn:
+        return {n: tuple(await erp_conn.fetchrow(sondas[n])) for n in nombres if n in sondas}
+
+
+def elegir_etapas(vencidas: Set[str], huellas: Dict[str, Tuple], cargadas: Dict[str, Tuple]) -> Set[str]:
+    """
+    Las etapas vencidas cuya fuente cambió (o que no tienen sonda), más las
+    dependencias con cambios de cada una aunque no hayan vencido: una
+    reserva de un huésped nuevo se descartaría si Dim_Huesped no lo tiene.
+    """
+    cambiadas = {n for n, huella in huellas.items() if cargadas.get(n) != huella}
+    elegidas = {n for n in vencidas if n in cambiadas or n not in huellas}
+    pendientes = list(elegidas)
+    while pendientes:
+        for dependencia in etl.DEPENDENCIAS_ETAPAS[pendientes.pop()]:
+            if dependencia in cambiadas and dependencia not in elegidas:
+                elegidas.add(dependencia)
+                pendientes.append(dependencia)
+    return elegidas
+
+
+async def ejecutar_ciclo(vencidas: Set[str], sondas: Dict[str, str], cargadas: Dict[str, Tuple],
+                         erp_pool, dwh_pool, modo_carga: str, paralelismo: int):
+    """Sondea las etapas vencidas y ejecuta las que tienen cambios; deja sus huellas en `cargadas`"""
+    try:
+        huellas = await leer_huellas(erp_pool, sondas, con_dependencias(vencidas))
+        elegidas = elegir_etapas(vencidas, huellas, cargadas)
+        sin_cambios = vencidas - elegidas
+        if sin_cambios:
+            print(f"· Sin cambios en el ERP, se saltan: {', '.join(sorted(sin_cambios))}")
+        if not elegidas:
+            return
+        await etl.run_etl(modo_carga=modo_carga, paralelismo=paralelismo, etapas=elegidas,
+                          erp_pool=erp_pool, dwh_pool=dwh_pool, bloquear=False)
+    except Exception as e:
+        # run_etl ya dejó la ejecución como fallida; el demonio sigue con los pools abiertos
+        print(f"✗ Ciclo del demonio fallido ({', '.join(sorted(vencidas))}): {e}")
+        return
+    cargadas.update((n, huellas[n]) for n in elegidas if n in huellas)
+
+
+async def run_demonio(intervalos: Dict[str, float] = INTERVALOS, modo_carga: str = etl.MODO_CARGA,
+                      paralelismo: int = etl.PARALELISMO):
+    """
+    Ciclo del demonio: espera a que venza alguna etapa, sondea su fuente y
+    ejecuta run_etl solo con las que tienen cambios, sobre los mismos pools.
+    Un ciclo fallido queda registrado como ejecución fallida y se vuelve a
+    intentar cuando las etapas vencen otra vez. Termina con SIGTERM o SIGINT
+    después del ciclo en curso.
+    """
+    bloqueo_conn = await etl.get_dwh_connection()
+    if not await etl.tomar_bloqueo(bloqueo_conn):
+        await bloqueo_conn.close()
+        raise etl.ETLEnCurso(f"Otra instancia del ETL tiene el advisory lock {etl.BLOQUEO_ETL}")
+
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(senal, detener.set)
+
+    erp_pool = None
+    dwh_pool = None
+    try:
+        erp_pool = await etl.get_erp_pool(paralelismo)
+        dwh_pool = await etl.get_dwh_pool(paralelismo)
+        async with erp_pool.acquire() as erp_conn:
+            sondas = await preparar_sondas(erp_conn)
+        print(f"✓ Demonio del ETL iniciado (advisory lock {etl.BLOQUEO_ETL}, carga {modo_carga}, "
+              f"paralelismo {paralelismo})")
+        for nombre, segundos in intervalos.items():
+            print(f"  {nombre}: cada {segundos:g}s")
+
+        # Huella de la fuente en la última carga exitosa de cada etapa
+        cargadas: Dict[str, Tuple] = {}
+        proxima = {nombre: 0.0 for nombre in intervalos}
+        while not detener.is_set():
+            # Si se cayó la sesión del lock, otra instancia pudo tomarlo: mejor terminar
+            await bloqueo_conn.fetchval("SELECT 1")
+
+            ahora = time.monotonic()
+            vencidas = {n for n, momento in proxima.items() if momento <= ahora}
+            for nombre in vencidas:
+                proxima[nombre] = ahora + intervalos[nombre]
+            if vencidas:
+                await ejecutar_ciclo(vencidas, sondas, cargadas, erp_pool, dwh_pool, modo_carga, paralelismo)
+
+            espera = max(0.0, min(proxima.values()) - time.monotonic())
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(detener.wait(), espera)
+        print("✓ Demonio del ETL detenido")
+    finally:
+        if erp_pool:
+            await erp_pool.close()
+        if dwh_pool:
+            await dwh_pool.close()
+        await bloqueo_conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demonio del ETL con intervalo de refresco por etapa")
+    parser.add_argument("--intervalo", action="append", default=[], metavar="ETAPA=SEGUNDOS",
+                        help="Intervalo de una etapa (se puede repetir; por defecto ETL_INTERVALOS "
+                             "o los de INTERVALOS_POR_DEFECTO)")
+    parser.add_argument("--modo-carga", choices=etl.MODOS_CARGA, default=etl.MODO_CARGA)
+    parser.add_argument("--paralelismo", type=int, default=etl.PARALELISMO)
+    args = parser.parse_args()
+    try:
+        intervalos = {**INTERVALOS, **parsear_intervalos(args.intervalo)}
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        asyncio.run(run_demonio(intervalos, args.modo_carga, args.paralelismo))
+    except etl.ETLEnCurso as e:
+        print(f"⚠ {e}; no se inicia el demonio")
+        raise SystemExit(1)
@@ -38,7 +38,8 @@ CREATE TABLE IF NOT EXISTS Dim_Hotel (
     categoria_estrellas INTEGER,
     numero_habitaciones_total INTEGER,
     fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
 );
 
 CREATE INDEX idx_dim_hotel_erp ON Dim_Hotel(hotel_id_erp);
@@ -53,7 +54,8 @@ CREATE TABLE IF NOT EXISTS Dim_TipoHabitacion (
     capacidad_maxima INTEGER,
     precio_base_noche DECIMAL(10, 2),
     fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
 );
 
 CREATE INDEX idx_dim_tipo_habitacion_erp ON Dim_TipoHabitacion(tipo_habitacion_id_erp);
@@ -79,19 +81,86 @@ CREATE TABLE IF NOT EXISTS Dim_Huesped (
     email VARCHAR(255),
     pais_origen VARCHAR(60),
     fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
-    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
 );
 
 CREATE INDEX idx_dim_huesped_erp ON Dim_Huesped(huesped_id_erp);
 
+-- Dim_Servicio: Servicios adicionales que ofrece cada hotel (spa, restaurante...)
+CREATE TABLE IF NOT EXISTS Dim_Servicio (
+    servicio_key BIGSERIAL PRIMARY KEY,
+    servicio_id_erp BIGINT NOT NULL UNIQUE,
+    hotel_id_erp BIGINT NOT NULL,
+    nombre_servicio VARCHAR(255) NOT NULL,
+    precio DECIMAL(10, 2),
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX idx_dim_servicio_hotel ON Dim_Servicio(hotel_id_erp);
+
+-- ================================================
+-- PARTICIONES
+-- ================================================
+
+-- Las tablas de hechos se particionan por mes sobre claves de Dim_Tiempo.
+-- Como populate_dim_tiempo asigna los tiempo_id en orden de fecha, cada mes
+-- es un rango contiguo [id del día 1, id del día 1 del mes siguiente).
+-- Crea las particiones mensuales que falten entre dos fechas; no hace nada
+-- si la tabla no está particionada. Devuelve cuántas particiones creó.
+CREATE OR REPLACE FUNCTION crear_particiones_mensuales(tabla TEXT, desde DATE, hasta DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    inicio_mes DATE;
+    particion TEXT;
+    id_desde BIGINT;
+    id_hasta BIGINT;
+    creadas INTEGER := 0;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(lower(tabla))
+    ) THEN
+        RETURN 0;
+    END IF;
+
+    -- Serializa a los trabajadores del ETL que cargan lotes en paralelo
+    PERFORM pg_advisory_xact_lock(hashtext('crear_particiones_mensuales'));
+
+    FOR inicio_mes IN
+        SELECT generate_series(date_trunc('month', desde), date_trunc('month', hasta), INTERVAL '1 month')::date
+    LOOP
+        particion := lower(tabla) || '_' || to_char(inicio_mes, 'YYYYMM');
+        CONTINUE WHEN to_regclass(particion) IS NOT NULL;
+
+        SELECT MIN(tiempo_id) INTO id_desde
+        FROM Dim_Tiempo
+        WHERE fecha >= inicio_mes AND fecha < inicio_mes + INTERVAL '1 month';
+        CONTINUE WHEN id_desde IS NULL;
+
+        SELECT COALESCE(MIN(tiempo_id), (SELECT MAX(tiempo_id) + 1 FROM Dim_Tiempo)) INTO id_hasta
+        FROM Dim_Tiempo
+        WHERE fecha >= inicio_mes + INTERVAL '1 month';
+
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+                       particion, lower(tabla), id_desde, id_hasta);
+        creadas := creadas + 1;
+    END LOOP;
+    RETURN creadas;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ================================================
--- TABLA DE HECHOS
+-- TABLAS DE HECHOS
 -- ================================================
 
--- Fact_Reservas: Tabla de hechos principal
+-- Fact_Reservas: Tabla de hechos principal, particionada por mes de check-in.
+-- Las claves únicas tienen que incluir la clave de partición; el ETL borra
+-- la fila anterior cuando una reserva cambia de fecha de check-in.
 CREATE TABLE IF NOT EXISTS Fact_Reservas (
-    fact_reserva_id BIGSERIAL PRIMARY KEY,
-    reserva_id_erp BIGINT NOT NULL UNIQUE,
+    fact_reserva_id BIGSERIAL,
+    reserva_id_erp BIGINT NOT NULL,
     
     -- Claves foráneas a dimensiones
     hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
@@ -114,25 +183,184 @@ CREATE TABLE IF NOT EXISTS Fact_Reservas (
     -- Estado de la reserva
     estado_reserva VARCHAR(20) NOT NULL,
     
-    -- Metadatos ETL
+    -- Metadatos ETL (hash_fila: huella del contenido, ver TablaDestino en etl.py)
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID,
+    
+    PRIMARY KEY (fact_reserva_id, fecha_checkin_id),
+    UNIQUE (reserva_id_erp, fecha_checkin_id)
+) PARTITION BY RANGE (fecha_checkin_id);
+
+-- Índices: los rangos de fechas usan BRIN (las filas llegan en bloques por
+-- fecha y cada partición es un mes); solo el acceso por hotel queda en B-tree.
+-- Las búsquedas por reserva_id_erp usan la clave única.
+CREATE INDEX idx_fact_reservas_hotel_fechas ON Fact_Reservas(hotel_key, fecha_checkin_id, fecha_checkout_id);
+CREATE INDEX idx_fact_reservas_checkin ON Fact_Reservas USING BRIN (fecha_checkin_id);
+CREATE INDEX idx_fact_reservas_checkout ON Fact_Reservas USING BRIN (fecha_checkout_id);
+CREATE INDEX idx_fact_reservas_creacion ON Fact_Reservas USING BRIN (fecha_creacion_id);
+
+-- Fact_Pagos: Un pago del ERP por fila. monto_pagado de Fact_Reservas es la
+-- suma de los completados; esta tabla guarda el medio y el estado de cada uno.
+CREATE TABLE IF NOT EXISTS Fact_Pagos (
+    fact_pago_id BIGSERIAL PRIMARY KEY,
+    pago_id_erp BIGINT NOT NULL UNIQUE,
+    reserva_id_erp BIGINT NOT NULL,
+    
+    -- Claves foráneas a dimensiones
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    fecha_pago_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    
+    metodo_pago VARCHAR(30) NOT NULL,
+    estado_pago VARCHAR(20) NOT NULL,
+    monto DECIMAL(12, 2) NOT NULL,
+    
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX idx_fact_pagos_reserva ON Fact_Pagos(reserva_id_erp);
+CREATE INDEX idx_fact_pagos_hotel_fecha ON Fact_Pagos(hotel_key, fecha_pago_id);
+CREATE INDEX idx_fact_pagos_fecha ON Fact_Pagos USING BRIN (fecha_pago_id);
+
+-- Fact_Consumos: Un consumo de servicio adicional del ERP por fila.
+-- monto_consumos de Fact_Reservas es la suma de los consumos de la reserva.
+CREATE TABLE IF NOT EXISTS Fact_Consumos (
+    fact_consumo_id BIGSERIAL PRIMARY KEY,
+    consumo_id_erp BIGINT NOT NULL UNIQUE,
+    reserva_id_erp BIGINT NOT NULL,
+    
+    -- Claves foráneas a dimensiones
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    servicio_key BIGINT NOT NULL REFERENCES Dim_Servicio(servicio_key),
+    fecha_consumo_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    
+    cantidad INTEGER NOT NULL,
+    precio_total_consumo DECIMAL(10, 2) NOT NULL,
+    
     fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX idx_fact_consumos_reserva ON Fact_Consumos(reserva_id_erp);
+CREATE INDEX idx_fact_consumos_hotel_fecha ON Fact_Consumos(hotel_key, fecha_consumo_id);
+CREATE INDEX idx_fact_consumos_fecha ON Fact_Consumos USING BRIN (fecha_consumo_id);
+
+-- ================================================
+-- AGREGADOS
+-- ================================================
+
+-- Fact_OcupacionDiaria: Rollup por hotel, día, canal y estado mantenido por el ETL.
+-- Cada estadía se reparte en sus noches (check-in inclusive, check-out exclusive)
+-- y el ingreso de la reserva se prorratea por noche. Particionada por mes como
+-- Fact_Reservas, así los filtros por rango de tiempo_id de la API podan particiones.
+CREATE TABLE IF NOT EXISTS Fact_OcupacionDiaria (
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    tiempo_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    canal_key BIGINT NOT NULL REFERENCES Dim_Canal(canal_key),
+    estado_reserva VARCHAR(20) NOT NULL,
+    
+    noches_vendidas INTEGER NOT NULL,
+    ingresos_habitacion DECIMAL(16, 4) NOT NULL,
+    reservas_llegadas INTEGER NOT NULL, -- reservas cuyo check-in cae en este día
+    
+    PRIMARY KEY (hotel_key, tiempo_id, canal_key, estado_reserva)
+) PARTITION BY RANGE (tiempo_id);
+
+CREATE INDEX idx_fact_ocupacion_tiempo ON Fact_OcupacionDiaria USING BRIN (tiempo_id);
+
+-- ================================================
+-- CONTROL DEL ETL
+-- ================================================
+
+-- ETL_Watermark: Último id y último cambio procesado por tabla del ERP
+CREATE TABLE IF NOT EXISTS ETL_Watermark (
+    tabla VARCHAR(50) PRIMARY KEY,
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    ultimo_cambio_id BIGINT NOT NULL DEFAULT 0,
+    fecha_ultima_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ETL_Version: Versión de datos del DWH, incrementada al final de cada ETL exitoso.
+-- La API la usa como parte de la clave de su cache de resultados.
+CREATE TABLE IF NOT EXISTS ETL_Version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
     fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 );
 
--- Índices para optimizar consultas analíticas
-CREATE INDEX idx_fact_reservas_hotel ON Fact_Reservas(hotel_key);
-CREATE INDEX idx_fact_reservas_tipo_habitacion ON Fact_Reservas(tipo_habitacion_key);
-CREATE INDEX idx_fact_reservas_canal ON Fact_Reservas(canal_key);
-CREATE INDEX idx_fact_reservas_huesped ON Fact_Reservas(huesped_key);
-CREATE INDEX idx_fact_reservas_checkin ON Fact_Reservas(fecha_checkin_id);
-CREATE INDEX idx_fact_reservas_checkout ON Fact_Reservas(fecha_checkout_id);
-CREATE INDEX idx_fact_reservas_creacion ON Fact_Reservas(fecha_creacion_id);
-CREATE INDEX idx_fact_reservas_estado ON Fact_Reservas(estado_reserva);
-CREATE INDEX idx_fact_reservas_erp ON Fact_Reservas(reserva_id_erp);
-
--- Índices compuestos para consultas comunes
-CREATE INDEX idx_fact_reservas_hotel_fechas ON Fact_Reservas(hotel_key, fecha_checkin_id, fecha_checkout_id);
-CREATE INDEX idx_fact_reservas_fechas_estado ON Fact_Reservas(fecha_checkin_id, fecha_checkout_id, estado_reserva);
+INSERT INTO ETL_Version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- ETL_MetricasEtapa: Duración y filas de la última ejecución exitosa de cada
+-- etapa del ETL (enviadas, y de ellas insertadas, actualizadas y sin cambios).
+-- La API las expone en /metrics junto a sus propias métricas.
+CREATE TABLE IF NOT EXISTS ETL_MetricasEtapa (
+    etapa VARCHAR(50) PRIMARY KEY,
+    segundos DOUBLE PRECISION NOT NULL,
+    filas BIGINT NOT NULL DEFAULT 0,
+    insertadas BIGINT NOT NULL DEFAULT 0,
+    actualizadas BIGINT NOT NULL DEFAULT 0,
+    sin_cambios BIGINT NOT NULL DEFAULT 0,
+    ejecuciones BIGINT NOT NULL DEFAULT 0,
+    fecha_ejecucion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+-- ETL_Ejecucion: Cada ejecución del ETL con los watermarks y el límite del
+-- registro de cambios con que empezó. Las que quedan en_curso o fallida se
+-- pueden reanudar con etl.py --reanudar.
+CREATE TABLE IF NOT EXISTS ETL_Ejecucion (
+    ejecucion_id BIGSERIAL PRIMARY KEY,
+    modo VARCHAR(20) NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'en_curso',
+    watermarks JSONB NOT NULL,
+    cambio_hasta BIGINT,
+    intentos INTEGER NOT NULL DEFAULT 1,
+    error TEXT,
+    inicio TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fin TIMESTAMPTZ,
+    CONSTRAINT chk_estado_ejecucion CHECK (estado IN ('en_curso', 'fallida', 'completada', 'abandonada'))
+);
+
+-- ETL_EjecucionEtapa: Estado de cada etapa de una ejecución y su resultado
+-- (el watermark alcanzado), que al reanudar reemplaza a volver a ejecutarla.
+CREATE TABLE IF NOT EXISTS ETL_EjecucionEtapa (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    etapa VARCHAR(50) NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    resultado JSONB,
+    inicio TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fin TIMESTAMPTZ,
+    PRIMARY KEY (ejecucion_id, etapa)
+);
+
+-- ETL_Checkpoint: Último id confirmado por partición (rango de ids) de las
+-- etapas que cargan por lotes. Cada lote se confirma en la misma transacción
+-- que su checkpoint.
+CREATE TABLE IF NOT EXISTS ETL_Checkpoint (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    etapa VARCHAR(50) NOT NULL,
+    particion INTEGER NOT NULL,
+    desde BIGINT,
+    hasta BIGINT,
+    ultimo_id BIGINT,
+    lotes BIGINT NOT NULL DEFAULT 0,
+    filas BIGINT NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ejecucion_id, etapa, particion)
+);
+
+-- ETL_NochesAfectadas: Noches por hotel que cambiaron en los lotes ya
+-- confirmados y que falta refrescar en Fact_OcupacionDiaria.
+CREATE TABLE IF NOT EXISTS ETL_NochesAfectadas (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    hotel_key BIGINT NOT NULL,
+    desde DATE NOT NULL,
+    hasta DATE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_noches_afectadas_ejecucion ON ETL_NochesAfectadas(ejecucion_id);
 
 -- ================================================
 -- DATOS INICIALES: Canales de Reserva
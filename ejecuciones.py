@@ -0,0 +1,191 @@
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Estados de ETL_Ejecucion: en_curso y fallida se pueden reanudar; una
+# ejecución nueva deja abandonadas las que quedaron sin terminar
+PENDIENTES = ('en_curso', 'fallida')
+
+
+@dataclass
+class Ejecucion:
+    """Ejecución del ETL registrada en ETL_Ejecucion, con lo necesario para reanudarla"""
+    ejecucion_id: int
+    full: bool
+    # Watermarks y límite del registro de cambios fijados al empezar: al
+    # reanudar se extrae con los mismos filtros
+    watermarks: Dict[str, Optional[Dict]]
+    cambio_hasta: Optional[int]
+    reanudada: bool = False
+    # Resultado de las etapas completadas en un intento anterior
+    completadas: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Checkpoint:
+    """
+    Avance confirmado de una partición de una etapa: el último id cuyo lote
+    quedó escrito. Las etapas leen ordenadas por id, así que al reanudar se
+    sigue desde ultimo_id + 1.
+    """
+    ejecucion_id: int
+    etapa: str
+    particion: int
+    desde: Optional[int]
+    hasta: Optional[int]
+    ultimo_id: Optional[int] = None
+
+    @property
+    def siguiente_id(self) -> Optional[int]:
+        if self.ultimo_id is None:
+            return self.desde
+        return self.ultimo_id + 1
+
+    @property
+    def terminado(self) -> bool:
+        return self.ultimo_id is not None and self.hasta is not None and self.ultimo_id >= self.hasta
+
+    async def avanzar(self, dwh_conn, ultimo_id: int, filas: int):
+        """Se llama dentro de la transacción del lote: el lote y su checkpoint se confirman juntos"""
+        await dwh_conn.execute("""
+            UPDATE ETL_Checkpoint
+            SET ultimo_id = $4, lotes = lotes + 1, filas = filas + $5, fecha_actualizacion = CURRENT_TIMESTAMP
+            WHERE ejecucion_id = $1 AND etapa = $2 AND particion = $3
+        """, self.ejecucion_id, self.etapa, self.particion, ultimo_id, filas)
+        self.ultimo_id = ultimo_id
+
+
+async def iniciar_ejecucion(dwh_conn, full: bool, watermarks: Dict[str, Optional[Dict]],
+                            cambio_hasta: Optional[int]) -> Ejecucion:
+    """Registra una ejecución nueva; las pendientes anteriores quedan abandonadas"""
+    async with dwh_conn.transaction():
+        await dwh_conn.execute("""
+            UPDATE ETL_Ejecucion SET estado = 'abandonada', fin = CURRENT_TIMESTAMP
+            WHERE estado = ANY($1::text[])
+        """, list(PENDIENTES))
+        ejecucion_id = await dwh_conn.fetchval("""
+            INSERT INTO ETL_Ejecucion (modo, watermarks, cambio_hasta)
+            VALUES ($1, $2::jsonb, $3)
+            RETURNING ejecucion_id
+        """, 'completo' if full else 'incremental', json.dumps(watermarks), cambio_hasta)
+    return Ejecucion(ejecucion_id, full, watermarks, cambio_hasta)
+
+
+async def reanudar_ejecucion(dwh_conn) -> Optional[Ejecucion]:
+    """La última ejecución que no terminó, lista para seguir desde sus checkpoints, o None"""
+    fila = await dwh_conn.fetchrow("""
+        SELECT ejecucion_id, modo, watermarks, cambio_hasta
+        FROM ETL_Ejecucion
+        WHERE estado = ANY($1::text[])
+        ORDER BY ejecucion_id DESC
+        LIMIT 1
+    """, list(PENDIENTES))
+    if fila is None:
+        return None
+
+    etapas = await dwh_conn.fetch("""
+        SELECT etapa, resultado FROM ETL_EjecucionEtapa
+        WHERE ejecucion_id = $1 AND estado = 'completada'
+    """, fila['ejecucion_id'])
+    await dwh_conn.execute("""
+        UPDATE ETL_Ejecucion SET estado = 'en_curso', intentos = intentos + 1, error = NULL
+        WHERE ejecucion_id = $1
+    """, fila['ejecucion_id'])
+    return Ejecucion(
+        fila['ejecucion_id'],
+        fila['modo'] == 'completo',
+        json.loads(fila['watermarks']),
+        fila['cambio_hasta'],
+        reanudada=True,
+        completadas={e['etapa']: json.loads(e['resultado']) for e in etapas}
+    )
+
+
+async def terminar_ejecucion(dwh_conn, ejecucion_id: int, estado: str, error: Optional[str] = None):
+    """Cierra la ejecución como completada o fallida; las etapas a medias quedan fallidas"""
+    await dwh_conn.execute("""
+        UPDATE ETL_Ejecucion SET estado = $2, error = $3, fin = CURRENT_TIMESTAMP
+        WHERE ejecucion_id = $1
+    """, ejecucion_id, estado, error)
+    await dwh_conn.execute("""
+        UPDATE ETL_EjecucionEtapa SET estado = 'fallida', fin = CURRENT_TIMESTAMP
+        WHERE ejecucion_id = $1 AND estado = 'en_curso'
+    """, ejecucion_id)
+
+
+async def marcar_etapa(dwh_conn, ejecucion_id: int, etapa: str, estado: str, resultado: Any = None):
+    await dwh_conn.execute("""
+        INSERT INTO ETL_EjecucionEtapa (ejecucion_id, etapa, estado, resultado)
+        VALUES ($1, $2, $3, $4::jsonb)
+        ON CONFLICT (ejecucion_id, etapa) DO UPDATE SET
+            estado = EXCLUDED.estado,
+            resultado = EXCLUDED.resultado,
+            inicio = CASE WHEN EXCLUDED.estado = 'en_curso' THEN CURRENT_TIMESTAMP ELSE ETL_EjecucionEtapa.inicio END,
+            fin = CASE WHEN EXCLUDED.estado = 'en_curso' THEN NULL ELSE CURRENT_TIMESTAMP END
+    """, ejecucion_id, etapa, estado, json.dumps(resultado))
+
+
+def con_registro(dwh_pool, ejecucion: Ejecucion, etapa: str,
+                 ejecutar: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+    """
+    Envuelve la función de una etapa para dejar su estado en
+    ETL_EjecucionEtapa. Si la etapa ya se completó en un intento anterior
+    no se vuelve a ejecutar y devuelve el resultado guardado (su watermark).
+    """
+    async def ejecutar_registrada():
+        if etapa in ejecucion.completadas:
+            print(f"  {etapa} ya se completó en un intento anterior de la ejecución {ejecucion.ejecucion_id}")
+            return ejecucion.completadas[etapa]
+        async with dwh_pool.acquire() as dwh_conn:
+            await marcar_etapa(dwh_conn, ejecucion.ejecucion_id, etapa, 'en_curso')
+        resultado = await ejecutar()
+        async with dwh_pool.acquire() as dwh_conn:
+            await marcar_etapa(dwh_conn, ejecucion.ejecucion_id, etapa, 'completada', resultado)
+        return resultado
+
+    return ejecutar_registrada
+
+
+async def preparar_checkpoints(dwh_conn, ejecucion_id: int, etapa: str,
+                               rangos: List[Tuple[Optional[int], Optional[int]]]) -> List[Checkpoint]:
+    """
+    Checkpoints de las particiones de la etapa. Si la ejecución ya los tiene
+    (se está reanudando) se usan esos y sus rangos, aunque `rangos` haya
+    cambiado; si no, se crea uno por rango sin avance.
+    """
+    filas = await dwh_conn.fetch("""
+        SELECT particion, desde, hasta, ultimo_id FROM ETL_Checkpoint
+        WHERE ejecucion_id = $1 AND etapa = $2
+        ORDER BY particion
+    """, ejecucion_id, etapa)
+    if not filas:
+        await dwh_conn.executemany("""
+            INSERT INTO ETL_Checkpoint (ejecucion_id, etapa, particion, desde, hasta)
+            VALUES ($1, $2, $3, $4, $5)
+        """, [(ejecucion_id, etapa, i, desde, hasta) for i, (desde, hasta) in enumerate(rangos)])
+        return [Checkpoint(ejecucion_id, etapa, i, desde, hasta) for i, (desde, hasta) in enumerate(rangos)]
+    return [Checkpoint(ejecucion_id, etapa, f['particion'], f['desde'], f['hasta'], f['ultimo_id']) for f in filas]
+
+
+async def guardar_noches_afectadas(dwh_conn, ejecucion_id: int, rangos: Dict[int, List[Tuple[date, date]]]):
+    """
+    Anota las noches (hotel_key, desde, hasta) que hay que refrescar en
+    Fact_OcupacionDiaria. Va en la transacción del lote, así un intento que
+    falla no pierde las noches de los lotes que sí confirmó.
+    """
+    intervalos = [(ejecucion_id, h, desde, hasta) for h, lista in rangos.items() for desde, hasta in lista]
+    await dwh_conn.executemany("""
+        INSERT INTO ETL_NochesAfectadas (ejecucion_id, hotel_key, desde, hasta)
+        VALUES ($1, $2, $3, $4)
+    """, intervalos)
+
+
+async def leer_noches_afectadas(dwh_conn, ejecucion_id: int) -> List:
+    return await dwh_conn.fetch("""
+        SELECT hotel_key, desde, hasta FROM ETL_NochesAfectadas WHERE ejecucion_id = $1
+    """, ejecucion_id)
+
+
+async def borrar_noches_afectadas(dwh_conn, ejecucion_id: int):
+    await dwh_conn.execute("DELETE FROM ETL_NochesAfectadas WHERE ejecucion_id = $1", ejecucion_id)
@@ -1,9 +1,20 @@
+import argparse
 import asyncio
 import asyncpg
+import json
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Mapping, Optional, Set, Tuple
 from dotenv import load_dotenv
+from scheduler import (Etapa, ejecutar_concurrentes, ejecutar_etapas, registrar_borradas, registrar_cambios,
+                       registrar_filas, registrar_hoteles)
+from ejecuciones import (Checkpoint, Ejecucion, borrar_noches_afectadas, con_registro, guardar_noches_afectadas,
+                         iniciar_ejecucion, leer_noches_afectadas, preparar_checkpoints, reanudar_ejecucion,
+                         terminar_ejecucion)
 
 load_dotenv()
 
@@ -20,6 +31,26 @@ DWH_DB = os.getenv("DWH_DB")
 DWH_USER = os.getenv("DWH_USER")
 DWH_PASSWORD = os.getenv("DWH_PASSWORD")
 
+# Estrategia de carga al DWH: "copy" (COPY binario a staging + merge) o "executemany"
+MODO_CARGA = os.getenv("ETL_MODO_CARGA", "copy")
+MODOS_CARGA = ("copy", "executemany")
+
+# Streaming ERP -> DWH: filas por lote leído del cursor y lotes en vuelo entre extracción y carga
+TAMANO_LOTE = int(os.getenv("ETL_TAMANO_LOTE", "5000"))
+LOTES_EN_COLA = int(os.getenv("ETL_LOTES_EN_COLA", "4"))
+
+# Etapas independientes simultáneas y trabajadores que se reparten Fact_Reservas por rango de reserva_id
+PARALELISMO = int(os.getenv("ETL_PARALELISMO", "4"))
+
+# Canal de NOTIFY por el que la API se entera de cada versión publicada (ver suscripciones.py)
+CANAL_DATOS = os.getenv("DWH_CANAL_DATOS", "bi_datos_actualizados")
+# Con más hoteles afectados el aviso no los lista y vale para todos (el payload de NOTIFY tiene 8000 bytes)
+MAX_HOTELES_AVISO = 500
+
+# Clave del advisory lock del DWH que impide ejecuciones del ETL superpuestas
+# (la misma para etl.py y demonio_etl.py)
+BLOQUEO_ETL = int(os.getenv("ETL_BLOQUEO_ID", "7340201"))
+
 
 async def get_erp_connection():
     """Conexión a la base de datos ERP (solo lectura)"""
@@ -43,71 +74,491 @@ async def get_dwh_connection():
     )
 
 
+async def get_erp_pool(max_size: int = PARALELISMO) -> asyncpg.Pool:
+    """Pool de conexiones al ERP (solo lectura) para las etapas concurrentes"""
+    return await asyncpg.create_pool(
+        host=ERP_HOST,
+        port=ERP_PORT,
+        database=ERP_DB,
+        user=ERP_USER,
+        password=ERP_PASSWORD,
+        min_size=1,
+        max_size=max_size
+    )
+
+
+async def get_dwh_pool(max_size: int = PARALELISMO) -> asyncpg.Pool:
+    """Pool de conexiones al DWH (lectura/escritura) para las etapas concurrentes"""
+    return await asyncpg.create_pool(
+        host=DWH_HOST,
+        port=DWH_PORT,
+        database=DWH_DB,
+        user=DWH_USER,
+        password=DWH_PASSWORD,
+        min_size=1,
+        max_size=max_size
+    )
+
+
+class ETLEnCurso(Exception):
+    """Otra instancia del ETL tiene el advisory lock del DWH"""
+
+
+async def tomar_bloqueo(dwh_conn) -> bool:
+    """
+    Intenta tomar el advisory lock del ETL en la sesión de `dwh_conn`, sin
+    esperar. Se libera al cerrar la conexión, también si el proceso muere.
+    """
+    return await dwh_conn.fetchval("SELECT pg_try_advisory_lock($1)", BLOQUEO_ETL)
+
+
+# Tablas con extracción incremental (mismo nombre que en CambiosETL y ETL_Watermark)
+TABLAS_INCREMENTALES = ['hoteles', 'tipos_habitacion', 'huespedes', 'reservas']
+
+# Etapas del ETL con sus dependencias y la tabla de ETL_Watermark que avanza cada una
+DEPENDENCIAS_ETAPAS = {
+    'dim_tiempo': [],
+    'dim_hotel': [],
+    'dim_tipo_habitacion': [],
+    'dim_huesped': [],
+    'dim_servicio': [],
+    'fact_reservas': ['dim_tiempo', 'dim_hotel', 'dim_tipo_habitacion', 'dim_huesped', 'dim_servicio'],
+}
+WATERMARK_ETAPAS = {
+    'dim_hotel': 'hoteles',
+    'dim_tipo_habitacion': 'tipos_habitacion',
+    'dim_huesped': 'huespedes',
+    'fact_reservas': 'reservas',
+}
+
+
+async def tiene_registro_cambios(erp_conn) -> bool:
+    """Indica si el ERP tiene instalada la tabla CambiosETL mantenida por triggers"""
+    return await erp_conn.fetchval("SELECT to_regclass('cambiosetl') IS NOT NULL")
+
+
+async def obtener_watermarks(dwh_conn, erp_conn, full: bool) -> Tuple[Dict[str, Optional[Dict]], Optional[int]]:
+    """
+    Lee los high-watermarks de la última ejecución exitosa.
+    
+    Devuelve None para cada tabla que debe extraerse completa (modo --full o
+    primera ejecución) y el límite superior del registro de cambios. Ese
+    límite se fija antes de extraer, así los cambios concurrentes se procesan
+    en la siguiente ejecución.
+    """
+    cambio_hasta = None
+    if await tiene_registro_cambios(erp_conn):
+        cambio_hasta = await erp_conn.fetchval("SELECT COALESCE(MAX(cambio_id), 0) FROM CambiosETL")
+    elif not full:
+        print("  ⚠ CambiosETL no existe en el ERP: solo se detectarán filas nuevas por id")
+    
+    if full:
+        return {tabla: None for tabla in TABLAS_INCREMENTALES}, cambio_hasta
+    
+    rows = await dwh_conn.fetch("SELECT tabla, ultimo_id, ultimo_cambio_id FROM ETL_Watermark")
+    guardados = {row['tabla']: row for row in rows}
+    
+    watermarks = {}
+    for tabla in TABLAS_INCREMENTALES:
+        row = guardados.get(tabla)
+        if row is None:
+            watermarks[tabla] = None
+            continue
+        watermarks[tabla] = {
+            'ultimo_id': row['ultimo_id'],
+            'ultimo_cambio_id': row['ultimo_cambio_id'],
+            'cambio_hasta': cambio_hasta
+        }
+    return watermarks, cambio_hasta
+
+
+def filtro_incremental(tabla: str, columna_id: str, watermark: Optional[Dict]) -> Tuple[str, List]:
+    """Construye la condición WHERE que selecciona solo filas nuevas o modificadas"""
+    if watermark is None:
+        return "TRUE", []
+    
+    condicion = f"{columna_id} > $1"
+    params = [watermark['ultimo_id']]
+    
+    if watermark['cambio_hasta'] is not None:
+        condicion = f"""({condicion} OR {columna_id} IN (
+            SELECT registro_id FROM CambiosETL
+            WHERE tabla = $2 AND cambio_id > $3 AND cambio_id <= $4
+        ))"""
+        params += [tabla, watermark['ultimo_cambio_id'], watermark['cambio_hasta']]
+    
+    return condicion, params
+
+
+def nuevo_watermark(watermark: Optional[Dict], filas: List[Mapping], columna_id: str,
+                    cambio_hasta: Optional[int]) -> Dict:
+    """Calcula el watermark que se guardará si la ejecución termina con éxito"""
+    ultimo_id = watermark['ultimo_id'] if watermark else 0
+    ultimo_id = max([ultimo_id] + [f[columna_id] for f in filas])
+    ultimo_cambio_id = watermark['ultimo_cambio_id'] if watermark else 0
+    if cambio_hasta is not None:
+        ultimo_cambio_id = cambio_hasta
+    return {'ultimo_id': ultimo_id, 'ultimo_cambio_id': ultimo_cambio_id}
+
+
+async def guardar_watermarks(dwh_conn, watermarks: Dict[str, Dict]):
+    """Persiste los watermarks al final de una ejecución exitosa"""
+    await dwh_conn.executemany("""
+        INSERT INTO ETL_Watermark (tabla, ultimo_id, ultimo_cambio_id, fecha_ultima_carga)
+        VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+        ON CONFLICT (tabla) DO UPDATE SET
+            ultimo_id = EXCLUDED.ultimo_id,
+            ultimo_cambio_id = EXCLUDED.ultimo_cambio_id,
+            fecha_ultima_carga = EXCLUDED.fecha_ultima_carga
+    """, [(tabla, w['ultimo_id'], w['ultimo_cambio_id']) for tabla, w in watermarks.items()])
+
+
+def expresion_hash(columnas: Iterable[str], alias: str) -> str:
+    """Huella md5 (como UUID) del contenido de las columnas de una fila"""
+    return f"md5(ROW({', '.join(f'{alias}.{c}' for c in columnas)})::text)::uuid"
+
+
+@dataclass
+class TablaDestino:
+    """
+    Describe una tabla del DWH y cómo se hace upsert sobre ella.
+    
+    Con con_hash la tabla guarda en hash_fila la huella del contenido
+    cargado y el upsert solo reescribe las filas cuya huella cambió: las
+    demás no generan WAL, versiones muertas ni una nueva fecha_actualizacion.
+    """
+    nombre: str
+    columnas: List[str]
+    clave: str
+    actualizar: bool = True
+    con_fecha_actualizacion: bool = True
+    particionada: bool = False
+    con_hash: bool = True
+    
+    @property
+    def staging(self) -> str:
+        return f"stg_{self.nombre.lower()}"
+    
+    @property
+    def columnas_carga(self) -> List[str]:
+        return self.columnas + ['hash_fila'] if self.con_hash else self.columnas
+    
+    def clausula_conflicto(self) -> str:
+        if not self.actualizar:
+            return f"ON CONFLICT ({self.clave}) DO NOTHING"
+        claves = [c.strip() for c in self.clave.split(",")]
+        asignaciones = [f"{c} = EXCLUDED.{c}" for c in self.columnas_carga if c not in claves]
+        if self.con_fecha_actualizacion:
+            asignaciones.append("fecha_actualizacion = CURRENT_TIMESTAMP")
+        clausula = f"ON CONFLICT ({self.clave}) DO UPDATE SET " + ", ".join(asignaciones)
+        if self.con_hash:
+            clausula += f" WHERE {self.nombre}.hash_fila IS DISTINCT FROM EXCLUDED.hash_fila"
+        return clausula
+    
+    def cte_escritas(self, select: str, retornar: Iterable[str] = ()) -> str:
+        """
+        CTE "escritas" con el upsert de `select`: una fila por fila escrita con
+        las columnas de la clave y las de `retornar`. Las filas sin cambios no
+        aparecen. Para separar insertadas de actualizadas ver fila_existia().
+        """
+        columnas = [c.strip() for c in self.clave.split(",")]
+        columnas += [c for c in retornar if c not in columnas]
+        return f"""escritas AS (
+                INSERT INTO {self.nombre} ({", ".join(self.columnas_carga)})
+                {select}
+                {self.clausula_conflicto()}
+                RETURNING {", ".join(columnas)}
+            )"""
+    
+    def fila_existia(self, alias: str) -> str:
+        """
+        Condición SQL verdadera si la fila escrita `alias` ya estaba en la
+        tabla: la consulta principal lee la tabla con la foto anterior al
+        upsert de la CTE (xmax no sirve, RETURNING no lo da en particionadas).
+        """
+        claves = [c.strip() for c in self.clave.split(",")]
+        condicion = " AND ".join(f"t.{c} = {alias}.{c}" for c in claves)
+        return f"EXISTS (SELECT 1 FROM {self.nombre} t WHERE {condicion})"
+
+
+DIM_HOTEL = TablaDestino(
+    'Dim_Hotel',
+    ['hotel_id_erp', 'nombre', 'direccion', 'ciudad', 'pais',
+     'categoria_estrellas', 'numero_habitaciones_total'],
+    clave='hotel_id_erp'
+)
+
+DIM_TIPO_HABITACION = TablaDestino(
+    'Dim_TipoHabitacion',
+    ['tipo_habitacion_id_erp', 'hotel_id_erp', 'nombre_tipo',
+     'descripcion', 'capacidad_maxima', 'precio_base_noche'],
+    clave='tipo_habitacion_id_erp'
+)
+
+DIM_HUESPED = TablaDestino(
+    'Dim_Huesped',
+    ['huesped_id_erp', 'nombre', 'apellido', 'email', 'pais_origen'],
+    clave='huesped_id_erp'
+)
+
+FACT_RESERVAS = TablaDestino(
+    'Fact_Reservas',
+    ['reserva_id_erp', 'hotel_key', 'tipo_habitacion_key', 'canal_key', 'huesped_key',
+     'fecha_checkin_id', 'fecha_checkout_id', 'fecha_creacion_id',
+     'monto_total_reserva', 'monto_pagado', 'monto_consumos',
+     'noches_estadia', 'numero_adultos', 'numero_ninos',
+     'precio_total_noche', 'estado_reserva'],
+    clave='reserva_id_erp'
+)
+
+DIM_SERVICIO = TablaDestino(
+    'Dim_Servicio',
+    ['servicio_id_erp', 'hotel_id_erp', 'nombre_servicio', 'precio'],
+    clave='servicio_id_erp'
+)
+
+FACT_PAGOS = TablaDestino(
+    'Fact_Pagos',
+    ['pago_id_erp', 'reserva_id_erp', 'hotel_key', 'fecha_pago_id',
+     'metodo_pago', 'estado_pago', 'monto'],
+    clave='pago_id_erp'
+)
+
+FACT_CONSUMOS = TablaDestino(
+    'Fact_Consumos',
+    ['consumo_id_erp', 'reserva_id_erp', 'hotel_key', 'servicio_key', 'fecha_consumo_id',
+     'cantidad', 'precio_total_consumo'],
+    clave='consumo_id_erp'
+)
+
+# Fact_Reservas particionada por mes de check-in (ver dwh_schema.sql): la clave
+# única tiene que incluir la clave de partición.
+FACT_RESERVAS_PARTICIONADA = TablaDestino(
+    FACT_RESERVAS.nombre,
+    FACT_RESERVAS.columnas,
+    clave='reserva_id_erp, fecha_checkin_id',
+    particionada=True
+)
+
+
+def reportar_velocidad(etapa: str, filas: int, inicio: float):
+    """Imprime filas/segundo de una etapa para comparar estrategias de carga"""
+    segundos = time.perf_counter() - inicio
+    velocidad = filas / segundos if segundos > 0 else 0
+    print(f"  ⏱ {etapa}: {filas} filas en {segundos:.2f}s ({velocidad:,.0f} filas/s)")
+
+
+async def cargar_filas(dwh_conn, tabla: TablaDestino, filas: Iterable[tuple],
+                       modo: str = MODO_CARGA, batch_size: int = 1000, reportar: bool = True) -> int:
+    """
+    Hace upsert de las filas en la tabla destino y devuelve cuántas envió.
+    
+    Las filas se dejan en una tabla temporal de staging, con COPY binario en
+    modo "copy" o en lotes con executemany en modo "executemany", y se
+    aplican con un único INSERT ... SELECT ... ON CONFLICT que calcula la
+    huella de cada fila y cuenta insertadas, actualizadas y sin cambios.
+    """
+    if modo not in MODOS_CARGA:
+        raise ValueError(f"Modo de carga desconocido: {modo}")
+    
+    inicio = time.perf_counter()
+    columnas = ", ".join(tabla.columnas)
+    total = 0
+    
+    await dwh_conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {tabla.staging} AS
+        SELECT {columnas} FROM {tabla.nombre} WITH NO DATA
+    """)
+    await dwh_conn.execute(f"TRUNCATE {tabla.staging}")
+    
+    if modo == "copy":
+        filas = list(filas)
+        await dwh_conn.copy_records_to_table(tabla.staging, records=filas, columns=tabla.columnas)
+        total = len(filas)
+    else:
+        placeholders = ", ".join(f"${i}" for i in range(1, len(tabla.columnas) + 1))
+        query = f"INSERT INTO {tabla.staging} ({columnas}) VALUES ({placeholders})"
+        batch = []
+        for fila in filas:
+            batch.append(fila)
+            if len(batch) >= batch_size:
+                await dwh_conn.executemany(query, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            await dwh_conn.executemany(query, batch)
+            total += len(batch)
+    
+    hash_fila = f", {expresion_hash(tabla.columnas, 's')}" if tabla.con_hash else ""
+    resultado = await dwh_conn.fetchrow(f"""
+        WITH {tabla.cte_escritas(f"SELECT {columnas}{hash_fila} FROM {tabla.staging} s")}
+        SELECT count(*) FILTER (WHERE NOT {tabla.fila_existia('e')}) AS insertadas,
+               count(*) FILTER (WHERE {tabla.fila_existia('e')}) AS actualizadas
+        FROM escritas e
+    """)
+    await dwh_conn.execute(f"TRUNCATE {tabla.staging}")
+    
+    insertadas, actualizadas = resultado['insertadas'], resultado['actualizadas']
+    registrar_filas(total)
+    registrar_cambios(tabla.nombre, insertadas, actualizadas, total - insertadas - actualizadas)
+    if reportar:
+        reportar_velocidad(f"Carga {tabla.nombre} [{modo}]", total, inicio)
+        print(f"  {tabla.nombre}: {insertadas} insertadas, {actualizadas} actualizadas, "
+              f"{total - insertadas - actualizadas} sin cambios")
+    return total
+
+
+async def leer_por_lotes(erp_conn, query: str, params: List,
+                         tamano_lote: int = TAMANO_LOTE) -> AsyncIterator[List[asyncpg.Record]]:
+    """
+    Lee una consulta del ERP con un cursor del lado del servidor.
+    
+    Solo un lote de filas vive en memoria a la vez; la transacción de solo
+    lectura se mantiene abierta hasta agotar el cursor.
+    """
+    async with erp_conn.transaction(isolation='repeatable_read', readonly=True):
+        cursor = await erp_conn.cursor(query, *params)
+        while True:
+            filas = await cursor.fetch(tamano_lote)
+            if not filas:
+                break
+            yield filas
+
+
+async def ejecutar_pipeline(lotes: AsyncIterator[List], cargar: Callable[[List], Awaitable[None]],
+                            lotes_en_cola: int = LOTES_EN_COLA):
+    """
+    Conecta extracción y carga a través de una asyncio.Queue acotada.
+    
+    El productor lee el siguiente lote del ERP mientras el consumidor carga
+    el anterior en el DWH. Con la cola llena el productor espera, de modo que
+    la memoria máxima depende del tamaño de lote y no del tamaño de la tabla.
+    """
+    cola: asyncio.Queue = asyncio.Queue(maxsize=lotes_en_cola)
+    
+    async def productor():
+        try:
+            async for lote in lotes:
+                await cola.put(lote)
+        except Exception as e:
+            await cola.put(e)
+        else:
+            await cola.put(None)
+    
+    tarea = asyncio.create_task(productor())
+    try:
+        while True:
+            lote = await cola.get()
+            if lote is None:
+                break
+            if isinstance(lote, Exception):
+                raise lote
+            await cargar(lote)
+    finally:
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+
+
+async def guardar_metricas_etapas(dwh_conn, etapas: List[Etapa]):
+    """Publica duración, filas y cambios de cada etapa en ETL_MetricasEtapa, que la API expone en /metrics"""
+    filas = []
+    for e in etapas:
+        cambios = e.total_cambios()
+        filas.append((e.nombre, e.segundos, e.filas,
+                      cambios['insertadas'], cambios['actualizadas'], cambios['sin_cambios']))
+    await dwh_conn.executemany("""
+        INSERT INTO ETL_MetricasEtapa (
+            etapa, segundos, filas, insertadas, actualizadas, sin_cambios, ejecuciones, fecha_ejecucion
+        )
+        VALUES ($1, $2, $3, $4, $5, $6, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (etapa) DO UPDATE SET
+            segundos = EXCLUDED.segundos,
+            filas = EXCLUDED.filas,
+            insertadas = EXCLUDED.insertadas,
+            actualizadas = EXCLUDED.actualizadas,
+            sin_cambios = EXCLUDED.sin_cambios,
+            ejecuciones = ETL_MetricasEtapa.ejecuciones + 1,
+            fecha_ejecucion = EXCLUDED.fecha_ejecucion
+    """, filas)
+
+
+async def incrementar_version_datos(dwh_conn) -> int:
+    """Marca que el DWH cambió; la API descarta sus resultados cacheados"""
+    return await dwh_conn.fetchval("""
+        UPDATE ETL_Version
+        SET version = version + 1, fecha_actualizacion = CURRENT_TIMESTAMP
+        WHERE id = 1
+        RETURNING version
+    """)
+
+
+async def notificar_datos_actualizados(dwh_conn, version: int, hoteles: Optional[Set[int]]):
+    """
+    Avisa por NOTIFY la versión publicada y los hoteles que cambiaron (None
+    si no se saben o son demasiados para listarlos). Dentro de una
+    transacción el aviso sale recién al confirmarla.
+    """
+    listar = hoteles is not None and len(hoteles) <= MAX_HOTELES_AVISO
+    aviso = {'version': version, 'hoteles': sorted(hoteles) if listar else None}
+    await dwh_conn.execute("SELECT pg_notify($1, $2)", CANAL_DATOS, json.dumps(aviso))
+
+
 async def populate_dim_tiempo(dwh_conn, start_date: datetime, end_date: datetime):
-    """Puebla la dimensión de tiempo con un rango de fechas"""
+    """
+    Puebla la dimensión de tiempo con las fechas del rango que aún no existen.
+    
+    Se genera en el servidor con un único INSERT ... SELECT en orden de fecha,
+    así los tiempo_id quedan consecutivos y la API puede traducir rangos de
+    fechas a rangos de tiempo_id (ver calendario.py).
+    """
     print("Poblando Dim_Tiempo...")
     
     dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
     meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
              'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
     
-    current_date = start_date
-    batch = []
-    
-    while current_date <= end_date:
-        dia_semana = current_date.weekday()
-        es_fin_semana = dia_semana >= 5
-        semana_anio = current_date.isocalendar()[1]
-        trimestre = (current_date.month - 1) // 3 + 1
-        semestre = 1 if current_date.month <= 6 else 2
-        
-        batch.append((
-            current_date,
-            current_date.year,
-            current_date.month,
-            current_date.day,
-            trimestre,
-            semestre,
-            dia_semana,
-            dias_semana[dia_semana],
-            meses[current_date.month - 1],
-            es_fin_semana,
-            False,
-            semana_anio
-        ))
-        
-        if len(batch) >= 1000:
-            await dwh_conn.executemany("""
-                INSERT INTO Dim_Tiempo (
-                    fecha, anio, mes, dia, trimestre, semestre, dia_semana,
-                    nombre_dia_semana, nombre_mes, es_fin_semana, es_festivo, semana_anio
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                ON CONFLICT (fecha) DO NOTHING
-            """, batch)
-            batch = []
-        
-        current_date += timedelta(days=1)
-    
-    if batch:
-        await dwh_conn.executemany("""
-            INSERT INTO Dim_Tiempo (
-                fecha, anio, mes, dia, trimestre, semestre, dia_semana,
-                nombre_dia_semana, nombre_mes, es_fin_semana, es_festivo, semana_anio
-            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-            ON CONFLICT (fecha) DO NOTHING
-        """, batch)
+    inicio = time.perf_counter()
+    resultado = await dwh_conn.execute("""
+        INSERT INTO Dim_Tiempo (
+            fecha, anio, mes, dia, trimestre, semestre, dia_semana,
+            nombre_dia_semana, nombre_mes, es_fin_semana, es_festivo, semana_anio
+        )
+        SELECT
+            g.fecha,
+            EXTRACT(YEAR FROM g.fecha),
+            EXTRACT(MONTH FROM g.fecha),
+            EXTRACT(DAY FROM g.fecha),
+            EXTRACT(QUARTER FROM g.fecha),
+            CASE WHEN EXTRACT(MONTH FROM g.fecha) <= 6 THEN 1 ELSE 2 END,
+            EXTRACT(ISODOW FROM g.fecha) - 1,
+            ($3::text[])[EXTRACT(ISODOW FROM g.fecha)],
+            ($4::text[])[EXTRACT(MONTH FROM g.fecha)],
+            EXTRACT(ISODOW FROM g.fecha) >= 6,
+            FALSE,
+            EXTRACT(WEEK FROM g.fecha)
+        FROM generate_series($1::date, $2::date, INTERVAL '1 day') AS s(dia)
+        CROSS JOIN LATERAL (SELECT s.dia::date AS fecha) g
+        WHERE NOT EXISTS (SELECT 1 FROM Dim_Tiempo dt WHERE dt.fecha = g.fecha)
+        ORDER BY g.fecha
+        ON CONFLICT (fecha) DO NOTHING
+    """, start_date.date(), end_date.date(), dias_semana, meses)
     
+    nuevas = int(resultado.split()[-1])
+    registrar_filas(nuevas)
+    registrar_cambios('dim_tiempo', nuevas, 0, 0)
+    reportar_velocidad("Dim_Tiempo fechas nuevas", nuevas, inicio)
     print(f"Dim_Tiempo poblada desde {start_date.date()} hasta {end_date.date()}")
 
 
-async def extract_hoteles(erp_conn) -> List[Dict]:
+async def extract_hoteles(erp_conn, watermark: Optional[Dict] = None) -> List[Dict]:
     """Extrae hoteles del ERP"""
     print("Extrayendo Hoteles del ERP...")
-    rows = await erp_conn.fetch("SELECT * FROM Hoteles")
+    condicion, params = filtro_incremental('hoteles', 'hotel_id', watermark)
+    rows = await erp_conn.fetch(f"SELECT * FROM Hoteles WHERE {condicion}", *params)
     return [dict(row) for row in rows]
 
 
-async def load_dim_hotel(dwh_conn, hoteles: List[Dict]):
+async def load_dim_hotel(dwh_conn, hoteles: List[Dict], modo: str = MODO_CARGA):
     """Carga la dimensión de hoteles"""
     print(f"Cargando {len(hoteles)} hoteles a Dim_Hotel...")
     
@@ -117,32 +568,31 @@ async def load_dim_hotel(dwh_conn, hoteles: List[Dict]):
         for h in hoteles
     ]
     
-    await dwh_conn.executemany("""
-        INSERT INTO Dim_Hotel (
-            hotel_id_erp, nombre, direccion, ciudad, pais,
-            categoria_estrellas, numero_habitaciones_total
-        ) VALUES ($1, $2, $3, $4, $5, $6, $7)
-        ON CONFLICT (hotel_id_erp) DO UPDATE SET
-            nombre = EXCLUDED.nombre,
-            direccion = EXCLUDED.direccion,
-            ciudad = EXCLUDED.ciudad,
-            pais = EXCLUDED.pais,
-            categoria_estrellas = EXCLUDED.categoria_estrellas,
-            numero_habitaciones_total = EXCLUDED.numero_habitaciones_total,
-            fecha_actualizacion = CURRENT_TIMESTAMP
-    """, batch)
+    await cargar_filas(dwh_conn, DIM_HOTEL, batch, modo)
     
     print("Dim_Hotel cargada exitosamente")
 
 
-async def extract_tipos_habitacion(erp_conn) -> List[Dict]:
+async def etl_dim_hotel(erp_conn, dwh_conn, watermark: Optional[Dict],
+                        cambio_hasta: Optional[int], modo: str = MODO_CARGA) -> Dict:
+    """Extrae y carga Dim_Hotel; devuelve el watermark alcanzado"""
+    inicio = time.perf_counter()
+    hoteles = await extract_hoteles(erp_conn, watermark)
+    reportar_velocidad("Extracción Hoteles", len(hoteles), inicio)
+    await load_dim_hotel(dwh_conn, hoteles, modo)
+    registrar_hoteles(h['hotel_id'] for h in hoteles)
+    return nuevo_watermark(watermark, hoteles, 'hotel_id', cambio_hasta)
+
+
+async def extract_tipos_habitacion(erp_conn, watermark: Optional[Dict] = None) -> List[Dict]:
     """Extrae tipos de habitación del ERP"""
     print("Extrayendo Tipos de Habitación del ERP...")
-    rows = await erp_conn.fetch("SELECT * FROM TiposHabitacion")
+    condicion, params = filtro_incremental('tipos_habitacion', 'tipo_habitacion_id', watermark)
+    rows = await erp_conn.fetch(f"SELECT * FROM TiposHabitacion WHERE {condicion}", *params)
     return [dict(row) for row in rows]
 
 
-async def load_dim_tipo_habitacion(dwh_conn, tipos: List[Dict]):
+async def load_dim_tipo_habitacion(dwh_conn, tipos: List[Dict], modo: str = MODO_CARGA):
     """Carga la dimensión de tipos de habitación"""
     print(f"Cargando {len(tipos)} tipos de habitación a Dim_TipoHabitacion...")
     
@@ -152,246 +602,835 @@ async def load_dim_tipo_habitacion(dwh_conn, tipos: List[Dict]):
         for t in tipos
     ]
     
-    await dwh_conn.executemany("""
-        INSERT INTO Dim_TipoHabitacion (
-            tipo_habitacion_id_erp, hotel_id_erp, nombre_tipo,
-            descripcion, capacidad_maxima, precio_base_noche
-        ) VALUES ($1, $2, $3, $4, $5, $6)
-        ON CONFLICT (tipo_habitacion_id_erp) DO UPDATE SET
-            hotel_id_erp = EXCLUDED.hotel_id_erp,
-            nombre_tipo = EXCLUDED.nombre_tipo,
-            descripcion = EXCLUDED.descripcion,
-            capacidad_maxima = EXCLUDED.capacidad_maxima,
-            precio_base_noche = EXCLUDED.precio_base_noche,
-            fecha_actualizacion = CURRENT_TIMESTAMP
-    """, batch)
+    await cargar_filas(dwh_conn, DIM_TIPO_HABITACION, batch, modo)
     
     print("Dim_TipoHabitacion cargada exitosamente")
 
 
-async def extract_huespedes(erp_conn) -> List[Dict]:
-    """Extrae huéspedes del ERP"""
-    print("Extrayendo Huéspedes del ERP...")
-    rows = await erp_conn.fetch("SELECT * FROM Huespedes")
+async def etl_dim_tipo_habitacion(erp_conn, dwh_conn, watermark: Optional[Dict],
+                                  cambio_hasta: Optional[int], modo: str = MODO_CARGA) -> Dict:
+    """Extrae y carga Dim_TipoHabitacion; devuelve el watermark alcanzado"""
+    inicio = time.perf_counter()
+    tipos = await extract_tipos_habitacion(erp_conn, watermark)
+    reportar_velocidad("Extracción TiposHabitacion", len(tipos), inicio)
+    await load_dim_tipo_habitacion(dwh_conn, tipos, modo)
+    registrar_hoteles(t['hotel_id'] for t in tipos)
+    return nuevo_watermark(watermark, tipos, 'tipo_habitacion_id', cambio_hasta)
+
+
+async def extract_servicios(erp_conn) -> List[Dict]:
+    """
+    Extrae los servicios adicionales del ERP. Son pocas filas y no tienen
+    registro de cambios, así que se leen completos en cada ejecución; el
+    hash de fila evita reescribir los que no cambiaron.
+    """
+    print("Extrayendo Servicios adicionales del ERP...")
+    rows = await erp_conn.fetch("SELECT * FROM ServiciosAdicionales")
     return [dict(row) for row in rows]
 
 
-async def load_dim_huesped(dwh_conn, huespedes: List[Dict]):
-    """Carga la dimensión de huéspedes"""
+async def etl_dim_servicio(erp_conn, dwh_conn, modo: str = MODO_CARGA):
+    """Extrae y carga Dim_Servicio"""
+    servicios = await extract_servicios(erp_conn)
+    print(f"Cargando {len(servicios)} servicios a Dim_Servicio...")
+    
+    batch = [
+        (s['servicio_id'], s['hotel_id'], s['nombre_servicio'], s['precio'])
+        for s in servicios
+    ]
+    
+    # Se leen todos los servicios: solo cuentan como cambio los que el upsert escribió
+    desde = await dwh_conn.fetchval("SELECT clock_timestamp()")
+    await cargar_filas(dwh_conn, DIM_SERVICIO, batch, modo)
+    cambiados = await dwh_conn.fetch(
+        "SELECT DISTINCT hotel_id_erp FROM Dim_Servicio WHERE fecha_actualizacion >= $1", desde)
+    registrar_hoteles(s['hotel_id_erp'] for s in cambiados)
+    
+    print("Dim_Servicio cargada exitosamente")
+
+
+def extract_huespedes(erp_conn, watermark: Optional[Dict] = None,
+                      desde_id: Optional[int] = None) -> AsyncIterator[List[asyncpg.Record]]:
+    """Extrae huéspedes del ERP por lotes, opcionalmente desde un huesped_id (al reanudar)"""
+    print("Extrayendo Huéspedes del ERP...")
+    condicion, params = filtro_incremental('huespedes', 'huesped_id', watermark)
+    if desde_id is not None:
+        condicion += f" AND huesped_id >= ${len(params) + 1}"
+        params.append(desde_id)
+    return leer_por_lotes(
+        erp_conn, f"SELECT * FROM Huespedes WHERE {condicion} ORDER BY huesped_id", params)
+
+
+async def load_dim_huesped(dwh_conn, huespedes: List[Mapping], modo: str = MODO_CARGA) -> int:
+    """Carga un lote de la dimensión de huéspedes"""
     print(f"Cargando {len(huespedes)} huéspedes a Dim_Huesped...")
     
-    batch_size = 1000
-    total = len(huespedes)
+    data = (
+        (h['huesped_id'], h['nombre'], h['apellido'], h['email'], h['pais_origen'])
+        for h in huespedes
+    )
     
-    for i in range(0, total, batch_size):
-        batch = huespedes[i:i + batch_size]
-        data = [
-            (h['huesped_id'], h['nombre'], h['apellido'], h['email'], h['pais_origen'])
-            for h in batch
-        ]
+    return await cargar_filas(dwh_conn, DIM_HUESPED, data, modo, reportar=False)
+
+
+def watermark_reanudado(watermark: Optional[Dict], checkpoints: List[Checkpoint], columna_id: str,
+                        cambio_hasta: Optional[int]) -> Dict:
+    """Watermark de partida de una etapa que sigue desde sus checkpoints"""
+    confirmados = [{columna_id: c.ultimo_id} for c in checkpoints if c.ultimo_id is not None]
+    return nuevo_watermark(watermark, confirmados, columna_id, cambio_hasta)
+
+
+async def etl_dim_huesped(erp_conn, dwh_conn, watermark: Optional[Dict],
+                          cambio_hasta: Optional[int], ejecucion: Ejecucion, modo: str = MODO_CARGA) -> Dict:
+    """
+    Extrae y carga Dim_Huesped en streaming; devuelve el watermark alcanzado.
+    Cada lote se confirma junto con su checkpoint.
+    """
+    inicio = time.perf_counter()
+    checkpoint, = await preparar_checkpoints(dwh_conn, ejecucion.ejecucion_id, 'dim_huesped', [(None, None)])
+    estado = {'filas': 0, 'watermark': watermark_reanudado(watermark, [checkpoint], 'huesped_id', cambio_hasta)}
+    
+    async def cargar(lote):
+        async with dwh_conn.transaction():
+            filas = await load_dim_huesped(dwh_conn, lote, modo)
+            await checkpoint.avanzar(dwh_conn, lote[-1]['huesped_id'], filas)
+        estado['filas'] += filas
+        estado['watermark'] = nuevo_watermark(estado['watermark'], lote, 'huesped_id', cambio_hasta)
+    
+    await ejecutar_pipeline(extract_huespedes(erp_conn, watermark, checkpoint.siguiente_id), cargar)
+    
+    reportar_velocidad(f"Huéspedes extraídos y cargados [{modo}]", estado['filas'], inicio)
+    print("Dim_Huesped cargada exitosamente")
+    return estado['watermark']
+
+
+@dataclass
+class LoteReservas:
+    """Lote de reservas del ERP con los pagos y consumos de esas reservas"""
+    reservas: List[Dict]
+    pagos: List[asyncpg.Record]
+    consumos: List[asyncpg.Record]
+
+
+PAGOS_DE_RESERVAS = """
+    SELECT pago_id, reserva_id, monto, fecha_pago, metodo_pago, estado_pago
+    FROM Pagos
+    WHERE reserva_id = ANY($1::bigint[])
+"""
+
+CONSUMOS_DE_RESERVAS = """
+    SELECT consumo_id, reserva_id, servicio_id, cantidad, precio_total_consumo, fecha_consumo
+    FROM ConsumosServicios
+    WHERE reserva_id = ANY($1::bigint[])
+"""
+
+
+def extract_reservas_con_pagos(erp_conn, watermark: Optional[Dict] = None,
+                               rango: Optional[Tuple[int, int]] = None) -> AsyncIterator[LoteReservas]:
+    """Extrae reservas del ERP con sus pagos y consumos, por lotes y opcionalmente en un rango de reserva_id"""
+    print("Extrayendo Reservas, Pagos y Consumos del ERP...")
+    
+    condicion, params = filtro_incremental('reservas', 'reserva_id', watermark)
+    if rango is not None:
+        condicion += f" AND reserva_id BETWEEN ${len(params) + 1} AND ${len(params) + 2}"
+        params += list(rango)
+    
+    query = f"SELECT * FROM Reservas WHERE {condicion} ORDER BY reserva_id"
+    return con_pagos_y_consumos(erp_conn, leer_por_lotes(erp_conn, query, params))
+
+
+async def con_pagos_y_consumos(erp_conn, lotes: AsyncIterator[List[asyncpg.Record]]) -> AsyncIterator[LoteReservas]:
+    """
+    Completa cada lote de reservas con sus pagos y consumos.
+    
+    Pagos y consumos se leen aparte, una consulta por tabla y lote, dentro de
+    la misma transacción que el cursor de reservas. monto_pagado (pagos
+    completados) y monto_consumos se suman por reserva a partir de esas
+    filas: unir Reservas con Pagos y ConsumosServicios antes del GROUP BY
+    daba pagos × consumos filas por reserva y multiplicaba ambos montos.
+    """
+    async for reservas in lotes:
+        ids = [r['reserva_id'] for r in reservas]
+        pagos = await erp_conn.fetch(PAGOS_DE_RESERVAS, ids)
+        consumos = await erp_conn.fetch(CONSUMOS_DE_RESERVAS, ids)
         
-        await dwh_conn.executemany("""
-            INSERT INTO Dim_Huesped (
-                huesped_id_erp, nombre, apellido, email, pais_origen
-            ) VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (huesped_id_erp) DO UPDATE SET
-                nombre = EXCLUDED.nombre,
-                apellido = EXCLUDED.apellido,
-                email = EXCLUDED.email,
-                pais_origen = EXCLUDED.pais_origen,
-                fecha_actualizacion = CURRENT_TIMESTAMP
-        """, data)
+        pagado = defaultdict(Decimal)
+        for p in pagos:
+            if str(p['estado_pago']) == 'completado':
+                pagado[p['reserva_id']] += p['monto']
+        consumido = defaultdict(Decimal)
+        for c in consumos:
+            consumido[c['reserva_id']] += c['precio_total_consumo']
         
-        print(f"  Procesados {min(i + batch_size, total)}/{total} huéspedes...")
+        yield LoteReservas(
+            reservas=[
+                dict(r, monto_pagado=pagado[r['reserva_id']], monto_consumos=consumido[r['reserva_id']])
+                for r in reservas
+            ],
+            pagos=pagos,
+            consumos=consumos
+        )
+
+
+async def particionar_reservas(erp_conn, watermark: Optional[Dict], particiones: int) -> List[Tuple[int, int]]:
+    """Divide el rango de reserva_id a extraer en `particiones` rangos contiguos de igual ancho"""
+    condicion, params = filtro_incremental('reservas', 'reserva_id', watermark)
+    row = await erp_conn.fetchrow(
+        f"SELECT MIN(reserva_id) AS desde, MAX(reserva_id) AS hasta FROM Reservas WHERE {condicion}", *params)
+    if row['desde'] is None:
+        return []
     
-    print("Dim_Huesped cargada exitosamente")
+    desde, hasta = row['desde'], row['hasta']
+    ancho = max(1, -(-(hasta - desde + 1) // particiones))
+    return [(inicio, min(inicio + ancho - 1, hasta)) for inicio in range(desde, hasta + 1, ancho)]
+
+
+# Reservas del ERP tal cual, antes de resolver las claves de dimensión
+STG_RESERVAS_ERP = 'stg_reservas_erp'
+COLUMNAS_RESERVAS_ERP = [
+    'reserva_id', 'hotel_id', 'tipo_habitacion_id', 'canal_reserva', 'huesped_id',
+    'fecha_checkin', 'fecha_checkout', 'fecha_creacion',
+    'monto_total_reserva', 'monto_pagado', 'monto_consumos',
+    'numero_adultos', 'numero_ninos', 'precio_total_noche', 'estado_reserva'
+]
+
+
+def transformar_reservas(reservas: Iterable[Mapping], contadores: Dict[str, int]) -> Iterator[tuple]:
+    """Convierte reservas del ERP en filas de staging, contando las que no se pueden leer"""
+    for reserva in reservas:
+        try:
+            yield (
+                reserva['reserva_id'], reserva['hotel_id'], reserva['tipo_habitacion_id'],
+                str(reserva['canal_reserva']), reserva['huesped_id'],
+                reserva['fecha_checkin'], reserva['fecha_checkout'],
+                reserva['fecha_creacion_reserva'].date(),
+                reserva['monto_total_reserva'], reserva['monto_pagado'], reserva['monto_consumos'],
+                reserva['numero_adultos'], reserva['numero_ninos'],
+                reserva['precio_total_noche'], str(reserva['estado_reserva'])
+            )
+        except Exception as e:
+            print(f"Error procesando reserva {reserva.get('reserva_id', 'unknown')}: {e}")
+            contadores['omitidas'] += 1
+
+
+async def tablas_particionadas(dwh_conn) -> Set[str]:
+    """Nombres (en minúsculas) de las tablas particionadas del DWH"""
+    filas = await dwh_conn.fetch("SELECT partrelid::regclass::text AS tabla FROM pg_partitioned_table")
+    return {f['tabla'].lower() for f in filas}
 
 
-async def extract_reservas_con_pagos(erp_conn) -> List[Dict]:
-    """Extrae reservas del ERP con pagos agregados"""
-    print("Extrayendo Reservas y Pagos del ERP...")
+async def load_fact_reservas(dwh_conn, reservas: List[Mapping], modo: str = MODO_CARGA,
+                             destino: TablaDestino = FACT_RESERVAS) -> Tuple[int, int, List[Mapping]]:
+    """
+    Carga un lote de la tabla de hechos de reservas; devuelve (cargadas,
+    omitidas, afectados), donde afectados son las noches (hotel_key, desde,
+    hasta) que ocupaban antes y ocupan ahora las reservas que cambiaron.
+    
+    Las claves de dimensión se resuelven en el DWH: el lote se deja en una
+    tabla temporal con los ids del ERP y un único INSERT ... SELECT lo une
+    contra las dimensiones. Las reservas sin hotel, tipo, canal, huésped o
+    fechas conocidas, o sin noches, no pasan los JOIN y se cuentan omitidas.
     
-    query = """
-        SELECT 
-            r.*,
-            COALESCE(SUM(p.monto) FILTER (WHERE p.estado_pago = 'completado'), 0) as monto_pagado,
-            COALESCE(SUM(cs.precio_total_consumo), 0) as monto_consumos
-        FROM Reservas r
-        LEFT JOIN Pagos p ON r.reserva_id = p.reserva_id
-        LEFT JOIN ConsumosServicios cs ON r.reserva_id = cs.reserva_id
-        GROUP BY r.reserva_id
-        ORDER BY r.reserva_id
+    Si el destino está particionado se borran las filas de reservas cuyo
+    check-in cambió, que de otro modo quedarían duplicadas en otra partición;
+    las particiones de los meses del lote se crean antes con
+    crear_particiones_reservas.
     """
+    contadores = {'omitidas': 0}
+    filas = list(transformar_reservas(reservas, contadores))
     
-    rows = await erp_conn.fetch(query)
-    return [dict(row) for row in rows]
+    await dwh_conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STG_RESERVAS_ERP} (
+            reserva_id BIGINT,
+            hotel_id BIGINT,
+            tipo_habitacion_id BIGINT,
+            canal_reserva TEXT,
+            huesped_id BIGINT,
+            fecha_checkin DATE,
+            fecha_checkout DATE,
+            fecha_creacion DATE,
+            monto_total_reserva NUMERIC,
+            monto_pagado NUMERIC,
+            monto_consumos NUMERIC,
+            numero_adultos INTEGER,
+            numero_ninos INTEGER,
+            precio_total_noche NUMERIC,
+            estado_reserva TEXT
+        )
+    """)
+    await dwh_conn.execute(f"TRUNCATE {STG_RESERVAS_ERP}")
+    
+    if modo == "copy":
+        await dwh_conn.copy_records_to_table(STG_RESERVAS_ERP, records=filas, columns=COLUMNAS_RESERVAS_ERP)
+    else:
+        placeholders = ", ".join(f"${i}" for i in range(1, len(COLUMNAS_RESERVAS_ERP) + 1))
+        await dwh_conn.executemany(
+            f"INSERT INTO {STG_RESERVAS_ERP} VALUES ({placeholders})", filas)
+    
+    # Sin estadísticas el planificador no sabe que el lote es pequeño frente a las dimensiones
+    await dwh_conn.execute(f"ANALYZE {STG_RESERVAS_ERP}")
+    
+    async with dwh_conn.transaction():
+        anteriores = await rangos_modificados(dwh_conn)
+        if destino.particionada:
+            await borrar_reservas_movidas(dwh_conn)
+        resultado = await insertar_reservas_staging(dwh_conn, destino)
+    await dwh_conn.execute(f"TRUNCATE {STG_RESERVAS_ERP}")
+    
+    cargadas = resultado['candidatas']
+    insertadas, actualizadas = resultado['insertadas'], resultado['actualizadas']
+    registrar_filas(cargadas)
+    registrar_cambios(destino.nombre, insertadas, actualizadas, cargadas - insertadas - actualizadas)
+    
+    afectados = list(anteriores) + [
+        {'hotel_key': h, 'desde': d, 'hasta': a}
+        for h, d, a in zip(resultado['hoteles'] or [], resultado['desdes'] or [], resultado['hastas'] or [])
+    ]
+    return cargadas, contadores['omitidas'] + len(filas) - cargadas, afectados
+
+
+async def crear_particiones_reservas(dwh_conn, reservas: List[Mapping]):
+    """
+    Crea las particiones de Fact_Reservas de los meses de check-in del lote.
+    Va fuera de la transacción del lote: la creación de particiones se
+    serializa entre trabajadores y no debe retener el lock durante la carga.
+    """
+    meses = sorted({r['fecha_checkin'].replace(day=1) for r in reservas if r['fecha_checkin'] is not None})
+    await dwh_conn.execute(
+        "SELECT crear_particiones_mensuales('Fact_Reservas', mes, mes) FROM unnest($1::date[]) AS mes", meses)
+
+
+async def borrar_reservas_movidas(dwh_conn):
+    """
+    Borra de Fact_Reservas particionada las reservas del lote en staging cuya
+    fecha de check-in cambió: el upsert las insertaría en otra partición.
+    """
+    await dwh_conn.execute(f"""
+        DELETE FROM Fact_Reservas fr
+        USING {STG_RESERVAS_ERP} s
+        JOIN Dim_Tiempo ci ON ci.fecha = s.fecha_checkin
+        WHERE fr.reserva_id_erp = s.reserva_id
+          AND fr.fecha_checkin_id <> ci.tiempo_id
+    """)
+
+
+# Huella de una reserva: se calcula sobre la fila del ERP en staging
+HASH_RESERVA_ERP = expresion_hash(COLUMNAS_RESERVAS_ERP, 's')
+
+
+async def rangos_modificados(dwh_conn) -> List[asyncpg.Record]:
+    """Noches que ocupan hoy en el DWH las reservas del lote cuyo contenido cambió"""
+    return await dwh_conn.fetch(f"""
+        SELECT fr.hotel_key, ci.fecha AS desde, co.fecha - 1 AS hasta
+        FROM {STG_RESERVAS_ERP} s
+        JOIN Fact_Reservas fr ON fr.reserva_id_erp = s.reserva_id
+        JOIN Dim_Tiempo ci ON fr.fecha_checkin_id = ci.tiempo_id
+        JOIN Dim_Tiempo co ON fr.fecha_checkout_id = co.tiempo_id
+        WHERE fr.hash_fila IS DISTINCT FROM {HASH_RESERVA_ERP}
+    """)
+
+
+async def insertar_reservas_staging(dwh_conn, destino: TablaDestino) -> asyncpg.Record:
+    """
+    INSERT ... SELECT del lote en staging contra las dimensiones. Devuelve
+    cuántas filas pasaron los JOIN (candidatas), cuántas se insertaron y
+    actualizaron, y las noches (hotel, desde, hasta) de las escritas.
+    """
+    return await dwh_conn.fetchrow(f"""
+        WITH candidatas AS MATERIALIZED (
+            SELECT
+                s.reserva_id, dh.hotel_key, dth.tipo_habitacion_key, dc.canal_key, dhu.huesped_key,
+                ci.tiempo_id AS checkin_id, co.tiempo_id AS checkout_id, cr.tiempo_id AS creacion_id,
+                s.monto_total_reserva, s.monto_pagado, s.monto_consumos,
+                s.fecha_checkout - s.fecha_checkin AS noches, s.numero_adultos, s.numero_ninos,
+                s.precio_total_noche, s.estado_reserva, {HASH_RESERVA_ERP} AS hash_fila
+            FROM {STG_RESERVAS_ERP} s
+            JOIN Dim_Hotel dh ON dh.hotel_id_erp = s.hotel_id
+            JOIN Dim_TipoHabitacion dth ON dth.tipo_habitacion_id_erp = s.tipo_habitacion_id
+            JOIN Dim_Canal dc ON dc.canal_codigo = s.canal_reserva
+            JOIN Dim_Huesped dhu ON dhu.huesped_id_erp = s.huesped_id
+            JOIN Dim_Tiempo ci ON ci.fecha = s.fecha_checkin
+            JOIN Dim_Tiempo co ON co.fecha = s.fecha_checkout
+            JOIN Dim_Tiempo cr ON cr.fecha = s.fecha_creacion
+            WHERE s.fecha_checkout > s.fecha_checkin
+        ),
+        {destino.cte_escritas("SELECT * FROM candidatas", ["hotel_key", "fecha_checkin_id", "fecha_checkout_id"])}
+        SELECT
+            (SELECT count(*) FROM candidatas) AS candidatas,
+            count(*) FILTER (WHERE NOT {destino.fila_existia('e')}) AS insertadas,
+            count(*) FILTER (WHERE {destino.fila_existia('e')}) AS actualizadas,
+            array_agg(e.hotel_key) AS hoteles,
+            array_agg(ci.fecha) AS desdes,
+            array_agg(co.fecha - 1) AS hastas
+        FROM escritas e
+        JOIN Dim_Tiempo ci ON e.fecha_checkin_id = ci.tiempo_id
+        JOIN Dim_Tiempo co ON e.fecha_checkout_id = co.tiempo_id
+    """)
+
+
+def _fecha(momento: Optional[datetime]) -> Optional[date]:
+    return momento.date() if momento is not None else None
+
+
+def transformar_pagos(lote: LoteReservas) -> List[tuple]:
+    """Pagos del lote como filas de staging, con el hotel de su reserva"""
+    hoteles = {r['reserva_id']: r['hotel_id'] for r in lote.reservas}
+    return [
+        (p['pago_id'], p['reserva_id'], hoteles[p['reserva_id']], _fecha(p['fecha_pago']),
+         str(p['metodo_pago']), str(p['estado_pago']), p['monto'])
+        for p in lote.pagos
+    ]
+
+
+def transformar_consumos(lote: LoteReservas) -> List[tuple]:
+    """Consumos del lote como filas de staging, con el hotel de su reserva"""
+    hoteles = {r['reserva_id']: r['hotel_id'] for r in lote.reservas}
+    return [
+        (c['consumo_id'], c['reserva_id'], hoteles[c['reserva_id']], c['servicio_id'],
+         _fecha(c['fecha_consumo']), c['cantidad'], c['precio_total_consumo'])
+        for c in lote.consumos
+    ]
+
+
+@dataclass
+class DetalleReservas:
+    """
+    Tabla de hechos con una fila por detalle de reserva del ERP (pago o
+    consumo). Como Fact_Reservas, el lote se deja en staging con los ids
+    del ERP y `select` resuelve las claves de dimensión y la huella.
+    """
+    destino: TablaDestino
+    staging: str
+    columnas_erp: Dict[str, str]  # columna de staging -> tipo; la primera es el id del ERP
+    select: str
+    transformar: Callable[[LoteReservas], List[tuple]]
+
+
+COLUMNAS_PAGOS_ERP = {
+    'pago_id': 'BIGINT', 'reserva_id': 'BIGINT', 'hotel_id': 'BIGINT', 'fecha_pago': 'DATE',
+    'metodo_pago': 'TEXT', 'estado_pago': 'TEXT', 'monto': 'NUMERIC',
+}
 
+DETALLE_PAGOS = DetalleReservas(
+    FACT_PAGOS, 'stg_pagos_erp', COLUMNAS_PAGOS_ERP,
+    f"""SELECT
+                s.pago_id, s.reserva_id, dh.hotel_key, dt.tiempo_id,
+                s.metodo_pago, s.estado_pago, s.monto, {expresion_hash(COLUMNAS_PAGOS_ERP, 's')}
+            FROM stg_pagos_erp s
+            JOIN Dim_Hotel dh ON dh.hotel_id_erp = s.hotel_id
+            JOIN Dim_Tiempo dt ON dt.fecha = s.fecha_pago""",
+    transformar_pagos
+)
 
-async def get_dimension_keys(dwh_conn) -> Dict[str, Dict]:
-    """Obtiene mapeos de IDs del ERP a claves del DWH"""
-    print("Obteniendo mapeos de dimensiones...")
+COLUMNAS_CONSUMOS_ERP = {
+    'consumo_id': 'BIGINT', 'reserva_id': 'BIGINT', 'hotel_id': 'BIGINT', 'servicio_id': 'BIGINT',
+    'fecha_consumo': 'DATE', 'cantidad': 'INTEGER', 'precio_total_consumo': 'NUMERIC',
+}
+
+DETALLE_CONSUMOS = DetalleReservas(
+    FACT_CONSUMOS, 'stg_consumos_erp', COLUMNAS_CONSUMOS_ERP,
+    f"""SELECT
+                s.consumo_id, s.reserva_id, dh.hotel_key, ds.servicio_key, dt.tiempo_id,
+                s.cantidad, s.precio_total_consumo, {expresion_hash(COLUMNAS_CONSUMOS_ERP, 's')}
+            FROM stg_consumos_erp s
+            JOIN Dim_Hotel dh ON dh.hotel_id_erp = s.hotel_id
+            JOIN Dim_Servicio ds ON ds.servicio_id_erp = s.servicio_id
+            JOIN Dim_Tiempo dt ON dt.fecha = s.fecha_consumo""",
+    transformar_consumos
+)
+
+
+async def load_detalle_reservas(dwh_conn, detalle: DetalleReservas, lote: LoteReservas,
+                                modo: str = MODO_CARGA) -> Tuple[int, int]:
+    """
+    Deja en el DWH los pagos o consumos de las reservas del lote tal como
+    están en el ERP; devuelve (omitidas, borradas).
     
-    hoteles = await dwh_conn.fetch("SELECT hotel_key, hotel_id_erp FROM Dim_Hotel")
-    tipos = await dwh_conn.fetch("SELECT tipo_habitacion_key, tipo_habitacion_id_erp FROM Dim_TipoHabitacion")
-    canales = await dwh_conn.fetch("SELECT canal_key, canal_codigo FROM Dim_Canal")
-    huespedes = await dwh_conn.fetch("SELECT huesped_key, huesped_id_erp FROM Dim_Huesped")
-    tiempos = await dwh_conn.fetch("SELECT tiempo_id, fecha FROM Dim_Tiempo")
+    Hace upsert con huella de las filas del lote y borra las filas de esas
+    reservas que ya no existen en el ERP. Las filas sin hotel, servicio o
+    fecha conocidos no pasan los JOIN y se cuentan omitidas.
+    """
+    filas = detalle.transformar(lote)
+    columnas = list(detalle.columnas_erp)
+    destino = detalle.destino
     
-    return {
-        'hoteles': {row['hotel_id_erp']: row['hotel_key'] for row in hoteles},
-        'tipos': {row['tipo_habitacion_id_erp']: row['tipo_habitacion_key'] for row in tipos},
-        'canales': {row['canal_codigo']: row['canal_key'] for row in canales},
-        'huespedes': {row['huesped_id_erp']: row['huesped_key'] for row in huespedes},
-        'tiempos': {row['fecha']: row['tiempo_id'] for row in tiempos}
-    }
+    await dwh_conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {detalle.staging} (
+            {", ".join(f"{c} {tipo}" for c, tipo in detalle.columnas_erp.items())}
+        )
+    """)
+    await dwh_conn.execute(f"TRUNCATE {detalle.staging}")
+    
+    if modo == "copy":
+        await dwh_conn.copy_records_to_table(detalle.staging, records=filas, columns=columnas)
+    else:
+        placeholders = ", ".join(f"${i}" for i in range(1, len(columnas) + 1))
+        await dwh_conn.executemany(f"INSERT INTO {detalle.staging} VALUES ({placeholders})", filas)
+    await dwh_conn.execute(f"ANALYZE {detalle.staging}")
+    
+    async with dwh_conn.transaction():
+        borrado = await dwh_conn.execute(f"""
+            DELETE FROM {destino.nombre} t
+            WHERE t.reserva_id_erp = ANY($1::bigint[])
+              AND NOT EXISTS (SELECT 1 FROM {detalle.staging} s WHERE s.{columnas[0]} = t.{destino.clave})
+        """, [r['reserva_id'] for r in lote.reservas])
+        resultado = await dwh_conn.fetchrow(f"""
+            WITH candidatas AS MATERIALIZED (
+            {detalle.select}
+            ),
+            {destino.cte_escritas("SELECT * FROM candidatas")}
+            SELECT
+                (SELECT count(*) FROM candidatas) AS candidatas,
+                count(*) FILTER (WHERE NOT {destino.fila_existia('e')}) AS insertadas,
+                count(*) FILTER (WHERE {destino.fila_existia('e')}) AS actualizadas
+            FROM escritas e
+        """)
+    await dwh_conn.execute(f"TRUNCATE {detalle.staging}")
+    
+    cargadas = resultado['candidatas']
+    insertadas, actualizadas = resultado['insertadas'], resultado['actualizadas']
+    registrar_filas(cargadas)
+    registrar_cambios(destino.nombre, insertadas, actualizadas, cargadas - insertadas - actualizadas)
+    borradas = int(borrado.split()[-1])
+    registrar_borradas(borradas)
+    return len(filas) - cargadas, borradas
+
+
+def acumular_rangos(rangos: Dict[int, List[Tuple[date, date]]], nuevos: Iterable[Mapping]):
+    """Fusiona intervalos de noches [desde, hasta] por hotel_key, sin solapes"""
+    por_hotel = defaultdict(list)
+    for r in nuevos:
+        por_hotel[r['hotel_key']].append((r['desde'], r['hasta']))
+    
+    for hotel_key, intervalos in por_hotel.items():
+        intervalos.extend(rangos.get(hotel_key, []))
+        intervalos.sort()
+        fusionados = []
+        for desde, hasta in intervalos:
+            if fusionados and desde <= fusionados[-1][1] + timedelta(days=1):
+                fusionados[-1] = (fusionados[-1][0], max(fusionados[-1][1], hasta))
+            else:
+                fusionados.append((desde, hasta))
+        rangos[hotel_key] = fusionados
 
 
-async def load_fact_reservas(dwh_conn, reservas: List[Dict], dimension_keys: Dict):
-    """Carga la tabla de hechos de reservas"""
-    print(f"Cargando {len(reservas)} reservas a Fact_Reservas...")
+async def refrescar_ocupacion_diaria(dwh_conn, rangos: Dict[int, List[Tuple[date, date]]],
+                                     particionada: bool = False):
+    """
+    Recalcula Fact_OcupacionDiaria solo para los días y hoteles afectados.
     
-    loaded = 0
-    skipped = 0
-    batch_size = 500
+    Borra las filas del rollup en los rangos dados y las reconstruye desde
+    Fact_Reservas repartiendo cada estadía en sus noches.
+    """
+    intervalos = [(h, desde, hasta) for h, lista in rangos.items() for desde, hasta in lista]
+    print(f"Refrescando Fact_OcupacionDiaria en {len(intervalos)} rangos de fechas...")
+    if not intervalos:
+        return
     
-    for i in range(0, len(reservas), batch_size):
-        batch_reservas = reservas[i:i + batch_size]
-        batch_data = []
-        
-        for reserva in batch_reservas:
-            try:
-                hotel_key = dimension_keys['hoteles'].get(reserva['hotel_id'])
-                tipo_key = dimension_keys['tipos'].get(reserva['tipo_habitacion_id'])
-                canal_key = dimension_keys['canales'].get(str(reserva['canal_reserva']))
-                huesped_key = dimension_keys['huespedes'].get(reserva['huesped_id'])
-                
-                if not all([hotel_key, tipo_key, canal_key, huesped_key]):
-                    skipped += 1
-                    continue
-                
-                fecha_checkin_id = dimension_keys['tiempos'].get(reserva['fecha_checkin'])
-                fecha_checkout_id = dimension_keys['tiempos'].get(reserva['fecha_checkout'])
-                fecha_creacion_id = dimension_keys['tiempos'].get(reserva['fecha_creacion_reserva'].date())
-                
-                if not all([fecha_checkin_id, fecha_checkout_id, fecha_creacion_id]):
-                    skipped += 1
-                    continue
-                
-                noches = (reserva['fecha_checkout'] - reserva['fecha_checkin']).days
-                
-                if noches <= 0:
-                    skipped += 1
-                    continue
-                
-                batch_data.append((
-                    reserva['reserva_id'], hotel_key, tipo_key, canal_key, huesped_key,
-                    fecha_checkin_id, fecha_checkout_id, fecha_creacion_id,
-                    reserva['monto_total_reserva'], reserva['monto_pagado'], reserva['monto_consumos'],
-                    noches, reserva['numero_adultos'], reserva['numero_ninos'],
-                    reserva['precio_total_noche'], str(reserva['estado_reserva'])
-                ))
-                
-            except Exception as e:
-                print(f"Error procesando reserva {reserva.get('reserva_id', 'unknown')}: {e}")
-                skipped += 1
+    inicio = time.perf_counter()
+    hotel_keys, desdes, hastas = (list(c) for c in zip(*intervalos))
+    
+    if particionada:
+        await dwh_conn.execute(
+            "SELECT crear_particiones_mensuales('Fact_OcupacionDiaria', $1, $2)",
+            min(desdes), max(hastas))
+    
+    async with dwh_conn.transaction():
+        await dwh_conn.execute("""
+            DELETE FROM Fact_OcupacionDiaria o
+            USING unnest($1::bigint[], $2::date[], $3::date[]) AS a(hotel_key, desde, hasta),
+                  Dim_Tiempo dt
+            WHERE o.hotel_key = a.hotel_key
+              AND o.tiempo_id = dt.tiempo_id
+              AND dt.fecha BETWEEN a.desde AND a.hasta
+        """, hotel_keys, desdes, hastas)
         
-        if batch_data:
-            await dwh_conn.executemany("""
-                INSERT INTO Fact_Reservas (
-                    reserva_id_erp, hotel_key, tipo_habitacion_key, canal_key, huesped_key,
-                    fecha_checkin_id, fecha_checkout_id, fecha_creacion_id,
-                    monto_total_reserva, monto_pagado, monto_consumos,
-                    noches_estadia, numero_adultos, numero_ninos,
-                    precio_total_noche, estado_reserva
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, $16)
-                ON CONFLICT (reserva_id_erp) DO UPDATE SET
-                    hotel_key = EXCLUDED.hotel_key,
-                    tipo_habitacion_key = EXCLUDED.tipo_habitacion_key,
-                    canal_key = EXCLUDED.canal_key,
-                    huesped_key = EXCLUDED.huesped_key,
-                    fecha_checkin_id = EXCLUDED.fecha_checkin_id,
-                    fecha_checkout_id = EXCLUDED.fecha_checkout_id,
-                    fecha_creacion_id = EXCLUDED.fecha_creacion_id,
-                    monto_total_reserva = EXCLUDED.monto_total_reserva,
-                    monto_pagado = EXCLUDED.monto_pagado,
-                    monto_consumos = EXCLUDED.monto_consumos,
-                    noches_estadia = EXCLUDED.noches_estadia,
-                    numero_adultos = EXCLUDED.numero_adultos,
-                    numero_ninos = EXCLUDED.numero_ninos,
-                    precio_total_noche = EXCLUDED.precio_total_noche,
-                    estado_reserva = EXCLUDED.estado_reserva,
-                    fecha_actualizacion = CURRENT_TIMESTAMP
-            """, batch_data)
+        resultado = await dwh_conn.execute("""
+            INSERT INTO Fact_OcupacionDiaria (
+                hotel_key, tiempo_id, canal_key, estado_reserva,
+                noches_vendidas, ingresos_habitacion, reservas_llegadas
+            )
+            SELECT
+                fr.hotel_key,
+                dt.tiempo_id,
+                fr.canal_key,
+                fr.estado_reserva,
+                COUNT(*),
+                SUM(fr.monto_total_reserva / fr.noches_estadia),
+                COUNT(*) FILTER (WHERE dt.tiempo_id = fr.fecha_checkin_id)
+            FROM unnest($1::bigint[], $2::date[], $3::date[]) AS a(hotel_key, desde, hasta)
+            JOIN Fact_Reservas fr ON fr.hotel_key = a.hotel_key
+            JOIN Dim_Tiempo ci ON fr.fecha_checkin_id = ci.tiempo_id
+            JOIN Dim_Tiempo co ON fr.fecha_checkout_id = co.tiempo_id
+            JOIN Dim_Tiempo dt ON dt.fecha >= ci.fecha AND dt.fecha < co.fecha
+                              AND dt.fecha BETWEEN a.desde AND a.hasta
+            WHERE ci.fecha <= a.hasta AND co.fecha > a.desde
+            GROUP BY fr.hotel_key, dt.tiempo_id, fr.canal_key, fr.estado_reserva
+        """, hotel_keys, desdes, hastas)
+    
+    reportar_velocidad("Refresco Fact_OcupacionDiaria", int(resultado.split()[-1]), inicio)
+
+
+async def etl_fact_reservas(erp_pool: asyncpg.Pool, dwh_pool: asyncpg.Pool, watermark: Optional[Dict],
+                            cambio_hasta: Optional[int], ejecucion: Ejecucion, modo: str = MODO_CARGA,
+                            particiones: int = PARALELISMO) -> Dict:
+    """
+    Extrae, transforma y carga Fact_Reservas en streaming junto con los
+    pagos y consumos de cada reserva (Fact_Pagos y Fact_Consumos), y
+    refresca el rollup diario en las fechas afectadas. Devuelve el
+    watermark alcanzado.
+    
+    El rango de reserva_id se reparte entre `particiones` trabajadores, cada
+    uno con su propia conexión al ERP y al DWH. Cada lote (reservas, pagos,
+    consumos y noches a refrescar) se confirma en una transacción junto con
+    el checkpoint de su partición; al reanudar, cada trabajador sigue desde
+    su último lote confirmado con los rangos del primer intento.
+    """
+    async with erp_pool.acquire() as erp_conn, dwh_pool.acquire() as dwh_conn:
+        checkpoints = await preparar_checkpoints(
+            dwh_conn, ejecucion.ejecucion_id, 'fact_reservas',
+            await particionar_reservas(erp_conn, watermark, particiones))
+        particionadas = await tablas_particionadas(dwh_conn)
+    destino = FACT_RESERVAS_PARTICIONADA if 'fact_reservas' in particionadas else FACT_RESERVAS
+    pendientes = [c for c in checkpoints if not c.terminado]
+    print(f"Reservas repartidas en {len(checkpoints)} particiones: "
+          f"{[(c.siguiente_id, c.hasta) for c in pendientes]}"
+          + (f" ({len(checkpoints) - len(pendientes)} ya terminadas)" if len(pendientes) < len(checkpoints) else ""))
+    
+    inicio = time.perf_counter()
+    estado = {
+        'leidas': 0, 'cargadas': 0, 'omitidas': 0,
+        'watermark': watermark_reanudado(watermark, checkpoints, 'reserva_id', cambio_hasta)
+    }
+    detalles = {d.destino.nombre: {'omitidas': 0, 'borradas': 0} for d in (DETALLE_PAGOS, DETALLE_CONSUMOS)}
+    
+    async def trabajador(checkpoint: Checkpoint):
+        async with erp_pool.acquire() as erp_conn, dwh_pool.acquire() as dwh_conn:
+            async def cargar(lote):
+                if destino.particionada:
+                    await crear_particiones_reservas(dwh_conn, lote.reservas)
+                async with dwh_conn.transaction():
+                    cargadas, omitidas, afectados = await load_fact_reservas(dwh_conn, lote.reservas, modo, destino)
+                    for detalle in (DETALLE_PAGOS, DETALLE_CONSUMOS):
+                        omitidas_detalle, borradas = await load_detalle_reservas(dwh_conn, detalle, lote, modo)
+                        detalles[detalle.destino.nombre]['omitidas'] += omitidas_detalle
+                        detalles[detalle.destino.nombre]['borradas'] += borradas
+                    # Noches que ocupaban las reservas antes y después de cargarlas
+                    rangos: Dict[int, List[Tuple[date, date]]] = {}
+                    acumular_rangos(rangos, afectados)
+                    await guardar_noches_afectadas(dwh_conn, ejecucion.ejecucion_id, rangos)
+                    await checkpoint.avanzar(dwh_conn, lote.reservas[-1]['reserva_id'], len(lote.reservas))
+                registrar_hoteles(r['hotel_id'] for r in lote.reservas)
+                estado['leidas'] += len(lote.reservas)
+                estado['cargadas'] += cargadas
+                estado['omitidas'] += omitidas
+                estado['watermark'] = nuevo_watermark(estado['watermark'], lote.reservas, 'reserva_id', cambio_hasta)
+                print(f"  Procesadas {estado['leidas']} reservas...")
             
-            loaded += len(batch_data)
-            print(f"  Procesadas {min(i + batch_size, len(reservas))}/{len(reservas)} reservas...")
+            rango_id = (checkpoint.siguiente_id, checkpoint.hasta)
+            await ejecutar_pipeline(extract_reservas_con_pagos(erp_conn, watermark, rango_id), cargar)
+    
+    await ejecutar_concurrentes(trabajador(c) for c in pendientes)
     
-    print(f"Fact_Reservas: {loaded} cargadas, {skipped} omitidas")
+    reportar_velocidad(f"Reservas extraídas y cargadas [{modo}]", estado['leidas'], inicio)
+    print(f"Fact_Reservas: {estado['cargadas']} cargadas, {estado['omitidas']} omitidas")
+    for tabla, conteo in detalles.items():
+        print(f"{tabla}: {conteo['omitidas']} omitidas, {conteo['borradas']} borradas (ya no están en el ERP)")
+    
+    async with dwh_pool.acquire() as dwh_conn:
+        # Las de todos los lotes confirmados de la ejecución, también los de intentos anteriores
+        rangos: Dict[int, List[Tuple[date, date]]] = {}
+        acumular_rangos(rangos, await leer_noches_afectadas(dwh_conn, ejecucion.ejecucion_id))
+        await refrescar_ocupacion_diaria(dwh_conn, rangos, 'fact_ocupaciondiaria' in particionadas)
+        await borrar_noches_afectadas(dwh_conn, ejecucion.ejecucion_id)
+        # Incluye el hotel anterior de las reservas que cambiaron de hotel
+        hoteles = await dwh_conn.fetch(
+            "SELECT hotel_id_erp FROM Dim_Hotel WHERE hotel_key = ANY($1::bigint[])", list(rangos))
+        registrar_hoteles(h['hotel_id_erp'] for h in hoteles)
+    return estado['watermark']
+
 
+async def con_conexiones(erp_pool: asyncpg.Pool, dwh_pool: asyncpg.Pool, funcion, *args):
+    """Ejecuta funcion(erp_conn, dwh_conn, *args) con conexiones prestadas de los pools"""
+    async with erp_pool.acquire() as erp_conn, dwh_pool.acquire() as dwh_conn:
+        return await funcion(erp_conn, dwh_conn, *args)
 
-async def run_etl():
-    """Ejecuta el proceso ETL completo"""
+
+async def etl_dim_tiempo(dwh_pool: asyncpg.Pool):
+    """Completa Dim_Tiempo con el calendario fijo del DWH"""
+    start_date = datetime(2020, 1, 1)
+    end_date = datetime(2030, 12, 31)
+    async with dwh_pool.acquire() as dwh_conn:
+        await populate_dim_tiempo(dwh_conn, start_date, end_date)
+
+
+async def run_etl(full: bool = False, modo_carga: str = MODO_CARGA,
+                  paralelismo: int = PARALELISMO, reanudar: bool = False,
+                  etapas: Optional[Iterable[str]] = None,
+                  erp_pool: Optional[asyncpg.Pool] = None, dwh_pool: Optional[asyncpg.Pool] = None,
+                  bloquear: bool = True) -> Dict[str, float]:
+    """
+    Ejecuta el proceso ETL y devuelve la duración en segundos de cada etapa.
+    
+    Args:
+        full: Si es True re-extrae todas las filas del ERP ignorando los
+              watermarks (reconstrucción completa). Por defecto solo se
+              extraen filas nuevas o modificadas desde la última ejecución.
+        modo_carga: "copy" o "executemany" (ver cargar_filas)
+        paralelismo: Etapas independientes simultáneas y trabajadores de
+                     Fact_Reservas; también fija el tamaño de los pools.
+        reanudar: Continúa la última ejecución que no terminó desde sus
+                  checkpoints, con su modo y sus watermarks (full se ignora).
+                  Las etapas completadas no se repiten y las que cargan por
+                  lotes siguen desde el último lote confirmado.
+        etapas: Nombres de DEPENDENCIAS_ETAPAS a ejecutar (por defecto
+                todas). Solo se guardan los watermarks de esas etapas.
+        erp_pool, dwh_pool: Pools ya abiertos (los del demonio); si no se
+                            pasan se crean y se cierran al terminar.
+        bloquear: Toma el advisory lock del ETL durante la ejecución y
+                  lanza ETLEnCurso si otra instancia lo tiene. El demonio
+                  lo toma por su cuenta y pasa False.
+    """
+    nombres = list(DEPENDENCIAS_ETAPAS) if etapas is None else [e for e in DEPENDENCIAS_ETAPAS if e in set(etapas)]
     print("=" * 60)
-    print("INICIANDO PROCESO ETL")
+    if reanudar:
+        print(f"REANUDANDO PROCESO ETL (carga {modo_carga}, paralelismo {paralelismo})")
+    else:
+        print(f"INICIANDO PROCESO ETL ({'COMPLETO' if full else 'INCREMENTAL'}, "
+              f"carga {modo_carga}, paralelismo {paralelismo})")
+    if etapas is not None:
+        print(f"Etapas: {', '.join(nombres)}")
     print("=" * 60)
     
-    erp_conn = None
-    dwh_conn = None
+    pools_propios = erp_pool is None or dwh_pool is None
+    bloqueo_conn = None
+    ejecucion = None
+    
+    if bloquear:
+        bloqueo_conn = await get_dwh_connection()
+        if not await tomar_bloqueo(bloqueo_conn):
+            await bloqueo_conn.close()
+            raise ETLEnCurso(f"Otra instancia del ETL tiene el advisory lock {BLOQUEO_ETL}")
     
     try:
-        print("\n[1/8] Conectando a bases de datos...")
-        erp_conn = await get_erp_connection()
-        dwh_conn = await get_dwh_connection()
-        print("✓ Conexiones establecidas\n")
-        
-        print("[2/8] Poblando Dim_Tiempo...")
-        start_date = datetime(2020, 1, 1)
-        end_date = datetime(2030, 12, 31)
-        await populate_dim_tiempo(dwh_conn, start_date, end_date)
-        print("✓ Dim_Tiempo completada\n")
+        print("\n[1/3] Conectando a bases de datos...")
+        if pools_propios:
+            erp_pool = await get_erp_pool(paralelismo)
+            dwh_pool = await get_dwh_pool(paralelismo)
+        async with erp_pool.acquire() as erp_conn, dwh_pool.acquire() as dwh_conn:
+            if reanudar:
+                ejecucion = await reanudar_ejecucion(dwh_conn)
+                if ejecucion is None:
+                    print("  ⚠ No hay ejecución sin terminar para reanudar: se inicia una incremental")
+            if ejecucion is None:
+                watermarks, cambio_hasta = await obtener_watermarks(dwh_conn, erp_conn, full)
+                ejecucion = await iniciar_ejecucion(dwh_conn, full, watermarks, cambio_hasta)
+        watermarks, cambio_hasta = ejecucion.watermarks, ejecucion.cambio_hasta
+        print("✓ Pools de conexiones establecidos")
+        if ejecucion.reanudada:
+            print(f"✓ Reanudando la ejecución {ejecucion.ejecucion_id} "
+                  f"({'completa' if ejecucion.full else 'incremental'}; "
+                  f"etapas ya completadas: {', '.join(ejecucion.completadas) or 'ninguna'})\n")
+        else:
+            print(f"✓ Ejecución {ejecucion.ejecucion_id} registrada\n")
         
-        print("[3/8] Extrayendo y cargando Hoteles...")
-        hoteles = await extract_hoteles(erp_conn)
-        await load_dim_hotel(dwh_conn, hoteles)
-        print("✓ Dim_Hotel completada\n")
-        
-        print("[4/8] Extrayendo y cargando Tipos de Habitación...")
-        tipos = await extract_tipos_habitacion(erp_conn)
-        await load_dim_tipo_habitacion(dwh_conn, tipos)
-        print("✓ Dim_TipoHabitacion completada\n")
-        
-        print("[5/8] Extrayendo y cargando Huéspedes...")
-        huespedes = await extract_huespedes(erp_conn)
-        await load_dim_huesped(dwh_conn, huespedes)
-        print("✓ Dim_Huesped completada\n")
-        
-        print("[6/8] Obteniendo mapeos de dimensiones...")
-        dimension_keys = await get_dimension_keys(dwh_conn)
-        print("✓ Mapeos obtenidos\n")
-        
-        print("[7/8] Extrayendo Reservas con Pagos y Consumos...")
-        reservas = await extract_reservas_con_pagos(erp_conn)
-        print(f"✓ {len(reservas)} reservas extraídas\n")
+        print("[2/3] Ejecutando etapas...")
+        funciones = {
+            'dim_tiempo': lambda: etl_dim_tiempo(dwh_pool),
+            'dim_hotel': lambda: con_conexiones(
+                erp_pool, dwh_pool, etl_dim_hotel, watermarks['hoteles'], cambio_hasta, modo_carga),
+            'dim_tipo_habitacion': lambda: con_conexiones(
+                erp_pool, dwh_pool, etl_dim_tipo_habitacion, watermarks['tipos_habitacion'], cambio_hasta, modo_carga),
+            'dim_huesped': lambda: con_conexiones(
+                erp_pool, dwh_pool, etl_dim_huesped, watermarks['huespedes'], cambio_hasta, ejecucion, modo_carga),
+            'dim_servicio': lambda: con_conexiones(erp_pool, dwh_pool, etl_dim_servicio, modo_carga),
+            'fact_reservas': lambda: etl_fact_reservas(
+                erp_pool, dwh_pool, watermarks['reservas'], cambio_hasta, ejecucion, modo_carga, paralelismo),
+        }
+        # Las dependencias que no se ejecutan ya están cargadas de antes
+        etapas = [
+            Etapa(nombre, con_registro(dwh_pool, ejecucion, nombre, funciones[nombre]),
+                  depende_de=[d for d in DEPENDENCIAS_ETAPAS[nombre] if d in nombres])
+            for nombre in nombres
+        ]
+        resultados = await ejecutar_etapas(etapas, paralelismo)
+        print("✓ Etapas completadas")
+        for etapa in etapas:
+            for tabla, conteo in etapa.cambios.items():
+                print(f"  {tabla}: {conteo['insertadas']} insertadas, {conteo['actualizadas']} actualizadas, "
+                      f"{conteo['sin_cambios']} sin cambios")
+        print()
         
-        print("[8/8] Cargando Fact_Reservas...")
-        await load_fact_reservas(dwh_conn, reservas, dimension_keys)
-        print("✓ Fact_Reservas completada\n")
+        print("[3/3] Guardando watermarks y, si hubo cambios, publicando versión de datos y avisando a la API...")
+        async with dwh_pool.acquire() as dwh_conn:
+            # Las etapas saltadas al reanudar conservan las métricas de su intento
+            await guardar_metricas_etapas(
+                dwh_conn, [e for e in etapas if e.nombre not in ejecucion.completadas])
+            # Al reanudar no se sabe qué hoteles tocaron los intentos anteriores: el aviso vale para todos
+            hoteles = None if ejecucion.reanudada else set().union(*(etapa.hoteles for etapa in etapas))
+            # Sin filas escritas ni borradas la versión no cambia: la API conserva
+            # su cache, los ETags y la copia en memoria
+            publicar = ejecucion.reanudada or any(etapa.hubo_cambios() for etapa in etapas)
+            async with dwh_conn.transaction():
+                await guardar_watermarks(dwh_conn, {
+                    tabla: resultados[etapa] for etapa, tabla in WATERMARK_ETAPAS.items() if etapa in resultados
+                })
+                if publicar:
+                    version = await incrementar_version_datos(dwh_conn)
+                    await notificar_datos_actualizados(dwh_conn, version, hoteles)
+                else:
+                    version = await dwh_conn.fetchval("SELECT version FROM ETL_Version WHERE id = 1")
+                await terminar_ejecucion(dwh_conn, ejecucion.ejecucion_id, 'completada')
+        if publicar:
+            print(f"✓ Versión de datos del DWH: {version} "
+                  f"({'todos los hoteles' if hoteles is None else f'{len(hoteles)} hoteles con cambios'})\n")
+        else:
+            print(f"✓ Sin cambios en el DWH: se mantiene la versión de datos {version}\n")
         
         print("=" * 60)
         print("ETL COMPLETADO EXITOSAMENTE")
         print("=" * 60)
+        return {etapa.nombre: etapa.segundos for etapa in etapas}
         
     except Exception as e:
         print(f"\n✗ ERROR EN ETL: {e}")
+        if ejecucion is not None:
+            try:
+                async with dwh_pool.acquire() as dwh_conn:
+                    await terminar_ejecucion(dwh_conn, ejecucion.ejecucion_id, 'fallida', str(e))
+                print("  Los lotes confirmados quedan guardados; para seguir desde ahí: python etl.py --reanudar")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e_registro:
+                print(f"  ⚠ No se pudo marcar la ejecución {ejecucion.ejecucion_id} como fallida: {e_registro}")
         raise
         
     finally:
-        if erp_conn:
-            await erp_conn.close()
-        if dwh_conn:
-            await dwh_conn.close()
-        print("\nConexiones cerradas")
+        if pools_propios:
+            if erp_pool:
+                await erp_pool.close()
+            if dwh_pool:
+                await dwh_pool.close()
+        if bloqueo_conn is not None:
+            # Cerrar la sesión libera el advisory lock
+            await bloqueo_conn.close()
+        if pools_propios:
+            print("\nConexiones cerradas")
 
 
 if __name__ == "__main__":
-    asyncio.run(run_etl())
+    parser = argparse.ArgumentParser(description="ETL del ERP hotelero al Data Warehouse")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignora los watermarks y re-extrae todas las filas del ERP")
+    parser.add_argument("--modo-carga", choices=MODOS_CARGA, default=MODO_CARGA,
+                        help="Estrategia de carga al DWH (por defecto ETL_MODO_CARGA o copy)")
+    parser.add_argument("--paralelismo", type=int, default=PARALELISMO,
+                        help="Etapas simultáneas y trabajadores de Fact_Reservas (por defecto ETL_PARALELISMO o 4)")
+    parser.add_argument("--reanudar", action="store_true",
+                        help="Continúa la última ejecución sin terminar desde su último lote confirmado")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_etl(full=args.full, modo_carga=args.modo_carga, paralelismo=args.paralelismo,
+                            reanudar=args.reanudar))
+    except ETLEnCurso as e:
+        # Una ejecución de cron que se superpone con otra (o con el demonio) no hace nada
+        print(f"⚠ {e}; no se ejecuta")
+        raise SystemExit(1)
@@ -0,0 +1,265 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack
+from datetime import date
+from enum import Enum
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from database import get_connection
+from admision import CARRILES, ConsultaRechazada, identificar_cliente, limitar_cliente
+from calendario import parametros_periodo
+from metricas import EXPORTACION_FILAS
+
+# Filas por lote de Arrow y por row group de Parquet
+EXPORTACION_FILAS_POR_LOTE = int(os.getenv("EXPORTACION_FILAS_POR_LOTE", "50000"))
+# Una exportación es una sola sentencia larga (COPY) o muchos FETCH dentro
+# de una transacción: se le da su propio statement_timeout
+EXPORTACION_STATEMENT_TIMEOUT = os.getenv("EXPORTACION_STATEMENT_TIMEOUT", "10min")
+
+# Trozos de CSV que COPY puede adelantar mientras el cliente lee
+TROZOS_EN_COLA = 16
+
+
+class FormatoExportacion(str, Enum):
+    CSV = "csv"
+    ARROW = "arrow"
+    PARQUET = "parquet"
+
+
+TIPOS_CONTENIDO = {
+    FormatoExportacion.CSV: "text/csv; charset=utf-8",
+    FormatoExportacion.ARROW: "application/vnd.apache.arrow.stream",
+    FormatoExportacion.PARQUET: "application/vnd.apache.parquet",
+}
+
+# Columnas exportadas: (nombre, expresión SQL, tipo Arrow). Del huésped solo
+# se exportan el id y el país, no datos personales.
+COLUMNAS = [
+    ("reserva_id_erp", "fr.reserva_id_erp", pa.int64()),
+    ("hotel_id_erp", "dh.hotel_id_erp", pa.int64()),
+    ("hotel_nombre", "dh.nombre", pa.string()),
+    ("hotel_ciudad", "dh.ciudad", pa.string()),
+    ("tipo_habitacion", "dth.nombre_tipo", pa.string()),
+    ("canal", "dc.canal_nombre", pa.string()),
+    ("huesped_id_erp", "dhu.huesped_id_erp", pa.int64()),
+    ("huesped_pais", "dhu.pais_origen", pa.string()),
+    ("fecha_checkin", "ci.fecha", pa.date32()),
+    ("fecha_checkout", "co.fecha", pa.date32()),
+    ("fecha_creacion", "cr.fecha", pa.date32()),
+    ("noches_estadia", "fr.noches_estadia", pa.int32()),
+    ("numero_adultos", "fr.numero_adultos", pa.int32()),
+    ("numero_ninos", "fr.numero_ninos", pa.int32()),
+    ("precio_total_noche", "fr.precio_total_noche", pa.decimal128(10, 2)),
+    ("monto_total_reserva", "fr.monto_total_reserva", pa.decimal128(12, 2)),
+    ("monto_pagado", "fr.monto_pagado", pa.decimal128(12, 2)),
+    ("monto_consumos", "fr.monto_consumos", pa.decimal128(12, 2)),
+    ("estado_reserva", "fr.estado_reserva", pa.string()),
+]
+
+ESQUEMA = pa.schema([(nombre, tipo) for nombre, _, tipo in COLUMNAS])
+
+
+def _reservas_query(por_tiempo_id: bool, con_hotel: bool) -> str:
+    """
+    Fact_Reservas con sus dimensiones, filtrada por fecha de check-in (rango
+    de tiempo_id si el calendario es contiguo, así se podan particiones).
+    Sin ORDER BY: un orden obligaría a Postgres a leerlo todo antes de la
+    primera fila.
+    """
+    filtro_periodo = "fr.fecha_checkin_id BETWEEN $1 AND $2" if por_tiempo_id else "ci.fecha BETWEEN $1 AND $2"
+    filtro_hotel = "AND dh.hotel_id_erp = $3" if con_hotel else ""
+    return f"""
+        SELECT {", ".join(f"{expresion} AS {nombre}" for nombre, expresion, _ in COLUMNAS)}
+        FROM Fact_Reservas fr
+        JOIN Dim_Hotel dh ON fr.hotel_key = dh.hotel_key
+        JOIN Dim_TipoHabitacion dth ON fr.tipo_habitacion_key = dth.tipo_habitacion_key
+        JOIN Dim_Canal dc ON fr.canal_key = dc.canal_key
+        JOIN Dim_Huesped dhu ON fr.huesped_key = dhu.huesped_key
+        JOIN Dim_Tiempo ci ON fr.fecha_checkin_id = ci.tiempo_id
+        JOIN Dim_Tiempo co ON fr.fecha_checkout_id = co.tiempo_id
+        JOIN Dim_Tiempo cr ON fr.fecha_creacion_id = cr.tiempo_id
+        WHERE {filtro_periodo}
+          {filtro_hotel}
+    """
+
+
+class _Salida:
+    """
+    Archivo de solo escritura para los writers de pyarrow: acumula lo escrito
+    hasta que se vacía y lleva la posición total (Parquet la usa en el pie).
+    """
+
+    def __init__(self):
+        self._trozos: List[bytes] = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._trozos.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def _escribir_lote(writer, salida: _Salida, filas: List) -> bytes:
+    """Convierte un lote de filas en columnas Arrow, lo escribe y devuelve los bytes generados"""
+    columnas = [
+        pa.array([fila[i] for fila in filas], type=tipo)
+        for i, (_, _, tipo) in enumerate(COLUMNAS)
+    ]
+    writer.write_batch(pa.RecordBatch.from_arrays(columnas, schema=ESQUEMA))
+    return salida.vaciar()
+
+
+async def _copiar_csv(conn, query: str, params: List, enviar: Callable[[bytes], Awaitable[None]]):
+    """COPY ... TO STDOUT en CSV: Postgres arma las filas y asyncpg entrega los trozos a enviar()"""
+    resultado = await conn.copy_from_query(query, *params, output=enviar, format="csv", header=True)
+    EXPORTACION_FILAS.inc(FormatoExportacion.CSV.value, cantidad=int(resultado.split()[-1]))
+
+
+async def _escribir_arrow(conn, query: str, params: List, formato: FormatoExportacion,
+                          enviar: Callable[[bytes], Awaitable[None]]):
+    """
+    Lee con un cursor del lado del servidor y envía cada lote como un record
+    batch de Arrow IPC o un row group de Parquet. La conversión y la
+    compresión corren en un hilo para no frenar al resto de la API.
+    """
+    salida = _Salida()
+    if formato == FormatoExportacion.PARQUET:
+        writer = pq.ParquetWriter(salida, ESQUEMA)
+    else:
+        writer = pa.ipc.new_stream(salida, ESQUEMA)
+
+    cursor = await conn.cursor(query, *params)
+    while filas := await cursor.fetch(EXPORTACION_FILAS_POR_LOTE):
+        await enviar(await asyncio.to_thread(_escribir_lote, writer, salida, filas))
+        EXPORTACION_FILAS.inc(formato.value, cantidad=len(filas))
+    writer.close()
+    await enviar(salida.vaciar())
+
+
+async def _producir(recursos: AsyncExitStack, conn, query: str, params: List,
+                    formato: FormatoExportacion, enviar: Callable[[bytes], Awaitable[None]]):
+    """
+    Lee la exportación del DWH y al terminar libera conexión, turno y límite
+    del cliente. COPY y el cursor leen de una sola foto (la de su sentencia),
+    así que basta una transacción READ ONLY; la transacción es la que
+    mantiene vivo el cursor y acota el statement_timeout.
+    """
+    try:
+        async with conn.transaction(readonly=True):
+            await conn.execute("SELECT set_config('statement_timeout', $1, true)", EXPORTACION_STATEMENT_TIMEOUT)
+            if formato == FormatoExportacion.CSV:
+                await _copiar_csv(conn, query, params, enviar)
+            else:
+                await _escribir_arrow(conn, query, params, formato, enviar)
+    finally:
+        await recursos.aclose()
+
+
+class _Transmision:
+    """
+    Cuerpo de la respuesta. La lectura del DWH corre en su propia tarea y
+    deja los trozos en una cola acotada (si el cliente lee lento, COPY o el
+    cursor esperan). Si el cliente se desconecta, Starlette cancela el envío
+    con un cancel scope de anyio que también cancelaría cualquier limpieza
+    hecha ahí (ROLLBACK, devolver la conexión); por eso el cuerpo solo cancela
+    la tarea y es ella la que se limpia.
+    """
+
+    def __init__(self, recursos: AsyncExitStack, producir: Callable[[Callable], Awaitable[None]]):
+        self._recursos = recursos
+        self._producir = producir
+        self._tarea: Optional[asyncio.Task] = None
+        self._cola: asyncio.Queue = asyncio.Queue(maxsize=TROZOS_EN_COLA)
+
+    async def _encolar(self, trozo):
+        await self._cola.put(bytes(trozo))
+
+    async def _productor(self):
+        try:
+            await self._producir(self._encolar)
+        except Exception as e:
+            await self._cola.put(e)
+        else:
+            await self._cola.put(None)
+
+    async def trozos(self) -> AsyncIterator[bytes]:
+        self._tarea = asyncio.create_task(self._productor())
+        try:
+            while True:
+                trozo = await self._cola.get()
+                if trozo is None:
+                    break
+                if isinstance(trozo, Exception):
+                    raise trozo
+                yield trozo
+        finally:
+            self._tarea.cancel()
+
+    async def liberar(self):
+        """Tarea de fondo de la respuesta: espera la limpieza de la tarea, o libera si nunca empezó"""
+        if self._tarea is None:
+            await self._recursos.aclose()
+        else:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+
+
+async def exportar_reservas(
+    request: Request,
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int],
+    formato: FormatoExportacion
+) -> StreamingResponse:
+    """
+    Respuesta en streaming con las reservas cuyo check-in cae en el periodo.
+
+    El turno en el carril de exportación, el límite del cliente y la
+    conexión se toman antes de responder (un rechazo todavía puede ser un
+    429/503) y se liberan al terminar el envío o al desconectarse el cliente.
+    """
+    if fecha_fin < fecha_inicio:
+        raise HTTPException(400, "fecha_fin es anterior a fecha_inicio")
+
+    por_tiempo_id, params = await parametros_periodo(fecha_inicio, fecha_fin, hotel_id_erp)
+    query = _reservas_query(por_tiempo_id, bool(hotel_id_erp))
+
+    recursos = AsyncExitStack()
+    try:
+        await recursos.enter_async_context(limitar_cliente(identificar_cliente(request)))
+        await recursos.enter_async_context(CARRILES["exportacion"].turno())
+        conn = await recursos.enter_async_context(get_connection(lectura=True))
+    except ConsultaRechazada as e:
+        await recursos.aclose()
+        raise HTTPException(429 if e.motivo == "cliente" else 503, str(e)) from None
+
+    cuerpo = _Transmision(recursos, lambda enviar: _producir(recursos, conn, query, params, formato, enviar))
+
+    extension = "arrows" if formato == FormatoExportacion.ARROW else formato.value
+    nombre = f"reservas_{fecha_inicio}_{fecha_fin}" + (f"_hotel{hotel_id_erp}" if hotel_id_erp else "")
+    return StreamingResponse(
+        cuerpo.trozos(),
+        media_type=TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'},
+        background=BackgroundTask(cuerpo.liberar)
+    )
@@ -1,18 +1,37 @@
 import os
-from fastapi import FastAPI
+import asyncpg
+from datetime import date
+from typing import Optional
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from strawberry.fastapi import GraphQLRouter
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from schema import schema
-from database import get_pool, close_pool
+from persistidas import RouterGraphQL, registro_consultas
+from database import get_pool, close_pool, get_connection, estadisticas_pool, estado_replicas
+from cache import cache_kpis
+from admision import estadisticas_admision
+from exportacion import FormatoExportacion, exportar_reservas
+from suscripciones import difusor
+from calendario import obtener_calendario
+from columnar import KPIS_MOTOR, KPIS_MOTORES, obtener_ocupacion
+import metricas
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Maneja el ciclo de vida de la aplicación"""
+    if KPIS_MOTOR not in KPIS_MOTORES:
+        raise ValueError(f"Motor de KPIs desconocido: {KPIS_MOTOR}")
     await get_pool()
     print("✓ Pool de conexiones DWH inicializado")
+    calendario = await obtener_calendario()
+    print(f"✓ Calendario cargado ({len(calendario.ids)} fechas)")
+    if KPIS_MOTOR == "memoria":
+        await obtener_ocupacion()
+    await difusor.iniciar()
     yield
+    await difusor.detener()
     await close_pool()
     print("✓ Pool de conexiones DWH cerrado")
 
@@ -34,11 +53,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-graphql_app = GraphQLRouter(schema)
+graphql_app = RouterGraphQL(schema)
 
 app.include_router(graphql_app, prefix="/graphql")
 
 
+@app.get("/export/reservas")
+async def export_reservas(
+    request: Request,
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None,
+    formato: FormatoExportacion = FormatoExportacion.CSV
+):
+    """
+    Descarga masiva de Fact_Reservas con sus dimensiones, por fecha de
+    check-in, en CSV, Arrow IPC (stream) o Parquet. La respuesta se envía a
+    medida que se lee del DWH, sin armar el resultado en memoria.
+    """
+    return await exportar_reservas(request, fecha_inicio, fecha_fin, hotel_id_erp, formato)
+
+
+@app.middleware("http")
+async def contar_peticiones(request: Request, call_next):
+    """Cuenta peticiones por ruta declarada (no por URL, para acotar las series)"""
+    response = await call_next(request)
+    ruta = request.scope.get("route")
+    metricas.HTTP_PETICIONES.inc(
+        request.method, ruta.path if ruta else "desconocida", str(response.status_code))
+    return response
+
+
 @app.get("/")
 async def root():
     return {
@@ -54,6 +99,68 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/cache")
+async def cache_stats():
+    """Contadores del cache de resultados de hotelAnalytics y del registro de consultas persistidas"""
+    return {**cache_kpis.estadisticas(), "consultas_persistidas": len(registro_consultas)}
+
+
+@app.get("/admision")
+async def admision_stats():
+    """Consultas en curso y en espera por carril del control de admisión"""
+    return estadisticas_admision()
+
+
+async def actualizar_metricas_estado():
+    """Copia a las métricas el estado de los pools, de la admisión, del cache, de las suscripciones y del último ETL"""
+    for destino, estadisticas in estadisticas_pool().items():
+        for estado, valor in estadisticas.items():
+            metricas.POOL_CONEXIONES.fijar(valor, destino, estado)
+    for replica, disponible in estado_replicas().items():
+        metricas.REPLICA_DISPONIBLE.fijar(int(disponible), replica)
+
+    for carril, estadisticas in estadisticas_admision()["carriles"].items():
+        metricas.ADMISION_CONSULTAS.fijar(estadisticas["en_curso"], carril, "en_curso")
+        metricas.ADMISION_CONSULTAS.fijar(estadisticas["en_espera"], carril, "en_espera")
+
+    estadisticas = cache_kpis.estadisticas()
+    for evento in ("aciertos", "fallos", "coalescidas", "desalojos", "expiradas"):
+        metricas.CACHE_EVENTOS.fijar(estadisticas[evento], evento)
+    metricas.CACHE_ENTRADAS.fijar(estadisticas["entradas"], "guardadas")
+    metricas.CACHE_ENTRADAS.fijar(estadisticas["en_vuelo"], "en_vuelo")
+
+    estadisticas = difusor.estadisticas()
+    metricas.SUSCRIPCIONES.fijar(estadisticas["suscripciones"], "suscripciones")
+    metricas.SUSCRIPCIONES.fijar(estadisticas["vistas"], "vistas")
+
+    async with get_connection() as conn:
+        version = await conn.fetchval("SELECT version FROM ETL_Version WHERE id = 1")
+        try:
+            etapas = await conn.fetch("""
+                SELECT etapa, segundos, filas, insertadas, actualizadas, sin_cambios, ejecuciones,
+                       EXTRACT(EPOCH FROM fecha_ejecucion) AS fin
+                FROM ETL_MetricasEtapa
+            """)
+        except (asyncpg.UndefinedTableError, asyncpg.UndefinedColumnError):
+            etapas = []
+
+    metricas.DATOS_VERSION.fijar(version or 0)
+    for e in etapas:
+        metricas.ETL_ETAPA_SEGUNDOS.fijar(e['segundos'], e['etapa'])
+        metricas.ETL_ETAPA_FILAS.fijar(e['filas'], e['etapa'])
+        for cambio in ("insertadas", "actualizadas", "sin_cambios"):
+            metricas.ETL_ETAPA_CAMBIOS.fijar(e[cambio], e['etapa'], cambio)
+        metricas.ETL_ETAPA_EJECUCIONES.fijar(e['ejecuciones'], e['etapa'])
+        metricas.ETL_ETAPA_ULTIMA_EJECUCION.fijar(float(e['fin']), e['etapa'])
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas de la API y del ETL en formato de texto de Prometheus"""
+    await actualizar_metricas_estado()
+    return PlainTextResponse(metricas.registro.exponer(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
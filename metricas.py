@@ -0,0 +1,210 @@
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+from strawberry.extensions import SchemaExtension
+
+# Límites superiores de los buckets de latencia, en segundos
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatear(nombre: str, etiquetas: Sequence[str], valores: Sequence, valor: float) -> str:
+    if etiquetas:
+        pares = ",".join(f'{e}="{_escapar(v)}"' for e, v in zip(etiquetas, valores))
+        nombre = f"{nombre}{{{pares}}}"
+    return f"{nombre} {float(valor)!r}"
+
+
+class Metrica:
+    """Familia de series con el mismo nombre y distintos valores de etiquetas"""
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple, float] = {}
+
+    def fijar(self, valor: float, *valores):
+        """Fija el valor de una serie (medidores y contadores copiados de otra fuente)"""
+        self._valores[valores] = valor
+
+    def limpiar(self):
+        self._valores.clear()
+
+    def lineas(self) -> Iterator[str]:
+        for valores, valor in sorted(self._valores.items()):
+            yield _formatear(self.nombre, self.etiquetas, valores, valor)
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, *valores, cantidad: float = 1.0):
+        self._valores[valores] = self._valores.get(valores, 0.0) + cantidad
+
+
+class Medidor(Metrica):
+    tipo = "gauge"
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+        # Por serie: [cuentas por bucket (la última es +Inf), suma]
+        self._series: Dict[Tuple, List] = {}
+
+    def observar(self, valor: float, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+    def limpiar(self):
+        self._series.clear()
+
+    def lineas(self) -> Iterator[str]:
+        etiquetas_bucket = self.etiquetas + ("le",)
+        for valores, (cuentas, suma) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + (float("inf"),), cuentas):
+                acumulado += cuenta
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                yield _formatear(f"{self.nombre}_bucket", etiquetas_bucket, valores + (le,), acumulado)
+            yield _formatear(f"{self.nombre}_sum", self.etiquetas, valores, suma)
+            yield _formatear(f"{self.nombre}_count", self.etiquetas, valores, acumulado)
+
+
+class Registro:
+    """Conjunto de métricas expuestas en /metrics con el formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metricas: List[Metrica] = []
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        self._metricas.append(metrica)
+        return metrica
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+# API
+HTTP_PETICIONES = registro.registrar(Contador(
+    "bi_http_peticiones_total", "Peticiones HTTP atendidas", ("metodo", "ruta", "codigo")))
+GRAPHQL_OPERACIONES = registro.registrar(Contador(
+    "bi_graphql_operaciones_total", "Operaciones GraphQL ejecutadas", ("operacion", "resultado")))
+GRAPHQL_OPERACION_SEGUNDOS = registro.registrar(Histograma(
+    "bi_graphql_operacion_segundos", "Duración de cada operación GraphQL", ("operacion",)))
+GRAPHQL_RESOLVER_SEGUNDOS = registro.registrar(Histograma(
+    "bi_graphql_resolver_segundos", "Duración de los resolvers de campos raíz", ("campo",)))
+APQ_EVENTOS = registro.registrar(Contador(
+    "bi_apq_eventos_total", "Consultas persistidas: aciertos, registradas y no encontradas", ("evento",)))
+HTTP_NO_MODIFICADAS = registro.registrar(Contador(
+    "bi_http_no_modificadas_total", "Respuestas 304 a peticiones GraphQL con If-None-Match vigente"))
+SQL_CONSULTA_SEGUNDOS = registro.registrar(Histograma(
+    "bi_sql_consulta_segundos", "Duración de las consultas SQL de la API", ("consulta",)))
+EXPORTACION_FILAS = registro.registrar(Contador(
+    "bi_exportacion_filas_total", "Filas enviadas por /export/reservas", ("formato",)))
+SUSCRIPCIONES = registro.registrar(Medidor(
+    "bi_suscripciones", "Suscripciones GraphQL abiertas y vistas distintas que las atienden", ("estado",)))
+SUSCRIPCIONES_RECALCULOS = registro.registrar(Contador(
+    "bi_suscripciones_recalculos_total", "Vistas suscritas recalculadas, omitidas (sin hoteles afectados) o con error tras un aviso del ETL",
+    ("resultado",)))
+
+# Control de admisión de consultas analíticas
+ADMISION_RECHAZOS = registro.registrar(Contador(
+    "bi_admision_rechazos_total", "Peticiones rechazadas o canceladas por motivo (espera, cliente, plazo, desconexion)", ("motivo",)))
+ADMISION_ESPERA_SEGUNDOS = registro.registrar(Histograma(
+    "bi_admision_espera_segundos", "Espera por un turno en cada carril", ("carril",)))
+ADMISION_CONSULTAS = registro.registrar(Medidor(
+    "bi_admision_consultas", "Consultas en curso y en espera por carril", ("carril", "estado")))
+
+# Pools de conexiones al DWH (primario y réplicas de lectura)
+POOL_ESPERA_SEGUNDOS = registro.registrar(Histograma(
+    "bi_pool_espera_conexion_segundos", "Espera para obtener una conexión del pool", ("destino",)))
+POOL_CONEXIONES = registro.registrar(Medidor(
+    "bi_pool_conexiones", "Conexiones de cada pool por estado (abiertas, libres, max)", ("destino", "estado")))
+REPLICA_DISPONIBLE = registro.registrar(Medidor(
+    "bi_replica_disponible", "1 si la réplica de lectura responde y está al día con la versión de datos", ("replica",)))
+
+# Cache de resultados (copiado de cache_kpis.estadisticas() en cada lectura)
+CACHE_EVENTOS = registro.registrar(Contador(
+    "bi_cache_eventos_total", "Aciertos, fallos, coalescidas, desalojos y expiradas del cache", ("evento",)))
+CACHE_ENTRADAS = registro.registrar(Medidor(
+    "bi_cache_entradas", "Entradas guardadas y cálculos en vuelo del cache", ("estado",)))
+
+# ETL (leído de ETL_MetricasEtapa y ETL_Version en cada lectura)
+DATOS_VERSION = registro.registrar(Medidor(
+    "bi_datos_version", "Versión de datos del DWH publicada por el ETL"))
+ETL_ETAPA_SEGUNDOS = registro.registrar(Medidor(
+    "bi_etl_etapa_segundos", "Duración de la última ejecución de cada etapa del ETL", ("etapa",)))
+ETL_ETAPA_FILAS = registro.registrar(Medidor(
+    "bi_etl_etapa_filas", "Filas cargadas en la última ejecución de cada etapa del ETL", ("etapa",)))
+ETL_ETAPA_CAMBIOS = registro.registrar(Medidor(
+    "bi_etl_etapa_filas_cambio", "Filas insertadas, actualizadas y sin cambios en la última ejecución de cada etapa",
+    ("etapa", "cambio")))
+ETL_ETAPA_EJECUCIONES = registro.registrar(Contador(
+    "bi_etl_etapa_ejecuciones_total", "Ejecuciones completadas de cada etapa del ETL", ("etapa",)))
+ETL_ETAPA_ULTIMA_EJECUCION = registro.registrar(Medidor(
+    "bi_etl_etapa_ultima_ejecucion_timestamp_segundos", "Fin de la última ejecución de cada etapa", ("etapa",)))
+
+
+@contextmanager
+def medir(histograma: Histograma, *valores):
+    """Observa en el histograma la duración del bloque, aunque termine con error"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.observar(time.perf_counter() - inicio, *valores)
+
+
+class MetricasGraphQL(SchemaExtension):
+    """
+    Extensión de Strawberry que mide cada operación y los resolvers de los
+    campos raíz. Los campos anidados solo leen atributos y no se miden, para
+    no pagar un cronómetro por cada campo de cada resultado.
+    """
+
+    def on_operation(self):
+        inicio = time.perf_counter()
+        yield
+        operacion = self.execution_context.operation_name or "anonima"
+        resultado = self.execution_context.result
+        GRAPHQL_OPERACION_SEGUNDOS.observar(time.perf_counter() - inicio, operacion)
+        GRAPHQL_OPERACIONES.inc(operacion, "error" if resultado is None or resultado.errors else "ok")
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        if info.path.prev is not None:
+            return _next(root, info, *args, **kwargs)
+
+        inicio = time.perf_counter()
+        resultado = _next(root, info, *args, **kwargs)
+        if inspect.isawaitable(resultado):
+            return self._esperar(resultado, info.field_name, inicio)
+        GRAPHQL_RESOLVER_SEGUNDOS.observar(time.perf_counter() - inicio, info.field_name)
+        return resultado
+
+    async def _esperar(self, resultado, campo: str, inicio: float):
+        try:
+            return await resultado
+        finally:
+            GRAPHQL_RESOLVER_SEGUNDOS.observar(time.perf_counter() - inicio, campo)
@@ -0,0 +1,70 @@
+-- ================================================
+-- MIGRACIÓN: ejecuciones del ETL reanudables
+-- ================================================
+-- Agrega el registro de ejecuciones, etapas y checkpoints por lote que usa
+-- etl.py para confirmar cada lote junto con su avance:
+--
+--     psql -d bi_dwh -f migracion_ejecuciones.sql
+--
+-- No hace falta una carga completa: la próxima ejecución ya se registra, y
+-- si falla se continúa desde el último lote confirmado con
+-- python etl.py --reanudar.
+
+BEGIN;
+
+-- ETL_Ejecucion: Cada ejecución del ETL con los watermarks y el límite del
+-- registro de cambios con que empezó. Las que quedan en_curso o fallida se
+-- pueden reanudar con etl.py --reanudar.
+CREATE TABLE IF NOT EXISTS ETL_Ejecucion (
+    ejecucion_id BIGSERIAL PRIMARY KEY,
+    modo VARCHAR(20) NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'en_curso',
+    watermarks JSONB NOT NULL,
+    cambio_hasta BIGINT,
+    intentos INTEGER NOT NULL DEFAULT 1,
+    error TEXT,
+    inicio TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fin TIMESTAMPTZ,
+    CONSTRAINT chk_estado_ejecucion CHECK (estado IN ('en_curso', 'fallida', 'completada', 'abandonada'))
+);
+
+-- ETL_EjecucionEtapa: Estado de cada etapa de una ejecución y su resultado
+-- (el watermark alcanzado), que al reanudar reemplaza a volver a ejecutarla.
+CREATE TABLE IF NOT EXISTS ETL_EjecucionEtapa (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    etapa VARCHAR(50) NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    resultado JSONB,
+    inicio TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fin TIMESTAMPTZ,
+    PRIMARY KEY (ejecucion_id, etapa)
+);
+
+-- ETL_Checkpoint: Último id confirmado por partición (rango de ids) de las
+-- etapas que cargan por lotes. Cada lote se confirma en la misma transacción
+-- que su checkpoint.
+CREATE TABLE IF NOT EXISTS ETL_Checkpoint (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    etapa VARCHAR(50) NOT NULL,
+    particion INTEGER NOT NULL,
+    desde BIGINT,
+    hasta BIGINT,
+    ultimo_id BIGINT,
+    lotes BIGINT NOT NULL DEFAULT 0,
+    filas BIGINT NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ejecucion_id, etapa, particion)
+);
+
+-- ETL_NochesAfectadas: Noches por hotel que cambiaron en los lotes ya
+-- confirmados y que falta refrescar en Fact_OcupacionDiaria.
+CREATE TABLE IF NOT EXISTS ETL_NochesAfectadas (
+    ejecucion_id BIGINT NOT NULL REFERENCES ETL_Ejecucion(ejecucion_id) ON DELETE CASCADE,
+    hotel_key BIGINT NOT NULL,
+    desde DATE NOT NULL,
+    hasta DATE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_noches_afectadas_ejecucion ON ETL_NochesAfectadas(ejecucion_id);
+
+COMMIT;
@@ -0,0 +1,34 @@
+-- ================================================
+-- MIGRACIÓN: huella de contenido por fila (hash_fila)
+-- ================================================
+-- Agrega hash_fila a las dimensiones y a Fact_Reservas, y los conteos de
+-- insertadas/actualizadas/sin cambios a ETL_MetricasEtapa (que se crea si
+-- falta, como en migracion_metricas_etapas.sql). Se puede ejecutar antes o
+-- después de migracion_particiones.sql:
+--
+--     psql -d bi_dwh -f migracion_hash_filas.sql
+--
+-- Las filas existentes quedan con hash_fila NULL, así que la primera
+-- ejecución del ETL las reescribe una vez; desde ahí solo se escriben las
+-- filas cuyo contenido cambió en el ERP.
+
+BEGIN;
+
+ALTER TABLE Dim_Hotel ADD COLUMN IF NOT EXISTS hash_fila UUID;
+ALTER TABLE Dim_TipoHabitacion ADD COLUMN IF NOT EXISTS hash_fila UUID;
+ALTER TABLE Dim_Huesped ADD COLUMN IF NOT EXISTS hash_fila UUID;
+ALTER TABLE Fact_Reservas ADD COLUMN IF NOT EXISTS hash_fila UUID;
+
+CREATE TABLE IF NOT EXISTS ETL_MetricasEtapa (
+    etapa VARCHAR(50) PRIMARY KEY,
+    segundos DOUBLE PRECISION NOT NULL,
+    filas BIGINT NOT NULL DEFAULT 0,
+    ejecuciones BIGINT NOT NULL DEFAULT 0,
+    fecha_ejecucion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE ETL_MetricasEtapa ADD COLUMN IF NOT EXISTS insertadas BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ETL_MetricasEtapa ADD COLUMN IF NOT EXISTS actualizadas BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE ETL_MetricasEtapa ADD COLUMN IF NOT EXISTS sin_cambios BIGINT NOT NULL DEFAULT 0;
+
+COMMIT;
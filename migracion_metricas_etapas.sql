@@ -0,0 +1,22 @@
+-- ================================================
+-- MIGRACIÓN: métricas de etapas del ETL
+-- ================================================
+-- Agrega ETL_MetricasEtapa a un DWH existente. Cada ejecución del ETL deja
+-- ahí la duración y las filas de sus etapas y la API las expone en /metrics:
+--
+--     psql -d bi_dwh -f migracion_metricas_etapas.sql
+--
+-- La tabla se llena con la próxima ejecución del ETL; hasta entonces
+-- /metrics no trae series de etapas.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ETL_MetricasEtapa (
+    etapa VARCHAR(50) PRIMARY KEY,
+    segundos DOUBLE PRECISION NOT NULL,
+    filas BIGINT NOT NULL DEFAULT 0,
+    ejecuciones BIGINT NOT NULL DEFAULT 0,
+    fecha_ejecucion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMIT;
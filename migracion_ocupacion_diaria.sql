@@ -0,0 +1,30 @@
+-- ================================================
+-- MIGRACIÓN: rollup diario Fact_OcupacionDiaria
+-- ================================================
+-- Agrega Fact_OcupacionDiaria (sin particionar, como la creaba esta versión
+-- de dwh_schema.sql) a un DWH existente y la llena con una carga completa:
+--
+--     psql -d bi_dwh -f migracion_ocupacion_diaria.sql
+--     python etl.py --full
+--
+-- Va antes de migracion_particiones.sql, que convierte esta tabla en
+-- particionada.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS Fact_OcupacionDiaria (
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    tiempo_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    canal_key BIGINT NOT NULL REFERENCES Dim_Canal(canal_key),
+    estado_reserva VARCHAR(20) NOT NULL,
+
+    noches_vendidas INTEGER NOT NULL,
+    ingresos_habitacion DECIMAL(16, 4) NOT NULL,
+    reservas_llegadas INTEGER NOT NULL, -- reservas cuyo check-in cae en este día
+
+    PRIMARY KEY (hotel_key, tiempo_id, canal_key, estado_reserva)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_ocupacion_tiempo ON Fact_OcupacionDiaria(tiempo_id);
+
+COMMIT;
@@ -0,0 +1,69 @@
+-- ================================================
+-- MIGRACIÓN: hechos de pagos y consumos
+-- ================================================
+-- Agrega Dim_Servicio, Fact_Pagos y Fact_Consumos a un DWH existente:
+--
+--     psql -d bi_dwh -f migracion_pagos_consumos.sql
+--     python etl.py --full
+--
+-- La carga completa llena las tablas nuevas con todo el historial y
+-- corrige monto_pagado y monto_consumos de Fact_Reservas, que se
+-- multiplicaban en las reservas con varios pagos y varios consumos. Las
+-- cargas incrementales siguientes recargan los pagos y consumos de cada
+-- reserva que cambia en el ERP.
+--
+-- En el ERP conviene crear antes los índices por reserva_id de Pagos y
+-- ConsumosServicios (ver database-tables.sql).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS Dim_Servicio (
+    servicio_key BIGSERIAL PRIMARY KEY,
+    servicio_id_erp BIGINT NOT NULL UNIQUE,
+    hotel_id_erp BIGINT NOT NULL,
+    nombre_servicio VARCHAR(255) NOT NULL,
+    precio DECIMAL(10, 2),
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX IF NOT EXISTS idx_dim_servicio_hotel ON Dim_Servicio(hotel_id_erp);
+
+CREATE TABLE IF NOT EXISTS Fact_Pagos (
+    fact_pago_id BIGSERIAL PRIMARY KEY,
+    pago_id_erp BIGINT NOT NULL UNIQUE,
+    reserva_id_erp BIGINT NOT NULL,
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    fecha_pago_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    metodo_pago VARCHAR(30) NOT NULL,
+    estado_pago VARCHAR(20) NOT NULL,
+    monto DECIMAL(12, 2) NOT NULL,
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_pagos_reserva ON Fact_Pagos(reserva_id_erp);
+CREATE INDEX IF NOT EXISTS idx_fact_pagos_hotel_fecha ON Fact_Pagos(hotel_key, fecha_pago_id);
+CREATE INDEX IF NOT EXISTS idx_fact_pagos_fecha ON Fact_Pagos USING BRIN (fecha_pago_id);
+
+CREATE TABLE IF NOT EXISTS Fact_Consumos (
+    fact_consumo_id BIGSERIAL PRIMARY KEY,
+    consumo_id_erp BIGINT NOT NULL UNIQUE,
+    reserva_id_erp BIGINT NOT NULL,
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    servicio_key BIGINT NOT NULL REFERENCES Dim_Servicio(servicio_key),
+    fecha_consumo_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    cantidad INTEGER NOT NULL,
+    precio_total_consumo DECIMAL(10, 2) NOT NULL,
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_consumos_reserva ON Fact_Consumos(reserva_id_erp);
+CREATE INDEX IF NOT EXISTS idx_fact_consumos_hotel_fecha ON Fact_Consumos(hotel_key, fecha_consumo_id);
+CREATE INDEX IF NOT EXISTS idx_fact_consumos_fecha ON Fact_Consumos USING BRIN (fecha_consumo_id);
+
+COMMIT;
@@ -0,0 +1,184 @@
+-- ================================================
+-- MIGRACIÓN: Fact_Reservas y Fact_OcupacionDiaria particionadas por mes
+-- ================================================
+-- Convierte un DWH creado con la versión anterior de dwh_schema.sql (tablas
+-- de hechos sin particionar, con índices B-tree) al esquema particionado.
+-- Se ejecuta una sola vez, con el ETL detenido y después de
+-- migracion_ocupacion_diaria.sql (que crea el rollup que se particiona):
+--
+--     psql -d bi_dwh -f migracion_particiones.sql
+--
+-- Todo corre en una transacción: si algo falla el DWH queda como estaba.
+-- Las filas se copian conservando fact_reserva_id y la secuencia continúa
+-- desde el máximo. El ETL detecta las tablas particionadas por sí solo.
+
+BEGIN;
+
+-- Misma función que en dwh_schema.sql
+CREATE OR REPLACE FUNCTION crear_particiones_mensuales(tabla TEXT, desde DATE, hasta DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    inicio_mes DATE;
+    particion TEXT;
+    id_desde BIGINT;
+    id_hasta BIGINT;
+    creadas INTEGER := 0;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(lower(tabla))
+    ) THEN
+        RETURN 0;
+    END IF;
+
+    -- Serializa a los trabajadores del ETL que cargan lotes en paralelo
+    PERFORM pg_advisory_xact_lock(hashtext('crear_particiones_mensuales'));
+
+    FOR inicio_mes IN
+        SELECT generate_series(date_trunc('month', desde), date_trunc('month', hasta), INTERVAL '1 month')::date
+    LOOP
+        particion := lower(tabla) || '_' || to_char(inicio_mes, 'YYYYMM');
+        CONTINUE WHEN to_regclass(particion) IS NOT NULL;
+
+        SELECT MIN(tiempo_id) INTO id_desde
+        FROM Dim_Tiempo
+        WHERE fecha >= inicio_mes AND fecha < inicio_mes + INTERVAL '1 month';
+        CONTINUE WHEN id_desde IS NULL;
+
+        SELECT COALESCE(MIN(tiempo_id), (SELECT MAX(tiempo_id) + 1 FROM Dim_Tiempo)) INTO id_hasta
+        FROM Dim_Tiempo
+        WHERE fecha >= inicio_mes + INTERVAL '1 month';
+
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+                       particion, lower(tabla), id_desde, id_hasta);
+        creadas := creadas + 1;
+    END LOOP;
+    RETURN creadas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Los tiempo_id tienen que seguir el orden de las fechas para que cada mes
+-- sea un rango contiguo
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM (SELECT tiempo_id, LAG(tiempo_id) OVER (ORDER BY fecha) AS anterior FROM Dim_Tiempo) t
+        WHERE tiempo_id <= anterior
+    ) THEN
+        RAISE EXCEPTION 'Dim_Tiempo no tiene tiempo_id crecientes por fecha; no se puede particionar por rango';
+    END IF;
+END;
+$$;
+
+-- ------------------------------------------------
+-- Fact_Reservas
+-- ------------------------------------------------
+
+-- Liberar los nombres de la tabla, su secuencia y sus índices
+ALTER TABLE Fact_Reservas RENAME TO Fact_Reservas_sin_particionar;
+ALTER TABLE Fact_Reservas_sin_particionar RENAME CONSTRAINT fact_reservas_pkey TO fact_reservas_sin_particionar_pkey;
+ALTER TABLE Fact_Reservas_sin_particionar RENAME CONSTRAINT fact_reservas_reserva_id_erp_key TO fact_reservas_sin_particionar_reserva_id_erp_key;
+ALTER SEQUENCE fact_reservas_fact_reserva_id_seq RENAME TO fact_reservas_sin_particionar_fact_reserva_id_seq;
+
+DROP INDEX IF EXISTS idx_fact_reservas_hotel;
+DROP INDEX IF EXISTS idx_fact_reservas_tipo_habitacion;
+DROP INDEX IF EXISTS idx_fact_reservas_canal;
+DROP INDEX IF EXISTS idx_fact_reservas_huesped;
+DROP INDEX IF EXISTS idx_fact_reservas_checkin;
+DROP INDEX IF EXISTS idx_fact_reservas_checkout;
+DROP INDEX IF EXISTS idx_fact_reservas_creacion;
+DROP INDEX IF EXISTS idx_fact_reservas_estado;
+DROP INDEX IF EXISTS idx_fact_reservas_erp;
+DROP INDEX IF EXISTS idx_fact_reservas_hotel_fechas;
+DROP INDEX IF EXISTS idx_fact_reservas_fechas_estado;
+
+CREATE TABLE Fact_Reservas (
+    fact_reserva_id BIGSERIAL,
+    reserva_id_erp BIGINT NOT NULL,
+
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    tipo_habitacion_key BIGINT NOT NULL REFERENCES Dim_TipoHabitacion(tipo_habitacion_key),
+    canal_key BIGINT NOT NULL REFERENCES Dim_Canal(canal_key),
+    huesped_key BIGINT NOT NULL REFERENCES Dim_Huesped(huesped_key),
+    fecha_checkin_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    fecha_checkout_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    fecha_creacion_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+
+    monto_total_reserva DECIMAL(12, 2) NOT NULL,
+    monto_pagado DECIMAL(12, 2) DEFAULT 0,
+    monto_consumos DECIMAL(12, 2) DEFAULT 0,
+    noches_estadia INTEGER NOT NULL CHECK (noches_estadia > 0),
+    numero_adultos INTEGER NOT NULL,
+    numero_ninos INTEGER DEFAULT 0,
+    precio_total_noche DECIMAL(10, 2) NOT NULL,
+
+    estado_reserva VARCHAR(20) NOT NULL,
+
+    fecha_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hash_fila UUID,
+
+    PRIMARY KEY (fact_reserva_id, fecha_checkin_id),
+    UNIQUE (reserva_id_erp, fecha_checkin_id)
+) PARTITION BY RANGE (fecha_checkin_id);
+
+CREATE INDEX idx_fact_reservas_hotel_fechas ON Fact_Reservas(hotel_key, fecha_checkin_id, fecha_checkout_id);
+CREATE INDEX idx_fact_reservas_checkin ON Fact_Reservas USING BRIN (fecha_checkin_id);
+CREATE INDEX idx_fact_reservas_checkout ON Fact_Reservas USING BRIN (fecha_checkout_id);
+CREATE INDEX idx_fact_reservas_creacion ON Fact_Reservas USING BRIN (fecha_creacion_id);
+
+SELECT crear_particiones_mensuales('Fact_Reservas', MIN(ci.fecha), MAX(ci.fecha))
+FROM Fact_Reservas_sin_particionar fr
+JOIN Dim_Tiempo ci ON fr.fecha_checkin_id = ci.tiempo_id;
+
+-- Copiar en orden de check-in deja las filas agrupadas por fecha (mejor para BRIN)
+INSERT INTO Fact_Reservas
+SELECT * FROM Fact_Reservas_sin_particionar
+ORDER BY fecha_checkin_id;
+
+SELECT setval(
+    pg_get_serial_sequence('fact_reservas', 'fact_reserva_id'),
+    COALESCE(MAX(fact_reserva_id), 0) + 1,
+    false
+)
+FROM Fact_Reservas;
+
+DROP TABLE Fact_Reservas_sin_particionar;
+
+-- ------------------------------------------------
+-- Fact_OcupacionDiaria
+-- ------------------------------------------------
+
+ALTER TABLE Fact_OcupacionDiaria RENAME TO Fact_OcupacionDiaria_sin_particionar;
+ALTER TABLE Fact_OcupacionDiaria_sin_particionar RENAME CONSTRAINT fact_ocupaciondiaria_pkey TO fact_ocupaciondiaria_sin_particionar_pkey;
+DROP INDEX IF EXISTS idx_fact_ocupacion_tiempo;
+
+CREATE TABLE Fact_OcupacionDiaria (
+    hotel_key BIGINT NOT NULL REFERENCES Dim_Hotel(hotel_key),
+    tiempo_id BIGINT NOT NULL REFERENCES Dim_Tiempo(tiempo_id),
+    canal_key BIGINT NOT NULL REFERENCES Dim_Canal(canal_key),
+    estado_reserva VARCHAR(20) NOT NULL,
+
+    noches_vendidas INTEGER NOT NULL,
+    ingresos_habitacion DECIMAL(16, 4) NOT NULL,
+    reservas_llegadas INTEGER NOT NULL,
+
+    PRIMARY KEY (hotel_key, tiempo_id, canal_key, estado_reserva)
+) PARTITION BY RANGE (tiempo_id);
+
+CREATE INDEX idx_fact_ocupacion_tiempo ON Fact_OcupacionDiaria USING BRIN (tiempo_id);
+
+SELECT crear_particiones_mensuales('Fact_OcupacionDiaria', MIN(dt.fecha), MAX(dt.fecha))
+FROM Fact_OcupacionDiaria_sin_particionar o
+JOIN Dim_Tiempo dt ON o.tiempo_id = dt.tiempo_id;
+
+INSERT INTO Fact_OcupacionDiaria
+SELECT * FROM Fact_OcupacionDiaria_sin_particionar
+ORDER BY tiempo_id;
+
+DROP TABLE Fact_OcupacionDiaria_sin_particionar;
+
+COMMIT;
+
+ANALYZE Fact_Reservas;
+ANALYZE Fact_OcupacionDiaria;
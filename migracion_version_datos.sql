@@ -0,0 +1,22 @@
+-- ================================================
+-- MIGRACIÓN: versión de datos del DWH
+-- ================================================
+-- Agrega ETL_Version, que el ETL incrementa al publicar datos nuevos y la
+-- API usa en la clave de su cache de resultados:
+--
+--     psql -d bi_dwh -f migracion_version_datos.sql
+--
+-- Hay que aplicarla antes de levantar la API o ejecutar el ETL de esta
+-- versión: los dos leen la fila única de la tabla.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ETL_Version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO ETL_Version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- ================================================
+-- MIGRACIÓN: ETL incremental por watermarks
+-- ================================================
+-- Agrega ETL_Watermark a un DWH creado con una versión anterior de
+-- dwh_schema.sql:
+--
+--     psql -d bi_dwh -f migracion_watermark.sql
+--
+-- Sin watermarks guardados la primera ejecución de etl.py extrae todas las
+-- filas, como una --full; desde la siguiente solo extrae las nuevas o
+-- modificadas. Para detectar modificaciones el ERP necesita la tabla
+-- CambiosETL y sus triggers (ver database-tables.sql).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ETL_Watermark (
+    tabla VARCHAR(50) PRIMARY KEY,
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    ultimo_cambio_id BIGINT NOT NULL DEFAULT 0,
+    fecha_ultima_carga TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMIT;
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http import GraphQLRequestData
+from cache import obtener_version_datos
+from metricas import APQ_EVENTOS, HTTP_NO_MODIFICADAS
+
+# Documentos GraphQL recordados por hash (automatic persisted queries)
+APQ_MAX_CONSULTAS = int(os.getenv("APQ_MAX_CONSULTAS", "500"))
+# max-age de las respuestas GET; después el cliente o el CDN revalidan con If-None-Match
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+
+
+class ConsultaNoPersistida(Exception):
+    """El cliente mandó solo el hash y el documento no está en el registro"""
+
+
+class ConsultaPersistidaInvalida(Exception):
+    """extensions.persistedQuery mal formado o con un hash que no coincide con el documento"""
+
+
+class RegistroConsultas:
+    """LRU acotado sha256 -> documento GraphQL"""
+
+    def __init__(self, max_consultas: int = APQ_MAX_CONSULTAS):
+        self.max_consultas = max_consultas
+        self._documentos: "OrderedDict[str, str]" = OrderedDict()
+
+    def obtener(self, sha256: str) -> Optional[str]:
+        documento = self._documentos.get(sha256)
+        if documento is not None:
+            self._documentos.move_to_end(sha256)
+        return documento
+
+    def guardar(self, sha256: str, documento: str):
+        self._documentos[sha256] = documento
+        self._documentos.move_to_end(sha256)
+        while len(self._documentos) > self.max_consultas:
+            self._documentos.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._documentos)
+
+
+registro_consultas = RegistroConsultas()
+
+
+def resolver_persistida(datos: GraphQLRequestData) -> GraphQLRequestData:
+    """
+    Protocolo APQ de Apollo: con extensions.persistedQuery.sha256Hash y sin
+    query se busca el documento en el registro; con query se verifica el hash
+    y se registra para las siguientes peticiones.
+    """
+    persistida = (datos.extensions or {}).get("persistedQuery")
+    if not isinstance(persistida, dict):
+        return datos
+    sha256 = persistida.get("sha256Hash")
+    if persistida.get("version") != 1 or not isinstance(sha256, str):
+        raise ConsultaPersistidaInvalida("Unsupported persisted query version or missing sha256Hash")
+
+    if datos.query is None:
+        documento = registro_consultas.obtener(sha256)
+        if documento is None:
+            APQ_EVENTOS.inc("no_encontrada")
+            raise ConsultaNoPersistida()
+        APQ_EVENTOS.inc("acierto")
+        datos.query = documento
+    else:
+        if hashlib.sha256(datos.query.encode()).hexdigest() != sha256:
+            raise ConsultaPersistidaInvalida("provided sha does not match query")
+        APQ_EVENTOS.inc("registrada")
+        registro_consultas.guardar(sha256, datos.query)
+    return datos
+
+
+class RouterGraphQL(GraphQLRouter):
+    """
+    GraphQLRouter con consultas persistidas automáticas y cache HTTP.
+
+    El ETag combina la versión de datos del DWH con la petición (documento,
+    variables y operación), así un If-None-Match vigente se contesta con 304
+    sin ejecutar nada y un ETL nuevo invalida todos los ETag a la vez. Las
+    peticiones GET se pueden cachear en navegadores y CDN durante
+    HTTP_CACHE_MAX_AGE segundos.
+    """
+
+    def should_render_graphql_ide(self, request) -> bool:
+        # Un GET persistido no trae query pero tampoco pide GraphiQL
+        return "extensions" not in request.query_params and super().should_render_graphql_ide(request)
+
+    async def parse_http_body(self, request):
+        datos = await super().parse_http_body(request)
+        if isinstance(datos, list):
+            return [resolver_persistida(d) for d in datos]
+        return resolver_persistida(datos)
+
+    async def process_result(self, request: Request, result):
+        # Los errores (plazo vencido, cliente limitado...) no se deben cachear
+        if result.errors:
+            request.state.cacheable = False
+        return await super().process_result(request, result)
+
+    async def run(self, request, **kwargs):
+        if not isinstance(request, Request) or request.method not in ("GET", "POST"):
+            return await super().run(request, **kwargs)
+
+        etag = await self._etag(request)
+        cache_control = f"public, max-age={HTTP_CACHE_MAX_AGE}" if request.method == "GET" else "no-cache"
+        if etag in _etags_aceptados(request.headers.get("if-none-match")):
+            HTTP_NO_MODIFICADAS.inc()
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+        try:
+            response = await super().run(request, **kwargs)
+        except ConsultaNoPersistida:
+            # Mismo formato que Apollo Server para que el cliente reenvíe el documento
+            return JSONResponse({"errors": [{
+                "message": "PersistedQueryNotFound",
+                "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+            }]}, headers={"Cache-Control": "no-store"})
+        except ConsultaPersistidaInvalida as e:
+            return JSONResponse({"errors": [{"message": str(e)}]}, status_code=400,
+                                headers={"Cache-Control": "no-store"})
+
+        if response.status_code == 200 and getattr(request.state, "cacheable", True) \
+                and response.media_type == "application/json":
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = cache_control
+        else:
+            response.headers["Cache-Control"] = "no-store"
+        return response
+
+    async def _etag(self, request: Request) -> str:
+        if request.method == "GET":
+            peticion = json.dumps(sorted(request.query_params.multi_items())).encode()
+        else:
+            peticion = await request.body()
+        version = await obtener_version_datos()
+        return f'W/"v{version}-{hashlib.sha256(peticion).hexdigest()[:32]}"'
+
+
+def _etags_aceptados(if_none_match: Optional[str]) -> set:
+    if not if_none_match:
+        return set()
+    return {e.strip() for e in if_none_match.split(",")}
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+
+@dataclass
+class Etapa:
+    """Etapa del ETL con las etapas de las que depende"""
+    nombre: str
+    ejecutar: Callable[[], Awaitable[Any]]
+    depende_de: List[str] = field(default_factory=list)
+    segundos: Optional[float] = None
+    filas: int = 0
+    # Por tabla destino: filas insertadas, actualizadas y sin cambios
+    cambios: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # hotel_id_erp de los hoteles cuyos datos tocó la etapa (se avisan a la API)
+    hoteles: Set[int] = field(default_factory=set)
+    # Filas borradas del DWH porque ya no están en el ERP
+    borradas: int = 0
+
+    def total_cambios(self) -> Dict[str, int]:
+        total = {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 0}
+        for conteo in self.cambios.values():
+            for clave, valor in conteo.items():
+                total[clave] += valor
+        return total
+
+    def hubo_cambios(self) -> bool:
+        """Si la etapa escribió o borró alguna fila del DWH"""
+        total = self.total_cambios()
+        return bool(total['insertadas'] or total['actualizadas'] or self.borradas)
+
+
+# Etapa que se está ejecutando; las tareas que lanza una etapa heredan el contexto
+_etapa_actual: ContextVar[Optional[Etapa]] = ContextVar("etapa_actual", default=None)
+
+
+def registrar_filas(filas: int):
+    """Suma filas cargadas a la etapa en curso (no hace nada fuera de una etapa)"""
+    etapa = _etapa_actual.get()
+    if etapa is not None:
+        etapa.filas += filas
+
+
+def registrar_cambios(tabla: str, insertadas: int, actualizadas: int, sin_cambios: int):
+    """Suma a la etapa en curso el resultado de un upsert sobre `tabla`"""
+    etapa = _etapa_actual.get()
+    if etapa is None:
+        return
+    conteo = etapa.cambios.setdefault(tabla, {'insertadas': 0, 'actualizadas': 0, 'sin_cambios': 0})
+    conteo['insertadas'] += insertadas
+    conteo['actualizadas'] += actualizadas
+    conteo['sin_cambios'] += sin_cambios
+
+
+def registrar_borradas(filas: int):
+    """Suma a la etapa en curso filas borradas del DWH"""
+    etapa = _etapa_actual.get()
+    if etapa is not None:
+        etapa.borradas += filas
+
+
+def registrar_hoteles(hoteles: Iterable[int]):
+    """Anota en la etapa en curso los hoteles (hotel_id_erp) cuyos datos cambiaron"""
+    etapa = _etapa_actual.get()
+    if etapa is not None:
+        etapa.hoteles.update(hoteles)
+
+
+async def ejecutar_concurrentes(corrutinas: Iterable[Awaitable[Any]]) -> List[Any]:
+    """
+    Como asyncio.gather, pero si una corrutina falla cancela las demás antes
+    de propagar el error, para no dejar trabajo huérfano sobre pools que se
+    van a cerrar.
+    """
+    tareas = [asyncio.ensure_future(c) for c in corrutinas]
+    try:
+        return await asyncio.gather(*tareas)
+    except BaseException:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        raise
+
+
+def ordenar_etapas(etapas: List[Etapa]) -> List[Etapa]:
+    """Orden topológico de las etapas; falla ante dependencias desconocidas o ciclos"""
+    por_nombre = {e.nombre: e for e in etapas}
+    for etapa in etapas:
+        for dependencia in etapa.depende_de:
+            if dependencia not in por_nombre:
+                raise ValueError(f"La etapa {etapa.nombre} depende de {dependencia}, que no existe")
+
+    ordenadas: List[Etapa] = []
+    visitando = set()
+    visitadas = set()
+
+    def visitar(etapa: Etapa):
+        if etapa.nombre in visitadas:
+            return
+        if etapa.nombre in visitando:
+            raise ValueError(f"Dependencia circular en la etapa {etapa.nombre}")
+        visitando.add(etapa.nombre)
+        for dependencia in etapa.depende_de:
+            visitar(por_nombre[dependencia])
+        visitando.discard(etapa.nombre)
+        visitadas.add(etapa.nombre)
+        ordenadas.append(etapa)
+
+    for etapa in etapas:
+        visitar(etapa)
+    return ordenadas
+
+
+async def ejecutar_etapas(etapas: List[Etapa], paralelismo: int) -> Dict[str, Any]:
+    """
+    Ejecuta cada etapa en cuanto terminan sus dependencias, con a lo sumo
+    `paralelismo` etapas corriendo a la vez. Devuelve el resultado de cada
+    etapa por nombre y deja su duración en Etapa.segundos.
+    """
+    semaforo = asyncio.Semaphore(paralelismo)
+    tareas: Dict[str, asyncio.Future] = {}
+
+    async def correr(etapa: Etapa) -> Any:
+        await asyncio.gather(*(tareas[d] for d in etapa.depende_de))
+        async with semaforo:
+            print(f"▶ Etapa {etapa.nombre}")
+            _etapa_actual.set(etapa)
+            inicio = time.perf_counter()
+            resultado = await etapa.ejecutar()
+            etapa.segundos = time.perf_counter() - inicio
+            print(f"✓ Etapa {etapa.nombre} completada en {etapa.segundos:.2f}s")
+            return resultado
+
+    # Se crean en orden topológico para que las tareas de las dependencias ya existan
+    for etapa in ordenar_etapas(etapas):
+        tareas[etapa.nombre] = asyncio.ensure_future(correr(etapa))
+
+    nombres = list(tareas)
+    resultados = await ejecutar_concurrentes(tareas[n] for n in nombres)
+    return dict(zip(nombres, resultados))
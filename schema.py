@@ -1,8 +1,17 @@
+import os
 import strawberry
-from typing import Optional, List
-from datetime import date, datetime
+from strawberry.extensions import ParserCache, ValidationCache
+from enum import Enum
+from typing import AsyncGenerator, Dict, Optional, List, Tuple
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from database import get_connection
+from cache import cache_kpis, obtener_version_datos
+from admision import con_plazo, ejecutar, estimar_costo
+from calendario import obtener_calendario, parametros_periodo
+from columnar import KPIS_MOTOR, obtener_ocupacion
+from suscripciones import difusor
+from metricas import MetricasGraphQL, SQL_CONSULTA_SEGUNDOS, medir
 
 
 @strawberry.type
@@ -44,154 +53,818 @@ class ReservasPorEstado:
     porcentaje: float
 
 
-async def calcular_kpis(
-    fecha_inicio: date,
-    fecha_fin: date,
+@strawberry.input
+class PeriodoInput:
+    """Periodo a comparar en hotelAnalyticsLote"""
+    fecha_inicio: date
+    fecha_fin: date
+    etiqueta: Optional[str] = None
+
+
+@strawberry.type
+class VariacionPeriodo:
+    """Diferencia de un periodo contra el periodo base (el primero de la lista)"""
+    total_reservas: int
+    total_noches_vendidas: int
+    ingresos_totales_habitaciones: float
+    ingresos_porcentaje: Optional[float]  # None si el periodo base no tuvo ingresos
+    tasa_ocupacion: float  # puntos porcentuales
+    adr: float
+    revpar: float
+
+
+@strawberry.type
+class HotelAnalyticsPeriodo:
+    """KPIs de un hotel (o del portafolio) en uno de los periodos pedidos"""
+    etiqueta: Optional[str]
+    analytics: HotelAnalytics
+    variacion: Optional[VariacionPeriodo]
+
+
+@strawberry.enum
+class Granularidad(Enum):
+    """Tamaño de cada punto de una serie de KPIs"""
+    DIA = "day"
+    SEMANA = "week"
+    MES = "month"
+
+
+@strawberry.type
+class PuntoSerie:
+    """KPIs de un día, semana (ISO, desde el lunes) o mes de la serie"""
+    fecha_inicio: date
+    fecha_fin: date
+    total_reservas: int
+    total_noches_vendidas: int
+    total_noches_disponibles: int
+    ingresos_totales_habitaciones: float
+    tasa_ocupacion: float
+    adr: float
+    revpar: float
+
+
+@strawberry.type
+class SerieKPIs:
+    """Serie temporal de KPIs de un hotel o de todos los hoteles"""
     hotel_id_erp: Optional[int] = None
-) -> HotelAnalytics:
-    """Calcula los KPIs principales de BI"""
-    
-    async with get_connection() as conn:
-        base_query = """
-            WITH reservas_periodo AS (
-                SELECT 
-                    fr.*,
-                    dh.hotel_id_erp,
-                    dh.nombre as hotel_nombre,
-                    dh.numero_habitaciones_total,
-                    dc.canal_nombre,
-                    dt_checkin.fecha as fecha_checkin,
-                    dt_checkout.fecha as fecha_checkout
-                FROM Fact_Reservas fr
-                JOIN Dim_Hotel dh ON fr.hotel_key = dh.hotel_key
-                JOIN Dim_Canal dc ON fr.canal_key = dc.canal_key
-                JOIN Dim_Tiempo dt_checkin ON fr.fecha_checkin_id = dt_checkin.tiempo_id
-                JOIN Dim_Tiempo dt_checkout ON fr.fecha_checkout_id = dt_checkout.tiempo_id
-                WHERE dt_checkin.fecha >= $1 
-                  AND dt_checkout.fecha <= $2
-                  AND fr.estado_reserva IN ('confirmada', 'checkin', 'checkout')
-        """
-        
-        params = [fecha_inicio, fecha_fin]
-        
-        if hotel_id_erp:
-            base_query += " AND dh.hotel_id_erp = $3"
-            params.append(hotel_id_erp)
-        
-        base_query += ")"
-        
-        # KPIs principales
-        kpis_query = base_query + """
-            SELECT 
-                COUNT(*) as total_reservas,
-                SUM(noches_estadia) as total_noches_vendidas,
-                SUM(monto_total_reserva) as ingresos_totales,
-                MAX(hotel_id_erp) as hotel_id,
-                MAX(hotel_nombre) as hotel_nombre,
-                MAX(numero_habitaciones_total) as num_habitaciones
-            FROM reservas_periodo
-        """
-        
-        kpis = await conn.fetchrow(kpis_query, *params)
-        
-        if not kpis or kpis['total_reservas'] == 0:
-            return HotelAnalytics(
-                hotel_id_erp=hotel_id_erp,
-                hotel_nombre=None,
-                fecha_inicio=fecha_inicio,
-                fecha_fin=fecha_fin,
-                total_reservas=0,
-                total_noches_vendidas=0,
-                total_noches_disponibles=0,
-                ingresos_totales_habitaciones=0.0,
-                tasa_ocupacion=0.0,
-                adr=0.0,
-                revpar=0.0,
-                reservas_por_canal=[],
-                reservas_por_estado=[]
-            )
-        
-        # Calcular noches disponibles
-        dias_periodo = (fecha_fin - fecha_inicio).days + 1
-        
-        if hotel_id_erp:
-            total_noches_disponibles = kpis['num_habitaciones'] * dias_periodo
-        else:
-            total_hoteles_query = """
-                SELECT SUM(numero_habitaciones_total) as total_habitaciones
-                FROM Dim_Hotel
-            """
-            total_hab = await conn.fetchrow(total_hoteles_query)
-            total_noches_disponibles = total_hab['total_habitaciones'] * dias_periodo
-        
-        # Calcular KPIs
-        total_noches_vendidas = kpis['total_noches_vendidas'] or 0
-        ingresos_totales = float(kpis['ingresos_totales'] or 0)
-        
-        tasa_ocupacion = (total_noches_vendidas / total_noches_disponibles * 100) if total_noches_disponibles > 0 else 0
-        adr = (ingresos_totales / total_noches_vendidas) if total_noches_vendidas > 0 else 0
-        revpar = (ingresos_totales / total_noches_disponibles) if total_noches_disponibles > 0 else 0
-        
-        # Reservas por canal
-        canal_query = base_query + """
+    hotel_nombre: Optional[str] = None
+    fecha_inicio: date
+    fecha_fin: date
+    granularidad: Granularidad
+    puntos: List[PuntoSerie]
+
+
+@strawberry.type
+class PagosPorMetodo:
+    """Pagos de un medio de pago en el periodo"""
+    metodo_pago: str
+    cantidad_pagos: int  # completados
+    monto_cobrado: float
+    monto_pendiente: float
+    pagos_fallidos: int
+    porcentaje_monto: float  # sobre el monto cobrado del periodo
+
+
+@strawberry.type
+class MixPagos:
+    """Mix de medios de pago de un hotel o de todos los hoteles, por fecha de pago"""
+    hotel_id_erp: Optional[int] = None
+    hotel_nombre: Optional[str] = None
+    fecha_inicio: date
+    fecha_fin: date
+    
+    cantidad_pagos: int
+    monto_cobrado: float
+    monto_pendiente: float
+    pagos_fallidos: int
+    
+    pagos_por_metodo: List[PagosPorMetodo]
+
+
+@strawberry.type
+class ConsumosPorServicio:
+    """Consumos de un servicio adicional en el periodo"""
+    nombre_servicio: str
+    cantidad_consumos: int
+    unidades: int
+    ingresos: float
+    porcentaje: float  # sobre los ingresos adicionales del periodo
+
+
+@strawberry.type
+class IngresosAdicionales:
+    """Ingresos por servicios adicionales de un hotel o de todos los hoteles, por fecha de consumo"""
+    hotel_id_erp: Optional[int] = None
+    hotel_nombre: Optional[str] = None
+    fecha_inicio: date
+    fecha_fin: date
+    
+    ingresos_adicionales: float
+    ingresos_totales_habitaciones: float
+    porcentaje_sobre_habitaciones: float
+    ingreso_adicional_por_noche: float  # por noche vendida en el periodo
+    
+    consumos_por_servicio: List[ConsumosPorServicio]
+
+
+def _kpis_query(join_tiempo: str, filtro_periodo: str, filtro_hotel: str) -> str:
+    """
+    Consulta única de KPIs: totales, desglose por canal, desglose por estado
+    y habitaciones disponibles en un solo round-trip.
+    
+    Cada fila trae GROUPING(...) para distinguir el total general (0, 0) de
+    las filas por canal (0, 1) y por estado (1, 0).
+    """
+    return f"""
+        WITH ocupacion_periodo AS (
             SELECT 
+                o.*,
+                dh.hotel_id_erp,
+                dh.nombre as hotel_nombre,
+                dc.canal_nombre
+            FROM Fact_OcupacionDiaria o
+            JOIN Dim_Hotel dh ON o.hotel_key = dh.hotel_key
+            JOIN Dim_Canal dc ON o.canal_key = dc.canal_key
+            {join_tiempo}
+            WHERE {filtro_periodo}
+              AND o.estado_reserva IN ('confirmada', 'checkin', 'checkout')
+              {filtro_hotel.format(alias='dh.')}
+        ),
+        habitaciones AS (
+            SELECT SUM(numero_habitaciones_total) as total_habitaciones
+            FROM Dim_Hotel
+            WHERE TRUE {filtro_hotel.format(alias='')}
+        )
+        SELECT 
+            GROUPING(canal_nombre) as sin_canal,
+            GROUPING(estado_reserva) as sin_estado,
+            canal_nombre,
+            estado_reserva,
+            SUM(reservas_llegadas) as cantidad,
+            SUM(noches_vendidas) as noches_vendidas,
+            SUM(ingresos_habitacion) as ingresos,
+            MAX(hotel_id_erp) as hotel_id,
+            MAX(hotel_nombre) as hotel_nombre,
+            (SELECT total_habitaciones FROM habitaciones) as total_habitaciones
+        FROM ocupacion_periodo
+        GROUP BY GROUPING SETS ((), (canal_nombre), (estado_reserva))
+    """
+
+
+def filtros_periodo(columna: str) -> Dict[bool, Tuple[str, str]]:
+    """
+    Filtro del periodo sobre una columna de Dim_Tiempo: por rango de
+    tiempo_id resuelto con el calendario en memoria, o por fecha uniendo
+    Dim_Tiempo si los tiempo_id no son consecutivos.
+    """
+    return {
+        True: ("", f"{columna} BETWEEN $1 AND $2"),
+        False: (f"JOIN Dim_Tiempo dt ON {columna} = dt.tiempo_id", "dt.fecha BETWEEN $1 AND $2"),
+    }
+
+
+FILTROS_PERIODO = filtros_periodo("o.tiempo_id")
+
+# Texto SQL constante: asyncpg prepara cada sentencia una sola vez por conexión
+# (cache de sentencias) y la reutiliza en las siguientes peticiones.
+KPIS_QUERIES = {
+    (por_tiempo_id, con_hotel): _kpis_query(
+        *FILTROS_PERIODO[por_tiempo_id],
+        "AND {alias}hotel_id_erp = $3" if con_hotel else ""
+    )
+    for por_tiempo_id in (True, False)
+    for con_hotel in (True, False)
+}
+
+
+def _kpis_lote_query(tipo_periodo: str, join_periodo: str) -> str:
+    """
+    KPIs de varios hoteles y varios periodos en una sola consulta.
+
+    $1..$3 son los periodos (índice, desde, hasta) como arrays paralelos, $4
+    los hotel_id_erp a incluir (NULL = todos) y $5 indica si se agrupa por
+    hotel o se suma el portafolio completo. Cada (periodo, grupo) devuelve las
+    mismas filas que _kpis_query; los pares sin ocupación vuelven con una
+    sola fila de columnas nulas gracias al LEFT JOIN final.
+    """
+    return f"""
+        WITH periodos AS (
+            SELECT *
+            FROM unnest($1::int[], $2::{tipo_periodo}[], $3::{tipo_periodo}[]) AS p(periodo, desde, hasta)
+        ),
+        hoteles AS (
+            SELECT
+                hotel_key,
+                hotel_id_erp,
+                nombre,
+                numero_habitaciones_total,
+                CASE WHEN $5::boolean THEN hotel_id_erp END as grupo
+            FROM Dim_Hotel
+            WHERE $4::bigint[] IS NULL OR hotel_id_erp = ANY($4::bigint[])
+        ),
+        habitaciones AS (
+            SELECT grupo, SUM(numero_habitaciones_total) as total_habitaciones
+            FROM hoteles
+            GROUP BY grupo
+        ),
+        ocupacion_periodo AS (
+            SELECT
+                p.periodo,
+                h.grupo,
+                h.hotel_id_erp,
+                h.nombre as hotel_nombre,
+                dc.canal_nombre,
+                o.estado_reserva,
+                o.reservas_llegadas,
+                o.noches_vendidas,
+                o.ingresos_habitacion
+            FROM periodos p
+            {join_periodo}
+            JOIN hoteles h ON o.hotel_key = h.hotel_key
+            JOIN Dim_Canal dc ON o.canal_key = dc.canal_key
+            WHERE o.estado_reserva IN ('confirmada', 'checkin', 'checkout')
+        ),
+        agregado AS (
+            SELECT
+                periodo,
+                grupo,
+                GROUPING(canal_nombre) as sin_canal,
+                GROUPING(estado_reserva) as sin_estado,
                 canal_nombre,
-                COUNT(*) as cantidad,
-                SUM(monto_total_reserva) as ingresos
-            FROM reservas_periodo
-            GROUP BY canal_nombre
-            ORDER BY cantidad DESC
-        """
-        
-        canales = await conn.fetch(canal_query, *params)
-        total_reservas = kpis['total_reservas']
-        
-        reservas_por_canal = [
-            ReservasPorCanal(
-                canal_nombre=c['canal_nombre'],
-                cantidad_reservas=c['cantidad'],
-                ingresos_totales=float(c['ingresos'] or 0),
-                porcentaje=round(c['cantidad'] / total_reservas * 100, 2) if total_reservas > 0 else 0
-            )
-            for c in canales
-        ]
-        
-        # Reservas por estado
-        estado_query = base_query + """
-            SELECT 
                 estado_reserva,
-                COUNT(*) as cantidad
-            FROM reservas_periodo
-            GROUP BY estado_reserva
-            ORDER BY cantidad DESC
-        """
-        
-        estados = await conn.fetch(estado_query, *params)
-        
-        reservas_por_estado = [
-            ReservasPorEstado(
-                estado=e['estado_reserva'],
-                cantidad=e['cantidad'],
-                porcentaje=round(e['cantidad'] / total_reservas * 100, 2) if total_reservas > 0 else 0
+                SUM(reservas_llegadas) as cantidad,
+                SUM(noches_vendidas) as noches_vendidas,
+                SUM(ingresos_habitacion) as ingresos,
+                MAX(hotel_id_erp) as hotel_id,
+                MAX(hotel_nombre) as hotel_nombre
+            FROM ocupacion_periodo
+            GROUP BY GROUPING SETS (
+                (periodo, grupo),
+                (periodo, grupo, canal_nombre),
+                (periodo, grupo, estado_reserva)
             )
-            for e in estados
-        ]
-        
+        )
+        SELECT
+            p.periodo,
+            hab.grupo,
+            a.sin_canal,
+            a.sin_estado,
+            a.canal_nombre,
+            a.estado_reserva,
+            a.cantidad,
+            a.noches_vendidas,
+            a.ingresos,
+            a.hotel_id,
+            a.hotel_nombre,
+            hab.total_habitaciones
+        FROM periodos p
+        CROSS JOIN habitaciones hab
+        LEFT JOIN agregado a
+            ON a.periodo = p.periodo AND a.grupo IS NOT DISTINCT FROM hab.grupo
+    """
+
+
+KPIS_LOTE_QUERIES = {
+    True: _kpis_lote_query(
+        "bigint",
+        "JOIN Fact_OcupacionDiaria o ON o.tiempo_id BETWEEN p.desde AND p.hasta"
+    ),
+    False: _kpis_lote_query(
+        "date",
+        "JOIN Dim_Tiempo dt ON dt.fecha BETWEEN p.desde AND p.hasta\n"
+        "            JOIN Fact_OcupacionDiaria o ON o.tiempo_id = dt.tiempo_id"
+    ),
+}
+
+
+def _serie_query(filtro_periodo: str, filtro_hotel: str, granularidad: str) -> str:
+    """
+    Serie de KPIs agrupada por día, semana o mes en una sola consulta.
+
+    Fact_OcupacionDiaria ya tiene las noches e ingresos repartidos por día de
+    estadía, así que cada punto es una suma sobre el rollup. La fila de
+    habitaciones sale siempre, aunque el periodo no tenga ocupación.
+    """
+    return f"""
+        WITH ocupacion AS (
+            SELECT
+                date_trunc('{granularidad}', dt.fecha)::date as periodo,
+                SUM(o.reservas_llegadas) as cantidad,
+                SUM(o.noches_vendidas) as noches_vendidas,
+                SUM(o.ingresos_habitacion) as ingresos
+            FROM Fact_OcupacionDiaria o
+            JOIN Dim_Hotel dh ON o.hotel_key = dh.hotel_key
+            JOIN Dim_Tiempo dt ON o.tiempo_id = dt.tiempo_id
+            WHERE {filtro_periodo}
+              AND o.estado_reserva IN ('confirmada', 'checkin', 'checkout')
+              {filtro_hotel.format(alias='dh.')}
+            GROUP BY 1
+        ),
+        habitaciones AS (
+            SELECT
+                SUM(numero_habitaciones_total) as total_habitaciones,
+                MAX(nombre) as hotel_nombre
+            FROM Dim_Hotel
+            WHERE TRUE {filtro_hotel.format(alias='')}
+        )
+        SELECT h.total_habitaciones, h.hotel_nombre, o.*
+        FROM habitaciones h
+        LEFT JOIN ocupacion o ON TRUE
+    """
+
+
+SERIE_QUERIES = {
+    (por_tiempo_id, con_hotel, granularidad): _serie_query(
+        FILTROS_PERIODO[por_tiempo_id][1],
+        "AND {alias}hotel_id_erp = $3" if con_hotel else "",
+        granularidad.value
+    )
+    for por_tiempo_id in (True, False)
+    for con_hotel in (True, False)
+    for granularidad in Granularidad
+}
+
+
+def _pagos_query(join_tiempo: str, filtro_periodo: str, filtro_hotel: str) -> str:
+    """
+    Mix de medios de pago desde Fact_Pagos: el total del periodo y una fila
+    por medio de pago, que se distinguen por GROUPING(metodo_pago).
+    """
+    return f"""
+        SELECT
+            GROUPING(fp.metodo_pago) as sin_metodo,
+            fp.metodo_pago,
+            COUNT(*) FILTER (WHERE fp.estado_pago = 'completado') as pagos,
+            SUM(fp.monto) FILTER (WHERE fp.estado_pago = 'completado') as cobrado,
+            SUM(fp.monto) FILTER (WHERE fp.estado_pago = 'pendiente') as pendiente,
+            COUNT(*) FILTER (WHERE fp.estado_pago = 'fallido') as fallidos,
+            MAX(dh.nombre) as hotel_nombre
+        FROM Fact_Pagos fp
+        JOIN Dim_Hotel dh ON fp.hotel_key = dh.hotel_key
+        {join_tiempo}
+        WHERE {filtro_periodo}
+          {filtro_hotel}
+        GROUP BY GROUPING SETS ((), (fp.metodo_pago))
+    """
+
+
+PAGOS_QUERIES = {
+    (por_tiempo_id, con_hotel): _pagos_query(
+        *filtros_periodo("fp.fecha_pago_id")[por_tiempo_id],
+        "AND dh.hotel_id_erp = $3" if con_hotel else ""
+    )
+    for por_tiempo_id in (True, False)
+    for con_hotel in (True, False)
+}
+
+
+def _servicios_query(filtro_consumos: Tuple[str, str], filtro_ocupacion: Tuple[str, str],
+                     filtro_hotel: str) -> str:
+    """
+    Ingresos por servicios adicionales desde Fact_Consumos (total y una fila
+    por servicio) junto con las noches e ingresos de habitación del mismo
+    periodo, tomados del rollup como en _kpis_query.
+    """
+    return f"""
+        WITH consumos AS (
+            SELECT
+                GROUPING(ds.nombre_servicio) as sin_servicio,
+                ds.nombre_servicio,
+                COUNT(*) as consumos,
+                SUM(fc.cantidad) as unidades,
+                SUM(fc.precio_total_consumo) as ingresos,
+                MAX(dh.nombre) as hotel_nombre
+            FROM Fact_Consumos fc
+            JOIN Dim_Hotel dh ON fc.hotel_key = dh.hotel_key
+            JOIN Dim_Servicio ds ON fc.servicio_key = ds.servicio_key
+            {filtro_consumos[0]}
+            WHERE {filtro_consumos[1]}
+              {filtro_hotel}
+            GROUP BY GROUPING SETS ((), (ds.nombre_servicio))
+        ),
+        habitaciones AS (
+            SELECT
+                SUM(o.noches_vendidas) as noches_vendidas,
+                SUM(o.ingresos_habitacion) as ingresos_habitacion
+            FROM Fact_OcupacionDiaria o
+            JOIN Dim_Hotel dh ON o.hotel_key = dh.hotel_key
+            {filtro_ocupacion[0]}
+            WHERE {filtro_ocupacion[1]}
+              AND o.estado_reserva IN ('confirmada', 'checkin', 'checkout')
+              {filtro_hotel}
+        )
+        SELECT c.*, h.noches_vendidas, h.ingresos_habitacion
+        FROM consumos c
+        CROSS JOIN habitaciones h
+    """
+
+
+SERVICIOS_QUERIES = {
+    (por_tiempo_id, con_hotel): _servicios_query(
+        filtros_periodo("fc.fecha_consumo_id")[por_tiempo_id],
+        FILTROS_PERIODO[por_tiempo_id],
+        "AND dh.hotel_id_erp = $3" if con_hotel else ""
+    )
+    for por_tiempo_id in (True, False)
+    for con_hotel in (True, False)
+}
+
+
+async def calcular_kpis(
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None
+) -> HotelAnalytics:
+    """
+    Calcula los KPIs principales de BI desde el rollup Fact_OcupacionDiaria.
+    
+    Las noches vendidas y los ingresos son los de las noches que caen dentro
+    del periodo, aunque la estadía empiece antes o termine después. Las
+    reservas se cuentan por su día de check-in.
+    
+    Con KPIS_MOTOR=memoria las mismas filas salen de la copia columnar del
+    rollup (columnar.py) en lugar del DWH.
+    """
+    
+    if KPIS_MOTOR == "memoria":
+        ocupacion = await obtener_ocupacion()
+        filas = ocupacion.filas_kpis(fecha_inicio, fecha_fin, hotel_id_erp)
+        return construir_analytics(filas, fecha_inicio, fecha_fin, hotel_id_erp)
+    
+    filas = await _consultar_periodo(KPIS_QUERIES, 'kpis', fecha_inicio, fecha_fin, hotel_id_erp)
+    return construir_analytics(filas, fecha_inicio, fecha_fin, hotel_id_erp)
+
+
+def construir_analytics(
+    filas: List,
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None
+) -> HotelAnalytics:
+    """
+    Arma HotelAnalytics a partir de las filas de GROUPING SETS de un grupo
+    (total general, filas por canal y filas por estado).
+    """
+    kpis = next((f for f in filas if f['sin_canal'] and f['sin_estado']), None)
+    # Desempate por nombre: las filas de GROUPING SETS (o del motor en memoria) no traen orden
+    canales = sorted((f for f in filas if not f['sin_canal']), key=lambda f: (-f['cantidad'], f['canal_nombre']))
+    estados = sorted((f for f in filas if not f['sin_estado']), key=lambda f: (-f['cantidad'], f['estado_reserva']))
+    
+    if kpis is None or kpis['noches_vendidas'] is None:
         return HotelAnalytics(
-            hotel_id_erp=kpis['hotel_id'],
-            hotel_nombre=kpis['hotel_nombre'],
+            hotel_id_erp=hotel_id_erp,
+            hotel_nombre=None,
             fecha_inicio=fecha_inicio,
             fecha_fin=fecha_fin,
-            total_reservas=total_reservas,
-            total_noches_vendidas=total_noches_vendidas,
-            total_noches_disponibles=total_noches_disponibles,
-            ingresos_totales_habitaciones=ingresos_totales,
-            tasa_ocupacion=round(tasa_ocupacion, 2),
-            adr=round(adr, 2),
-            revpar=round(revpar, 2),
-            reservas_por_canal=reservas_por_canal,
-            reservas_por_estado=reservas_por_estado
+            total_reservas=0,
+            total_noches_vendidas=0,
+            total_noches_disponibles=0,
+            ingresos_totales_habitaciones=0.0,
+            tasa_ocupacion=0.0,
+            adr=0.0,
+            revpar=0.0,
+            reservas_por_canal=[],
+            reservas_por_estado=[]
+        )
+    
+    # Calcular noches disponibles
+    dias_periodo = (fecha_fin - fecha_inicio).days + 1
+    total_noches_disponibles = (kpis['total_habitaciones'] or 0) * dias_periodo
+    
+    # Calcular KPIs
+    total_noches_vendidas = kpis['noches_vendidas'] or 0
+    ingresos_totales = round(float(kpis['ingresos'] or 0), 2)
+    
+    tasa_ocupacion = (total_noches_vendidas / total_noches_disponibles * 100) if total_noches_disponibles > 0 else 0
+    adr = (ingresos_totales / total_noches_vendidas) if total_noches_vendidas > 0 else 0
+    revpar = (ingresos_totales / total_noches_disponibles) if total_noches_disponibles > 0 else 0
+    
+    total_reservas = kpis['cantidad']
+    
+    # Reservas por canal
+    reservas_por_canal = [
+        ReservasPorCanal(
+            canal_nombre=c['canal_nombre'],
+            cantidad_reservas=c['cantidad'],
+            ingresos_totales=round(float(c['ingresos'] or 0), 2),
+            porcentaje=round(c['cantidad'] / total_reservas * 100, 2) if total_reservas > 0 else 0
         )
+        for c in canales
+    ]
+    
+    # Reservas por estado
+    reservas_por_estado = [
+        ReservasPorEstado(
+            estado=e['estado_reserva'],
+            cantidad=e['cantidad'],
+            porcentaje=round(e['cantidad'] / total_reservas * 100, 2) if total_reservas > 0 else 0
+        )
+        for e in estados
+    ]
+    
+    return HotelAnalytics(
+        hotel_id_erp=kpis['hotel_id'],
+        hotel_nombre=kpis['hotel_nombre'],
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        total_reservas=total_reservas,
+        total_noches_vendidas=total_noches_vendidas,
+        total_noches_disponibles=total_noches_disponibles,
+        ingresos_totales_habitaciones=ingresos_totales,
+        tasa_ocupacion=round(tasa_ocupacion, 2),
+        adr=round(adr, 2),
+        revpar=round(revpar, 2),
+        reservas_por_canal=reservas_por_canal,
+        reservas_por_estado=reservas_por_estado
+    )
+
+
+async def calcular_kpis_cacheado(
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None
+) -> HotelAnalytics:
+    """calcular_kpis a través del cache de resultados versionado por ETL y del control de admisión"""
+    # Con KPIS_MOTOR=memoria no se consulta el DWH: el control de admisión no aplica
+    return await calcular_periodo_cacheado('hotel_analytics', calcular_kpis, fecha_inicio, fecha_fin,
+                                           hotel_id_erp, admision=KPIS_MOTOR != "memoria")
+
+
+def calcular_variacion(actual: HotelAnalytics, base: HotelAnalytics) -> VariacionPeriodo:
+    """Diferencias de un periodo contra el periodo base"""
+    ingresos_base = base.ingresos_totales_habitaciones
+    ingresos = actual.ingresos_totales_habitaciones
+    return VariacionPeriodo(
+        total_reservas=actual.total_reservas - base.total_reservas,
+        total_noches_vendidas=actual.total_noches_vendidas - base.total_noches_vendidas,
+        ingresos_totales_habitaciones=round(ingresos - ingresos_base, 2),
+        ingresos_porcentaje=round((ingresos - ingresos_base) / ingresos_base * 100, 2) if ingresos_base else None,
+        tasa_ocupacion=round(actual.tasa_ocupacion - base.tasa_ocupacion, 2),
+        adr=round(actual.adr - base.adr, 2),
+        revpar=round(actual.revpar - base.revpar, 2)
+    )
+
+
+async def calcular_kpis_lote(
+    periodos: List[tuple],
+    hotel_ids_erp: Optional[List[int]] = None
+) -> List[HotelAnalyticsPeriodo]:
+    """
+    KPIs de cada hotel en cada periodo con una sola consulta al DWH.
+
+    periodos es una lista de (fecha_inicio, fecha_fin, etiqueta); el primero
+    es la base contra la que se calculan las variaciones. Sin hotel_ids_erp
+    se devuelve el total del portafolio por periodo. El resultado va ordenado
+    por hotel (en el orden pedido) y luego por periodo.
+    """
+    if not periodos:
+        return []
+
+    calendario = await obtener_calendario()
+    rangos = [calendario.rango_ids(inicio, fin) for inicio, fin, _ in periodos]
+    por_tiempo_id = calendario.contiguo
+    if por_tiempo_id:
+        desde = [r[0] for r in rangos]
+        hasta = [r[1] for r in rangos]
+    else:
+        desde = [inicio for inicio, _, _ in periodos]
+        hasta = [fin for _, fin, _ in periodos]
+
+    por_hotel = hotel_ids_erp is not None
+    grupos = list(dict.fromkeys(hotel_ids_erp)) if por_hotel else [None]
+
+    async with get_connection(lectura=True) as conn:
+        with medir(SQL_CONSULTA_SEGUNDOS, 'kpis_lote'):
+            filas = await conn.fetch(
+                KPIS_LOTE_QUERIES[por_tiempo_id],
+                list(range(len(periodos))), desde, hasta, grupos if por_hotel else None, por_hotel
+            )
+
+    filas_por_grupo = {}
+    for fila in filas:
+        filas_por_grupo.setdefault((fila['grupo'], fila['periodo']), [])
+        if fila['sin_canal'] is not None:
+            filas_por_grupo[(fila['grupo'], fila['periodo'])].append(fila)
+
+    resultados = []
+    for grupo in grupos:
+        base = None
+        for i, (inicio, fin, etiqueta) in enumerate(periodos):
+            analytics = construir_analytics(filas_por_grupo.get((grupo, i), []), inicio, fin, grupo)
+            resultados.append(HotelAnalyticsPeriodo(
+                etiqueta=etiqueta,
+                analytics=analytics,
+                variacion=calcular_variacion(analytics, base) if base else None
+            ))
+            base = base or analytics
+    return resultados
+
+
+async def calcular_kpis_lote_cacheado(
+    periodos: List[tuple],
+    hotel_ids_erp: Optional[List[int]] = None
+) -> List[HotelAnalyticsPeriodo]:
+    """calcular_kpis_lote a través del cache de resultados versionado por ETL y del control de admisión"""
+    periodos = [tuple(p) for p in periodos]
+    version = await obtener_version_datos()
+    clave = ('hotel_analytics_lote', version, tuple(periodos),
+             tuple(hotel_ids_erp) if hotel_ids_erp is not None else None)
+    costo = await estimar_costo(sum((ff - fi).days + 1 for fi, ff, _ in periodos), hotel_ids_erp)
+    return await cache_kpis.obtener(
+        clave, lambda: ejecutar(costo, lambda: calcular_kpis_lote(periodos, hotel_ids_erp)))
+
+
+def inicio_punto(fecha: date, granularidad: Granularidad) -> date:
+    """Primer día del punto de la serie que contiene la fecha (igual que date_trunc)"""
+    if granularidad == Granularidad.SEMANA:
+        return fecha - timedelta(days=fecha.weekday())
+    if granularidad == Granularidad.MES:
+        return fecha.replace(day=1)
+    return fecha
+
+
+def siguiente_punto(inicio: date, granularidad: Granularidad) -> date:
+    """Primer día del punto siguiente de la serie"""
+    if granularidad == Granularidad.SEMANA:
+        return inicio + timedelta(days=7)
+    if granularidad == Granularidad.MES:
+        return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio + timedelta(days=1)
+
+
+async def calcular_serie_kpis(
+    fecha_inicio: date,
+    fecha_fin: date,
+    granularidad: Granularidad,
+    hotel_id_erp: Optional[int] = None
+) -> SerieKPIs:
+    """
+    Serie de KPIs entre dos fechas con una sola consulta al DWH.
+
+    Devuelve todos los puntos del rango, también los que no tienen ventas.
+    El primer y el último punto se recortan al rango pedido, y las noches
+    disponibles de cada punto son las de sus días dentro del rango.
+    """
+    filas = await _consultar_periodo(SERIE_QUERIES, 'serie', fecha_inicio, fecha_fin, hotel_id_erp, granularidad)
+
+    total_habitaciones = filas[0]['total_habitaciones'] or 0
+    por_punto = {f['periodo']: f for f in filas if f['periodo'] is not None}
+
+    puntos = []
+    inicio = inicio_punto(fecha_inicio, granularidad)
+    while inicio <= fecha_fin:
+        siguiente = siguiente_punto(inicio, granularidad)
+        desde = max(inicio, fecha_inicio)
+        hasta = min(siguiente - timedelta(days=1), fecha_fin)
+        fila = por_punto.get(inicio)
+
+        noches_disponibles = total_habitaciones * ((hasta - desde).days + 1)
+        noches_vendidas = (fila['noches_vendidas'] or 0) if fila else 0
+        ingresos = round(float(fila['ingresos'] or 0), 2) if fila else 0.0
+
+        puntos.append(PuntoSerie(
+            fecha_inicio=desde,
+            fecha_fin=hasta,
+            total_reservas=(fila['cantidad'] or 0) if fila else 0,
+            total_noches_vendidas=noches_vendidas,
+            total_noches_disponibles=noches_disponibles,
+            ingresos_totales_habitaciones=ingresos,
+            tasa_ocupacion=round(noches_vendidas / noches_disponibles * 100, 2) if noches_disponibles > 0 else 0,
+            adr=round(ingresos / noches_vendidas, 2) if noches_vendidas > 0 else 0,
+            revpar=round(ingresos / noches_disponibles, 2) if noches_disponibles > 0 else 0
+        ))
+        inicio = siguiente
+
+    return SerieKPIs(
+        hotel_id_erp=hotel_id_erp,
+        hotel_nombre=filas[0]['hotel_nombre'] if hotel_id_erp else None,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        granularidad=granularidad,
+        puntos=puntos
+    )
+
+
+async def calcular_serie_kpis_cacheado(
+    fecha_inicio: date,
+    fecha_fin: date,
+    granularidad: Granularidad,
+    hotel_id_erp: Optional[int] = None
+) -> SerieKPIs:
+    """calcular_serie_kpis a través del cache de resultados versionado por ETL y del control de admisión"""
+    return await calcular_periodo_cacheado(
+        f'hotel_analytics_serie_{granularidad.value}',
+        lambda inicio, fin, hotel: calcular_serie_kpis(inicio, fin, granularidad, hotel),
+        fecha_inicio, fecha_fin, hotel_id_erp
+    )
+
+
+async def _consultar_periodo(queries: Dict, nombre: str, fecha_inicio: date, fecha_fin: date,
+                            hotel_id_erp: Optional[int], *variante) -> List:
+    """
+    Ejecuta una de las consultas por (por_tiempo_id, con_hotel, *variante)
+    sobre el periodo y el hotel
+    """
+    por_tiempo_id, params = await parametros_periodo(fecha_inicio, fecha_fin, hotel_id_erp)
+    async with get_connection(lectura=True) as conn:
+        with medir(SQL_CONSULTA_SEGUNDOS, nombre):
+            return await conn.fetch(queries[(por_tiempo_id, bool(hotel_id_erp), *variante)], *params)
+
+
+async def calcular_mix_pagos(
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None
+) -> MixPagos:
+    """
+    Mix de medios de pago de los pagos hechos en el periodo. Los montos y
+    porcentajes son de los pagos completados; los pendientes y fallidos se
+    informan aparte.
+    """
+    filas = await _consultar_periodo(PAGOS_QUERIES, 'pagos', fecha_inicio, fecha_fin, hotel_id_erp)
+    total = next(f for f in filas if f['sin_metodo'])
+    cobrado = round(float(total['cobrado'] or 0), 2)
+    
+    pagos_por_metodo = [
+        PagosPorMetodo(
+            metodo_pago=f['metodo_pago'],
+            cantidad_pagos=f['pagos'],
+            monto_cobrado=round(float(f['cobrado'] or 0), 2),
+            monto_pendiente=round(float(f['pendiente'] or 0), 2),
+            pagos_fallidos=f['fallidos'],
+            porcentaje_monto=round(float(f['cobrado'] or 0) / cobrado * 100, 2) if cobrado > 0 else 0
+        )
+        for f in sorted((f for f in filas if not f['sin_metodo']), key=lambda f: -(f['cobrado'] or 0))
+    ]
+    
+    return MixPagos(
+        hotel_id_erp=hotel_id_erp,
+        hotel_nombre=total['hotel_nombre'] if hotel_id_erp else None,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        cantidad_pagos=total['pagos'],
+        monto_cobrado=cobrado,
+        monto_pendiente=round(float(total['pendiente'] or 0), 2),
+        pagos_fallidos=total['fallidos'],
+        pagos_por_metodo=pagos_por_metodo
+    )
+
+
+async def calcular_ingresos_adicionales(
+    fecha_inicio: date,
+    fecha_fin: date,
+    hotel_id_erp: Optional[int] = None
+) -> IngresosAdicionales:
+    """
+    Ingresos por servicios adicionales consumidos en el periodo, por servicio
+    y comparados con los ingresos de habitación y las noches vendidas del
+    mismo periodo. Los servicios con el mismo nombre en distintos hoteles se
+    suman juntos.
+    """
+    filas = await _consultar_periodo(SERVICIOS_QUERIES, 'servicios', fecha_inicio, fecha_fin, hotel_id_erp)
+    total = next(f for f in filas if f['sin_servicio'])
+    ingresos = round(float(total['ingresos'] or 0), 2)
+    ingresos_habitaciones = round(float(total['ingresos_habitacion'] or 0), 2)
+    noches_vendidas = total['noches_vendidas'] or 0
+    
+    consumos_por_servicio = [
+        ConsumosPorServicio(
+            nombre_servicio=f['nombre_servicio'],
+            cantidad_consumos=f['consumos'],
+            unidades=f['unidades'] or 0,
+            ingresos=round(float(f['ingresos'] or 0), 2),
+            porcentaje=round(float(f['ingresos'] or 0) / ingresos * 100, 2) if ingresos > 0 else 0
+        )
+        for f in sorted((f for f in filas if not f['sin_servicio']), key=lambda f: -(f['ingresos'] or 0))
+    ]
+    
+    return IngresosAdicionales(
+        hotel_id_erp=hotel_id_erp,
+        hotel_nombre=total['hotel_nombre'] if hotel_id_erp else None,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        ingresos_adicionales=ingresos,
+        ingresos_totales_habitaciones=ingresos_habitaciones,
+        porcentaje_sobre_habitaciones=round(ingresos / ingresos_habitaciones * 100, 2) if ingresos_habitaciones > 0 else 0,
+        ingreso_adicional_por_noche=round(ingresos / noches_vendidas, 2) if noches_vendidas > 0 else 0,
+        consumos_por_servicio=consumos_por_servicio
+    )
+
+
+async def calcular_periodo_cacheado(tipo: str, calcular, fecha_inicio: date, fecha_fin: date,
+                                    hotel_id_erp: Optional[int] = None, admision: bool = True):
+    """
+    calcular(fecha_inicio, fecha_fin, hotel_id_erp) a través del cache de
+    resultados y, si admision, del control de admisión
+    """
+    hotel_id_erp = hotel_id_erp or None
+    version = await obtener_version_datos()
+    clave = (tipo, version, fecha_inicio, fecha_fin, hotel_id_erp)
+    if not admision:
+        return await cache_kpis.obtener(clave, lambda: calcular(fecha_inicio, fecha_fin, hotel_id_erp))
+    costo = await estimar_costo((fecha_fin - fecha_inicio).days + 1, [hotel_id_erp] if hotel_id_erp else None)
+    return await cache_kpis.obtener(
+        clave, lambda: ejecutar(costo, lambda: calcular(fecha_inicio, fecha_fin, hotel_id_erp)))
 
 
 @strawberry.type
@@ -199,6 +872,7 @@ class Query:
     @strawberry.field
     async def hotel_analytics(
         self,
+        info: strawberry.Info,
         fecha_inicio: date,
         fecha_fin: date,
         hotel_id_erp: Optional[int] = None
@@ -214,8 +888,186 @@ class Query:
         Returns:
             HotelAnalytics con KPIs calculados
         """
-        return await calcular_kpis(fecha_inicio, fecha_fin, hotel_id_erp)
+        return await con_plazo(
+            info.context["request"],
+            lambda: calcular_kpis_cacheado(fecha_inicio, fecha_fin, hotel_id_erp)
+        )
+
+    @strawberry.field
+    async def hotel_analytics_lote(
+        self,
+        info: strawberry.Info,
+        periodos: List[PeriodoInput],
+        hotel_ids_erp: Optional[List[int]] = None
+    ) -> List[HotelAnalyticsPeriodo]:
+        """
+        Analytics de varios hoteles y periodos en una sola consulta.
+
+        Args:
+            periodos: Periodos a comparar; el primero es la base de las variaciones
+            hotel_ids_erp: IDs de hoteles en el ERP (opcional, si no se especifica
+                devuelve el total de todos los hoteles por periodo)
+
+        Returns:
+            Un HotelAnalyticsPeriodo por hotel y periodo, ordenados por hotel y periodo
+        """
+        return await con_plazo(info.context["request"], lambda: calcular_kpis_lote_cacheado(
+            [(p.fecha_inicio, p.fecha_fin, p.etiqueta) for p in periodos],
+            hotel_ids_erp
+        ))
+
+    @strawberry.field
+    async def hotel_analytics_serie(
+        self,
+        info: strawberry.Info,
+        fecha_inicio: date,
+        fecha_fin: date,
+        granularidad: Granularidad = Granularidad.DIA,
+        hotel_id_erp: Optional[int] = None
+    ) -> SerieKPIs:
+        """
+        Serie temporal de ocupación, ADR y RevPAR.
+
+        Args:
+            fecha_inicio: Fecha de inicio del periodo (inclusive)
+            fecha_fin: Fecha de fin del periodo (inclusive)
+            granularidad: Día, semana o mes por punto de la serie
+            hotel_id_erp: ID del hotel en el ERP (opcional, si no se especifica analiza todos)
+
+        Returns:
+            SerieKPIs con un punto por día, semana o mes del periodo
+        """
+        return await con_plazo(
+            info.context["request"],
+            lambda: calcular_serie_kpis_cacheado(fecha_inicio, fecha_fin, granularidad, hotel_id_erp)
+        )
+
+    @strawberry.field
+    async def hotel_analytics_pagos(
+        self,
+        info: strawberry.Info,
+        fecha_inicio: date,
+        fecha_fin: date,
+        hotel_id_erp: Optional[int] = None
+    ) -> MixPagos:
+        """
+        Mix de medios de pago por fecha de pago.
+
+        Args:
+            fecha_inicio: Fecha de inicio del periodo (inclusive)
+            fecha_fin: Fecha de fin del periodo (inclusive)
+            hotel_id_erp: ID del hotel en el ERP (opcional, si no se especifica analiza todos)
+
+        Returns:
+            MixPagos con el total cobrado y el desglose por medio de pago
+        """
+        return await con_plazo(info.context["request"], lambda: calcular_periodo_cacheado(
+            'hotel_analytics_pagos', calcular_mix_pagos, fecha_inicio, fecha_fin, hotel_id_erp))
+
+    @strawberry.field
+    async def hotel_analytics_servicios(
+        self,
+        info: strawberry.Info,
+        fecha_inicio: date,
+        fecha_fin: date,
+        hotel_id_erp: Optional[int] = None
+    ) -> IngresosAdicionales:
+        """
+        Ingresos por servicios adicionales (ancillary revenue) por fecha de consumo.
+
+        Args:
+            fecha_inicio: Fecha de inicio del periodo (inclusive)
+            fecha_fin: Fecha de fin del periodo (inclusive)
+            hotel_id_erp: ID del hotel en el ERP (opcional, si no se especifica analiza todos)
+
+        Returns:
+            IngresosAdicionales con el total, su relación con los ingresos de
+            habitación y el desglose por servicio
+        """
+        return await con_plazo(info.context["request"], lambda: calcular_periodo_cacheado(
+            'hotel_analytics_servicios', calcular_ingresos_adicionales, fecha_inicio, fecha_fin, hotel_id_erp))
+
+
+@strawberry.type
+class Subscription:
+    """
+    Las mismas vistas que Query, enviadas por WebSocket al suscribirse y otra
+    vez cada vez que el ETL publica datos nuevos del hotel (o de cualquier
+    hotel si no se indica hotel_id_erp). Los tableros que miran la misma
+    vista comparten un único recálculo.
+    """
+
+    @strawberry.subscription
+    async def hotel_analytics(
+        self,
+        fecha_inicio: date,
+        fecha_fin: date,
+        hotel_id_erp: Optional[int] = None
+    ) -> AsyncGenerator[HotelAnalytics, None]:
+        """hotelAnalytics actualizado tras cada ETL que cambie el hotel"""
+        hotel_id_erp = hotel_id_erp or None
+        async for resultado in difusor.suscribir(
+                ('hotel_analytics', fecha_inicio, fecha_fin, hotel_id_erp), hotel_id_erp,
+                lambda: calcular_kpis_cacheado(fecha_inicio, fecha_fin, hotel_id_erp)):
+            yield resultado
+
+    @strawberry.subscription
+    async def hotel_analytics_serie(
+        self,
+        fecha_inicio: date,
+        fecha_fin: date,
+        granularidad: Granularidad = Granularidad.DIA,
+        hotel_id_erp: Optional[int] = None
+    ) -> AsyncGenerator[SerieKPIs, None]:
+        """hotelAnalyticsSerie actualizada tras cada ETL que cambie el hotel"""
+        hotel_id_erp = hotel_id_erp or None
+        async for resultado in difusor.suscribir(
+                ('hotel_analytics_serie', fecha_inicio, fecha_fin, granularidad, hotel_id_erp), hotel_id_erp,
+                lambda: calcular_serie_kpis_cacheado(fecha_inicio, fecha_fin, granularidad, hotel_id_erp)):
+            yield resultado
+
+    @strawberry.subscription
+    async def hotel_analytics_pagos(
+        self,
+        fecha_inicio: date,
+        fecha_fin: date,
+        hotel_id_erp: Optional[int] = None
+    ) -> AsyncGenerator[MixPagos, None]:
+        """hotelAnalyticsPagos actualizado tras cada ETL que cambie el hotel"""
+        hotel_id_erp = hotel_id_erp or None
+        async for resultado in difusor.suscribir(
+                ('hotel_analytics_pagos', fecha_inicio, fecha_fin, hotel_id_erp), hotel_id_erp,
+                lambda: calcular_periodo_cacheado(
+                    'hotel_analytics_pagos', calcular_mix_pagos, fecha_inicio, fecha_fin, hotel_id_erp)):
+            yield resultado
+
+    @strawberry.subscription
+    async def hotel_analytics_servicios(
+        self,
+        fecha_inicio: date,
+        fecha_fin: date,
+        hotel_id_erp: Optional[int] = None
+    ) -> AsyncGenerator[IngresosAdicionales, None]:
+        """hotelAnalyticsServicios actualizado tras cada ETL que cambie el hotel"""
+        hotel_id_erp = hotel_id_erp or None
+        async for resultado in difusor.suscribir(
+                ('hotel_analytics_servicios', fecha_inicio, fecha_fin, hotel_id_erp), hotel_id_erp,
+                lambda: calcular_periodo_cacheado(
+                    'hotel_analytics_servicios', calcular_ingresos_adicionales, fecha_inicio, fecha_fin, hotel_id_erp)):
+            yield resultado
+
 
+# Documentos parseados y validados que se reutilizan (los tableros repiten los mismos)
+DOCUMENTOS_CACHEADOS = int(os.getenv("APQ_MAX_CONSULTAS", "500"))
 
 # Usar schema con soporte de Apollo Federation
-schema = strawberry.federation.Schema(query=Query, enable_federation_2=True)
+schema = strawberry.federation.Schema(
+    query=Query,
+    subscription=Subscription,
+    enable_federation_2=True,
+    extensions=[
+        MetricasGraphQL,
+        ParserCache(maxsize=DOCUMENTOS_CACHEADOS),
+        ValidationCache(maxsize=DOCUMENTOS_CACHEADOS),
+    ]
+)
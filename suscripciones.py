@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+import asyncpg
+from database import conectar_primario
+from cache import VERSION_QUERY, fijar_version_datos
+from metricas import SUSCRIPCIONES_RECALCULOS
+
+# Canal de NOTIFY en el que el ETL avisa cada versión publicada (mismo valor que en etl.py)
+CANAL_DATOS = os.getenv("DWH_CANAL_DATOS", "bi_datos_actualizados")
+# Espera antes de volver a abrir la conexión LISTEN si se cae
+SUSCRIPCIONES_REINTENTO_SEGUNDOS = float(os.getenv("SUSCRIPCIONES_REINTENTO_SEGUNDOS", "5"))
+# Vistas que se recalculan a la vez tras un aviso (cada una además pasa por el control de admisión)
+SUSCRIPCIONES_RECALCULOS_SIMULTANEOS = int(os.getenv("SUSCRIPCIONES_RECALCULOS_SIMULTANEOS", "4"))
+
+
+class Vista:
+    """
+    Una combinación de campo y argumentos suscrita: se recalcula una vez por
+    aviso y el resultado se reparte a todas sus suscripciones.
+    """
+
+    def __init__(self, hotel_id_erp: Optional[int], calcular: Callable[[], Awaitable[Any]]):
+        self.hotel_id_erp = hotel_id_erp
+        self.calcular = calcular
+        # Una cola de un elemento por suscripción: un tablero lento recibe solo el último resultado
+        self.colas: Set[asyncio.Queue] = set()
+
+    def afectada(self, hoteles: Optional[Set[int]]) -> bool:
+        """hoteles None = el aviso no los lista y vale para todos; vacío = no cambió nada"""
+        if hoteles is None:
+            return True
+        return bool(hoteles) and (self.hotel_id_erp is None or self.hotel_id_erp in hoteles)
+
+    def repartir(self, resultado: Any):
+        for cola in self.colas:
+            if cola.full():
+                cola.get_nowait()
+            cola.put_nowait(resultado)
+
+
+class Difusor:
+    """
+    Suscripciones GraphQL alimentadas por los avisos del ETL.
+
+    Una sola conexión al primario hace LISTEN en CANAL_DATOS. Cada aviso
+    trae la versión publicada y los hoteles que cambiaron; solo se recalculan
+    las vistas de esos hoteles (y las de todos los hoteles), una vez por
+    vista, a través del cache de resultados y del control de admisión. Si
+    llegan varios avisos durante un recálculo se juntan en uno.
+    """
+
+    def __init__(self):
+        self._vistas: Dict[Hashable, Vista] = {}
+        self._version: Optional[int] = None
+        self._pendiente: Optional[Dict[str, Any]] = None
+        self._hay_aviso = asyncio.Event()
+        self._tareas: List[asyncio.Task] = []
+        self.avisos = 0
+
+    async def iniciar(self):
+        self._tareas = [asyncio.create_task(self._escuchar()), asyncio.create_task(self._difundir())]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    async def suscribir(self, clave: Hashable, hotel_id_erp: Optional[int],
+                        calcular: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+        """
+        Resultado actual de la vista y después uno nuevo por cada aviso que
+        la afecte. La cola se registra antes del primer cálculo para no
+        perder un aviso que llegue mientras tanto.
+        """
+        vista = self._vistas.get(clave)
+        if vista is None:
+            vista = self._vistas[clave] = Vista(hotel_id_erp, calcular)
+        cola: asyncio.Queue = asyncio.Queue(maxsize=1)
+        vista.colas.add(cola)
+        try:
+            yield await vista.calcular()
+            while True:
+                yield await cola.get()
+        finally:
+            vista.colas.discard(cola)
+            if not vista.colas and self._vistas.get(clave) is vista:
+                del self._vistas[clave]
+
+    def _avisar(self, version: int, hoteles: Optional[Set[int]]):
+        """Junta el aviso con el pendiente, si lo hay, y despierta a _difundir"""
+        if self._pendiente is not None:
+            anteriores = self._pendiente['hoteles']
+            hoteles = None if hoteles is None or anteriores is None else anteriores | hoteles
+            version = max(version, self._pendiente['version'])
+        self._pendiente = {'version': version, 'hoteles': hoteles}
+        self._hay_aviso.set()
+
+    def _al_notificar(self, conn, pid, canal, payload: str):
+        try:
+            aviso = json.loads(payload)
+            version = int(aviso['version'])
+            hoteles = None if aviso.get('hoteles') is None else {int(h) for h in aviso['hoteles']}
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠ Aviso de datos ilegible en {canal}: {e}")
+            return
+        self.avisos += 1
+        self._avisar(version, hoteles)
+
+    async def _escuchar(self):
+        """Mantiene abierta la conexión LISTEN; al reconectar recupera un aviso perdido mirando la versión"""
+        while True:
+            conn = None
+            try:
+                conn = await conectar_primario()
+                cerrada = asyncio.Event()
+                conn.add_termination_listener(lambda c: cerrada.set())
+                await conn.add_listener(CANAL_DATOS, self._al_notificar)
+                version = await conn.fetchval(VERSION_QUERY) or 0
+                if self._version is not None and version > self._version:
+                    # Hubo un ETL mientras no se escuchaba: no se sabe qué hoteles tocó
+                    self._avisar(version, None)
+                elif self._version is None:
+                    self._version = version
+                print(f"✓ Escuchando avisos del ETL en {CANAL_DATOS} (versión de datos {version})")
+                await cerrada.wait()
+                print("⚠ Se cerró la conexión de avisos del ETL")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"⚠ No se pudo escuchar avisos del ETL: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(SUSCRIPCIONES_REINTENTO_SEGUNDOS)
+
+    async def _difundir(self):
+        while True:
+            await self._hay_aviso.wait()
+            self._hay_aviso.clear()
+            aviso, self._pendiente = self._pendiente, None
+            if self._version is not None and aviso['version'] <= self._version:
+                continue
+            self._version = aviso['version']
+            fijar_version_datos(aviso['version'])
+            await self._recalcular(aviso['hoteles'])
+
+    async def _recalcular(self, hoteles: Optional[Set[int]]):
+        vistas = list(self._vistas.values())
+        afectadas = [v for v in vistas if v.afectada(hoteles)]
+        SUSCRIPCIONES_RECALCULOS.inc("omitida", cantidad=len(vistas) - len(afectadas))
+        semaforo = asyncio.Semaphore(SUSCRIPCIONES_RECALCULOS_SIMULTANEOS)
+
+        async def recalcular(vista: Vista):
+            async with semaforo:
+                try:
+                    resultado = await vista.calcular()
+                except Exception as e:
+                    # Los tableros conservan el último resultado hasta el próximo aviso
+                    print(f"⚠ No se pudo recalcular una vista suscrita: {e}")
+                    SUSCRIPCIONES_RECALCULOS.inc("error")
+                    return
+            vista.repartir(resultado)
+            SUSCRIPCIONES_RECALCULOS.inc("recalculada")
+
+        await asyncio.gather(*(recalcular(v) for v in afectadas))
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "vistas": len(self._vistas),
+            "suscripciones": sum(len(v.colas) for v in self._vistas.values()),
+            "avisos": self.avisos,
+            "version_datos": self._version or 0,
+        }
+
+
+difusor = Difusor()
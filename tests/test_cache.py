@@ -0,0 +1,87 @@
+import asyncio
+from cache import CacheResultados
+
+
+def test_fallos_concurrentes_comparten_un_calculo():
+    async def escenario():
+        cache = CacheResultados()
+        liberar = asyncio.Event()
+        llamadas = 0
+
+        async def calcular():
+            nonlocal llamadas
+            llamadas += 1
+            await liberar.wait()
+            return "resultado"
+
+        esperas = [asyncio.create_task(cache.obtener("clave", calcular)) for _ in range(5)]
+        await asyncio.sleep(0)
+        liberar.set()
+        resultados = await asyncio.gather(*esperas)
+
+        assert resultados == ["resultado"] * 5
+        assert llamadas == 1
+        assert (cache.fallos, cache.coalescidas) == (1, 4)
+        assert await cache.obtener("clave", calcular) == "resultado"
+        assert cache.aciertos == 1
+        assert cache.estadisticas()["en_vuelo"] == 0
+
+    asyncio.run(escenario())
+
+
+def test_abandonar_un_cliente_no_cancela_el_calculo_compartido():
+    async def escenario():
+        cache = CacheResultados()
+        liberar = asyncio.Event()
+
+        async def calcular():
+            await liberar.wait()
+            return 42
+
+        primero = asyncio.create_task(cache.obtener("clave", calcular))
+        segundo = asyncio.create_task(cache.obtener("clave", calcular))
+        await asyncio.sleep(0)
+        primero.cancel()
+        await asyncio.sleep(0)
+        liberar.set()
+
+        assert await segundo == 42
+        assert primero.cancelled()
+        assert cache.estadisticas()["entradas"] == 1
+
+    asyncio.run(escenario())
+
+
+def test_el_ultimo_cliente_en_irse_cancela_el_calculo():
+    async def escenario():
+        cache = CacheResultados()
+        cancelado = asyncio.Event()
+        llamadas = 0
+
+        async def calcular():
+            nonlocal llamadas
+            llamadas += 1
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelado.set()
+                raise
+
+        esperas = [asyncio.create_task(cache.obtener("clave", calcular)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for espera in esperas:
+            espera.cancel()
+        await asyncio.gather(*esperas, return_exceptions=True)
+        await asyncio.wait_for(cancelado.wait(), 1)
+
+        estadisticas = cache.estadisticas()
+        assert (estadisticas["en_vuelo"], estadisticas["entradas"]) == (0, 0)
+
+        # Una petición nueva calcula de nuevo en lugar de esperar el cálculo cancelado
+        async def calcular_otra_vez():
+            return "nuevo"
+
+        assert await cache.obtener("clave", calcular_otra_vez) == "nuevo"
+        assert llamadas == 1
+
+    asyncio.run(escenario())
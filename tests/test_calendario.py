@@ -0,0 +1,50 @@
+from array import array
+from datetime import date, timedelta
+from calendario import Calendario
+
+
+def calendario(fechas, ids):
+    return Calendario(array('l', (f.toordinal() for f in fechas)), array('q', ids), version=1)
+
+
+ENERO = [date(2024, 1, 1) + timedelta(days=i) for i in range(31)]
+
+
+def test_rango_ids_calendario_contiguo():
+    cal = calendario(ENERO, range(100, 131))
+    assert cal.contiguo
+    assert cal.rango_ids(date(2024, 1, 5), date(2024, 1, 10)) == (104, 109)
+    # Los extremos fuera del calendario se recortan a las fechas que tiene
+    assert cal.rango_ids(date(2023, 12, 1), date(2024, 1, 2)) == (100, 101)
+    assert cal.rango_ids(date(2024, 1, 30), date(2024, 3, 1)) == (129, 130)
+
+
+def test_rango_ids_vacio():
+    cal = calendario(ENERO, range(100, 131))
+    assert cal.rango_ids(date(2024, 2, 1), date(2024, 2, 10)) == (1, 0)
+    assert cal.rango_ids(date(2023, 1, 1), date(2023, 12, 31)) == (1, 0)
+    # fecha_fin anterior a fecha_inicio
+    assert cal.rango_ids(date(2024, 1, 10), date(2024, 1, 5)) == (1, 0)
+
+
+def test_rango_ids_calendario_vacio():
+    cal = calendario([], [])
+    assert cal.rango_ids(date(2024, 1, 1), date(2024, 1, 31)) == (1, 0)
+
+
+def test_rango_ids_con_huecos_en_las_fechas():
+    # Falta el 2024-01-15: un rango de tiempo_id lo saltaría sin avisar
+    fechas = [f for f in ENERO if f != date(2024, 1, 15)]
+    cal = calendario(fechas, range(100, 130))
+    assert not cal.contiguo
+    assert cal.rango_ids(date(2024, 1, 1), date(2024, 1, 31)) is None
+
+
+def test_rango_ids_con_ids_desordenados():
+    ids = list(range(100, 131))
+    ids[3], ids[4] = ids[4], ids[3]
+    cal = calendario(ENERO, ids)
+    assert not cal.contiguo
+    assert cal.rango_ids(date(2024, 1, 1), date(2024, 1, 2)) is None
+    assert cal.tiempo_id(date(2024, 1, 4)) == 104
+    assert cal.fecha(103) == date(2024, 1, 5)
@@ -0,0 +1,170 @@
+import random
+import sqlite3
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import pytest
+from columnar import COLUMNAS, ESTADOS_OCUPACION, OcupacionColumnar
+from schema import construir_analytics
+
+HOTELES = [
+    {"hotel_key": 1, "hotel_id_erp": 10, "nombre": "Hotel Centro", "numero_habitaciones_total": 40},
+    {"hotel_key": 2, "hotel_id_erp": 20, "nombre": "Hotel Aeropuerto", "numero_habitaciones_total": 25},
+    {"hotel_key": 3, "hotel_id_erp": 30, "nombre": "Hotel Playa", "numero_habitaciones_total": None},
+]
+# Dos canal_key con el mismo nombre: el desglose los junta, igual que GROUP BY canal_nombre
+CANALES = [
+    {"canal_key": 1, "canal_nombre": "Directo"},
+    {"canal_key": 2, "canal_nombre": "Booking"},
+    {"canal_key": 3, "canal_nombre": "Expedia"},
+    {"canal_key": 4, "canal_nombre": "Directo"},
+]
+ESTADOS = ESTADOS_OCUPACION + ["cancelada", "no_show"]
+DESDE = date(2024, 1, 1)
+
+# Referencia en SQL con la misma forma que KPIS_QUERIES (por fecha). SQLite
+# no tiene GROUPING SETS: el total, los canales y los estados van en un
+# UNION ALL. Los ingresos se guardan en diezmilésimas para sumarlos exactos.
+KPIS_SQL = """
+    WITH ocupacion_periodo AS (
+        SELECT o.*, dh.hotel_id_erp, dh.nombre AS hotel_nombre, dc.canal_nombre
+        FROM Fact_OcupacionDiaria o
+        JOIN Dim_Hotel dh ON o.hotel_key = dh.hotel_key
+        JOIN Dim_Canal dc ON o.canal_key = dc.canal_key
+        JOIN Dim_Tiempo dt ON o.tiempo_id = dt.tiempo_id
+        WHERE dt.fecha BETWEEN :desde AND :hasta
+          AND o.estado_reserva IN ('confirmada', 'checkin', 'checkout')
+          AND (:hotel IS NULL OR dh.hotel_id_erp = :hotel)
+    ),
+    habitaciones AS (
+        SELECT SUM(numero_habitaciones_total) AS total_habitaciones
+        FROM Dim_Hotel
+        WHERE :hotel IS NULL OR hotel_id_erp = :hotel
+    ),
+    grupos AS (
+        SELECT 1 AS sin_canal, 1 AS sin_estado, NULL AS canal_nombre, NULL AS estado_reserva, *
+        FROM ocupacion_periodo
+        UNION ALL
+        SELECT 0, 1, canal_nombre, NULL, * FROM ocupacion_periodo
+        UNION ALL
+        SELECT 1, 0, NULL, estado_reserva, * FROM ocupacion_periodo
+    )
+    SELECT sin_canal, sin_estado, canal_nombre, estado_reserva,
+           SUM(reservas_llegadas) AS cantidad,
+           SUM(noches_vendidas) AS noches_vendidas,
+           SUM(ingresos_habitacion) AS ingresos,
+           MAX(hotel_id_erp) AS hotel_id,
+           MAX(hotel_nombre) AS hotel_nombre,
+           (SELECT total_habitaciones FROM habitaciones) AS total_habitaciones
+    FROM grupos
+    GROUP BY sin_canal, sin_estado, canal_nombre, estado_reserva
+    UNION ALL
+    -- GROUPING SETS (()) devuelve el total aunque no haya filas
+    SELECT 1, 1, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+           (SELECT total_habitaciones FROM habitaciones)
+    WHERE NOT EXISTS (SELECT 1 FROM ocupacion_periodo)
+"""
+
+
+def generar_ocupacion(semilla: int = 7, dias: int = 90, filas: int = 3000):
+    """Filas al azar de Fact_OcupacionDiaria, únicas por (hotel, día, canal, estado)"""
+    azar = random.Random(semilla)
+    claves = set()
+    while len(claves) < filas:
+        claves.add((azar.choice(HOTELES)["hotel_key"], azar.randrange(dias),
+                    azar.choice(CANALES)["canal_key"], azar.choice(ESTADOS)))
+    return [(hotel_key, dia, canal_key, estado, azar.randint(1, 30),
+             azar.randint(0, 50_000_000), azar.randint(0, 6))
+            for hotel_key, dia, canal_key, estado in sorted(claves)]
+
+
+@pytest.fixture(scope="module")
+def motores():
+    ocupacion = generar_ocupacion()
+
+    dwh = sqlite3.connect(":memory:")
+    dwh.row_factory = sqlite3.Row
+    dwh.execute("CREATE TABLE Dim_Tiempo (tiempo_id INTEGER PRIMARY KEY, fecha TEXT)")
+    dwh.execute("CREATE TABLE Dim_Hotel (hotel_key INTEGER PRIMARY KEY, hotel_id_erp INTEGER, nombre TEXT, "
+                "numero_habitaciones_total INTEGER)")
+    dwh.execute("CREATE TABLE Dim_Canal (canal_key INTEGER PRIMARY KEY, canal_nombre TEXT)")
+    dwh.execute("CREATE TABLE Fact_OcupacionDiaria (hotel_key INTEGER, tiempo_id INTEGER, canal_key INTEGER, "
+                "estado_reserva TEXT, noches_vendidas INTEGER, ingresos_habitacion INTEGER, "
+                "reservas_llegadas INTEGER)")
+    # tiempo_id sin relación con la fecha: la referencia filtra por fecha
+    dwh.executemany("INSERT INTO Dim_Tiempo VALUES (?, ?)",
+                    [(1000 - dia, (DESDE + timedelta(days=dia)).isoformat()) for dia in range(120)])
+    dwh.executemany("INSERT INTO Dim_Hotel VALUES (:hotel_key, :hotel_id_erp, :nombre, :numero_habitaciones_total)",
+                    HOTELES)
+    dwh.executemany("INSERT INTO Dim_Canal VALUES (:canal_key, :canal_nombre)", CANALES)
+    dwh.executemany("INSERT INTO Fact_OcupacionDiaria VALUES (?, 1000 - ?, ?, ?, ?, ?, ?)", ocupacion)
+
+    # Lo mismo que deja cargar_ocupacion: solo estados de ocupación y hoteles por nombre
+    en_memoria = [f for f in ocupacion if f[3] in ESTADOS_OCUPACION]
+    valores = {
+        "fecha": [(DESDE + timedelta(days=f[1])).toordinal() for f in en_memoria],
+        "hotel_key": [f[0] for f in en_memoria],
+        "canal_key": [f[2] for f in en_memoria],
+        "estado": [ESTADOS_OCUPACION.index(f[3]) for f in en_memoria],
+        "noches": [f[4] for f in en_memoria],
+        "ingresos": [f[5] for f in en_memoria],
+        "llegadas": [f[6] for f in en_memoria],
+    }
+    columnas = {nombre: np.array(valores[nombre], dtype=tipo) for nombre, tipo in COLUMNAS.items()}
+    hoteles = sorted(HOTELES, key=lambda h: (h["nombre"], h["hotel_key"]))
+    yield dwh, OcupacionColumnar(columnas, hoteles, CANALES, version=1)
+    dwh.close()
+
+
+def filas_sql(dwh, fecha_inicio: date, fecha_fin: date, hotel_id_erp):
+    filas = []
+    for fila in dwh.execute(KPIS_SQL, {"desde": fecha_inicio.isoformat(), "hasta": fecha_fin.isoformat(),
+                                       "hotel": hotel_id_erp}):
+        fila = dict(fila)
+        if fila["ingresos"] is not None:
+            fila["ingresos"] = Decimal(fila["ingresos"]).scaleb(-4)
+        filas.append(fila)
+    return filas
+
+
+@pytest.mark.parametrize("fecha_inicio, fecha_fin", [
+    (date(2024, 1, 1), date(2024, 3, 30)),
+    (date(2024, 1, 15), date(2024, 1, 15)),
+    (date(2024, 2, 10), date(2024, 3, 5)),
+    (date(2023, 12, 1), date(2024, 1, 10)),
+    (date(2024, 3, 25), date(2024, 4, 30)),
+    (date(2024, 5, 1), date(2024, 5, 31)),
+])
+@pytest.mark.parametrize("hotel_id_erp", [None, 10, 20, 30, 99])
+def test_kpis_en_memoria_iguales_a_sql(motores, fecha_inicio, fecha_fin, hotel_id_erp):
+    dwh, ocupacion = motores
+    esperado = construir_analytics(filas_sql(dwh, fecha_inicio, fecha_fin, hotel_id_erp),
+                                   fecha_inicio, fecha_fin, hotel_id_erp)
+    obtenido = construir_analytics(ocupacion.filas_kpis(fecha_inicio, fecha_fin, hotel_id_erp),
+                                   fecha_inicio, fecha_fin, hotel_id_erp)
+    assert obtenido == esperado
+
+
+def test_filas_kpis_sumas_exactas(motores):
+    dwh, ocupacion = motores
+    fecha_inicio, fecha_fin = date(2024, 1, 1), date(2024, 3, 30)
+    clave = lambda f: (f["sin_canal"], f["sin_estado"], f["canal_nombre"] or "", f["estado_reserva"] or "")
+    sql = sorted(filas_sql(dwh, fecha_inicio, fecha_fin, None), key=clave)
+    memoria = sorted(ocupacion.filas_kpis(fecha_inicio, fecha_fin), key=clave)
+    assert memoria == sql
+
+
+def test_desglose_empatado_ordena_por_nombre():
+    comunes = {"hotel_id": 10, "hotel_nombre": "Hotel Centro", "total_habitaciones": 40,
+               "noches_vendidas": 4, "ingresos": Decimal("100")}
+    filas = [
+        {**comunes, "sin_canal": 1, "sin_estado": 1, "canal_nombre": None, "estado_reserva": None, "cantidad": 4},
+        {**comunes, "sin_canal": 0, "sin_estado": 1, "canal_nombre": "Expedia", "estado_reserva": None, "cantidad": 1},
+        {**comunes, "sin_canal": 0, "sin_estado": 1, "canal_nombre": "Booking", "estado_reserva": None, "cantidad": 1},
+        {**comunes, "sin_canal": 0, "sin_estado": 1, "canal_nombre": "Directo", "estado_reserva": None, "cantidad": 2},
+        {**comunes, "sin_canal": 1, "sin_estado": 0, "canal_nombre": None, "estado_reserva": "checkout", "cantidad": 2},
+        {**comunes, "sin_canal": 1, "sin_estado": 0, "canal_nombre": None, "estado_reserva": "checkin", "cantidad": 2},
+    ]
+    analytics = construir_analytics(filas, date(2024, 1, 1), date(2024, 1, 31), 10)
+    assert [c.canal_nombre for c in analytics.reservas_por_canal] == ["Directo", "Booking", "Expedia"]
+    assert [e.estado for e in analytics.reservas_por_estado] == ["checkin", "checkout"]